@@ -1,7 +1,7 @@
 import can
 import logging
 
-from can_conn import CANConn, decode_msg_from, encode_msg_to
+from can_conn import CANConn, benchmark_receiver, decode_msg_from, encode_msg_to
 from messaging import EventDrivenMessageProcessor
 from six import string_types
 
@@ -37,7 +37,9 @@ def connection_handler(autodetect=None, **kwargs):
     ret = {
         "is_open": conn.is_open(),
         "bus": dict(conn.bus_metadata, state=conn.bus_state()),
-        "interface": dict(conn.settings, state=conn.interface_state())
+        "interface": dict(conn.settings, state=conn.interface_state()),
+        "monitor": conn.monitor_stats(),
+        "receiver": conn.receiver_stats()
     }
 
     return ret
@@ -104,7 +106,7 @@ def monitor_handler(**kwargs):
     output = kwargs.pop("output", "str")
 
     res = []
-    conn.monitor_until(lambda msg: res.append(encode_msg_to(output, msg)), **kwargs)
+    conn.monitor_until(lambda frames: res.extend([encode_msg_to(output, f) for f in frames]), batch=True, **kwargs)
     ret["values"] = res
 
     return ret
@@ -138,6 +140,18 @@ def play_handler(*files, **kwargs):
     return ret
 
 
+@edmp.register_hook()
+def benchmark_handler(channel="vcan0", count=100000, rate=None, **kwargs):
+    """
+    Measures frames per second and CPU usage of the bulk receiver by replaying generated frames on a (virtual) CAN interface.
+    """
+
+    if channel == conn.channel and not kwargs.pop("force", False):
+        raise ValueError("Channel '{:}' is used by the current CAN connection - use a virtual CAN interface or specify 'force' to generate load anyway".format(channel))
+
+    return benchmark_receiver(channel=channel, count=count, rate=rate, **kwargs)
+
+
 @edmp.register_hook()
 def obd_query_handler(name, mode=None, pid=None, bytes=0, frames=None, strict=False, decoder=None, unit=None, **kwargs):
     """
@@ -50,9 +50,12 @@ def cache_handler(cmd, *args, **kwargs):
 
 
 @edmp.register_hook()
-def upload_handler():
+def upload_handler(window=1):
     """
     Uploads cached data to cloud.
+
+    Optional arguments:
+      - window (int): Maximum number of batches in flight at once. When greater than one, the next batch is read and compressed while preceding ones are being uploaded. When adaptive upload is enabled the actual number is controlled within this bound. Default value is '1'.
     """
 
     ret = {}
@@ -60,10 +63,20 @@ def upload_handler():
     ctx = context["upload"]
     try:
 
+        # Ensure cache budget is not exceeded before uploading
+        try:
+            res = cache.enforce_budget()
+            if res["total"] > 0:
+                ctx["evicted"] = ctx.get("evicted", 0) + res["total"]
+
+                edmp.trigger_event(res, "system/cloud/cache/evicted")
+        except Exception as ex:
+            log.exception("Failed to enforce cache budget")
+
         # Only try upload failed on first run - then only retry and pending
         if ctx["count"] == 0:
             try:
-                res = cache.upload_failing()
+                res = cache.upload_failing(window=window)
                 if res["total"] > 0:
                     log.info("Successfully uploaded {:} failed entries".format(res["total"]))
 
@@ -73,7 +86,7 @@ def upload_handler():
 
         # Always upload retrying if any
         try:
-            res = cache.upload_retrying()
+            res = cache.upload_retrying(window=window)
             if res["total"] > 0:
                 log.info("Successfully uploaded {:} retried entries".format(res["total"]))
 
@@ -90,10 +103,16 @@ def upload_handler():
             log.exception("Failed to upload retrying entries due to an unhandled exception - this must never happen")
 
         # Upload pending if any
-        ret["pending"] = cache.upload_pending()
+        ret["pending"] = cache.upload_pending(window=window)
 
     finally:
 
+        # Always persist at the end of an upload run
+        try:
+            cache.persist()
+        except:
+            log.exception("Failed to persist cache after upload")
+
         # TODO: Update this status for each batch upload!
         # Update context
         ctx["count"] += 1
@@ -110,7 +129,13 @@ def status_handler():
     Gets current status.
     """
 
-    return context
+    ret = context.copy()
+    ret["session"] = cache.session_status()
+    ret["persistence"] = cache.persistence_status()
+    if cache.controller != None:
+        ret["adaptive"] = cache.controller.status()
+
+    return ret
 
 
 @intercept_exit_signal
@@ -144,3 +169,10 @@ def start(**settings):
 
     finally:
         log.info("Stopping cloud manager")
+
+        cache.close_session()
+
+        try:
+            cache.persist()
+        except:
+            log.exception("Failed to persist cache on shutdown")
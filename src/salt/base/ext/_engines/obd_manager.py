@@ -2,10 +2,12 @@ from __future__ import division
 
 import battery_util
 import ConfigParser
+import cPickle as pickle
 import cProfile as profile
 import datetime
 import _strptime  # Attempt to avoid: Failed to import _strptime because the import lockis held by another thread
 import elm327_proxy
+import hashlib
 import io
 import json
 import logging
@@ -23,7 +25,7 @@ import time
 from collections import OrderedDict
 from common_util import abs_file_path, add_rotating_file_handler_to, factory_rendering, fromisoformat
 from obd.utils import OBDError
-from obd_conn import OBDConn, decode_can_frame_for, FILTER_TYPE_CAN_PASS, FILTER_TYPE_J1939_PGN
+from obd_conn import OBDConn, CANFrameDecoder, FILTER_TYPE_CAN_PASS, FILTER_TYPE_J1939_PGN
 from messaging import EventDrivenMessageProcessor, extract_error_from, filter_out_unchanged
 from threading_more import intercept_exit_signal
 from timeit import default_timer as timer
@@ -58,11 +60,13 @@ context = {
     },
     "export": {
         "state": ""
-    }
+    },
+    "can_db": {}
 }
 
 # Message processor
-edmp = EventDrivenMessageProcessor("obd", context=context, default_hooks={"workflow": "extended", "handler": "query"})
+# Workers and hooks synchronized with 'True' share the lock domain of the handlers accessing the bus
+edmp = EventDrivenMessageProcessor("obd", context=context, default_hooks={"workflow": "extended", "handler": "query"}, default_lock_domain="bus")
 
 # OBD connection is instantiated during start
 conn = None
@@ -73,6 +77,9 @@ proxy = elm327_proxy.ELM327Proxy()
 # Loaded CAN databases indexed by procotol ID
 can_db_cache = {}
 
+# CAN frame decoders compiled from CAN databases indexed by protocol ID
+can_decoder_cache = {}
+
 export_subprocess = None
 
 
@@ -96,9 +103,17 @@ def _can_db_for(protocol):
             path = os.path.join(home_dir, "can/db", "protocol_{:}.dbc".format(protocol.ID))
 
         # Load file
+        start = timer()
         conf = context["settings"].get("can_db", {}).get("protocol_configs", {}).get(protocol.ID, {})
-        ret = cantools.db.load_file(path, **conf)
-        log.info("Loaded CAN database from file '{:}' with configuration: {:}".format(path, conf))
+        ret, source = _load_can_db_file(path, conf)
+        duration = timer() - start
+        log.info("Loaded CAN database from {:} of file '{:}' with configuration {:} in {:}".format(source, path, conf, duration))
+
+        context["can_db"][protocol.ID] = {
+            "file": path,
+            "source": source,
+            "load_time": duration
+        }
 
         # Put into cache
         can_db_cache[protocol.ID] = ret
@@ -106,6 +121,80 @@ def _can_db_for(protocol):
     return ret
 
 
+def _load_can_db_file(path, conf):
+    """
+    Helper function to load a CAN database file (.dbc) using a compiled on-disk cache when available.
+    Cache files are keyed by file path, modification time and size of the CAN database file together with its configuration.
+    Cache file names are prefixed with the file name and a hash of the file path so only outdated cache files of the same file are removed.
+
+    Returns a tuple of the CAN database instance and the source it was loaded from.
+    """
+
+    import cantools
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = hashlib.sha1(json.dumps([path, stat.st_mtime, stat.st_size, conf, cantools.__version__], sort_keys=True, default=repr)).hexdigest()
+    prefix = "{:}_{:}_".format(os.path.splitext(os.path.basename(path))[0], hashlib.sha1(path).hexdigest()[:8])
+    cache_dir = os.path.join(home_dir, "can/db/cache")
+    cache_file = os.path.join(cache_dir, "{:}{:}.pickle".format(prefix, key))
+
+    # Try to load from cache
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, "rb") as f:
+                return pickle.loads(f.read()), "cache"  # Faster than loading from file object
+        except:
+            log.exception("Failed to load CAN database from cache file '{:}' - will load from file instead".format(cache_file))
+
+    ret = cantools.db.load_file(path, **conf)
+
+    # Update cache
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # Write to temporary file first to prevent reading incomplete cache files
+        tmp_file = "{:}.tmp".format(cache_file)
+        with open(tmp_file, "wb") as f:
+            pickle.dump(ret, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file, cache_file)
+
+        # Remove any outdated cache files of the same CAN database file
+        for file in os.listdir(cache_dir):
+            if file.startswith(prefix) and file.endswith(".pickle") and len(file) == len(prefix) + len(key) + 7 \
+                and file != os.path.basename(cache_file):
+                os.remove(os.path.join(cache_dir, file))
+    except:
+        log.exception("Failed to write CAN database to cache file '{:}'".format(cache_file))
+
+    return ret, "file"
+
+
+def _can_decoder_for(protocol):
+    """
+    Helper function to find cached CAN frame decoder or compile it from the CAN database of the protocol.
+    Only signals subscribed to in the 'can_db:signal_subscriptions:<PROTOCOL ID>' setting are decoded if present.
+    """
+
+    ret = can_decoder_cache.get(protocol.ID, None)
+    if not ret:
+        can_db = _can_db_for(protocol)
+
+        start = timer()
+        subscriptions = context["settings"].get("can_db", {}).get("signal_subscriptions", {}).get(protocol.ID, None)
+        ret = CANFrameDecoder(can_db, protocol, subscriptions=subscriptions)
+        duration = timer() - start
+        log.info("Compiled CAN frame decoder for protocol '{:}' with signal subscriptions {:} in {:}".format(protocol.ID, subscriptions, duration))
+
+        context["can_db"].setdefault(protocol.ID, {})["compile_time"] = duration
+
+        # Put into cache
+        can_decoder_cache[protocol.ID] = ret
+
+    return ret
+
+
 def _ensure_filtering(ident):
     """
     Helper method to ensure filtering.
@@ -125,7 +214,21 @@ def _ensure_filtering(ident):
         raise ValueError("Unsupported filtering value - supported values are: auto, can, j1939")
 
 
-@edmp.register_hook()
+def _status():
+    """
+    Helper method to get current status information.
+    """
+
+    ret = {
+        "connection": conn.status(),
+        "protocol": conn.protocol(),
+        "can_db": context["can_db"],
+    }
+
+    return ret
+
+
+@edmp.register_hook(synchronize="bus")
 def query_handler(name, mode=None, pid=None, header=None, bytes=0, frames=None, strict=False, decoder=None, formula=None, unit=None, protocol=None, baudrate=None, verify=False, force=False, **kwargs):
     """
     Queries an OBD command.
@@ -207,7 +310,7 @@ def query_handler(name, mode=None, pid=None, header=None, bytes=0, frames=None,
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def query_many_handler(*cmds):
     """
     Queries many OBD commands in one call.
@@ -222,7 +325,7 @@ def query_many_handler(*cmds):
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def send_handler(msg, **kwargs):
     """
     Sends a message on bus.
@@ -286,7 +389,7 @@ def send_handler(msg, **kwargs):
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def execute_handler(cmd, assert_result=None, reset=None, keep_conn=True, type=None):
     """
     Executes an AT/ST command.
@@ -340,7 +443,7 @@ def execute_handler(cmd, assert_result=None, reset=None, keep_conn=True, type=No
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def commands_handler(protocol="auto", baudrate=None, verify=True, output="dict"):
     """
     Lists all supported OBD commands found for vehicle.
@@ -366,21 +469,33 @@ def commands_handler(protocol="auto", baudrate=None, verify=True, output="dict")
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="status")
 def status_handler():
     """
     Gets current status information.
+
+    Does not wait for handlers accessing the bus unless the connection needs to be opened.
     """
 
-    ret = {
-        "connection": conn.status(),
-        "protocol": conn.protocol(),
-    }
+    # Only read cached state when not synchronized with handlers accessing the bus
+    ret = conn.cached_status()
+    if ret != None:
+        ret["can_db"] = context["can_db"]
 
-    return ret
+        return ret
 
+    # Opening the connection requires exclusive access to the bus
+    lock = edmp.lock_domain("bus")
+    if not lock.acquire(timeout=5):
+        raise Exception("Timed out after 5 second(s) waiting for lock '{:}'".format(lock.name))
 
-@edmp.register_hook()
+    try:
+        return _status()
+    finally:
+        lock.release()
+
+
+@edmp.register_hook(synchronize="bus")
 def connection_handler(baudrate=None, reset=None):
     """
     Manages current connection.
@@ -401,7 +516,7 @@ def connection_handler(baudrate=None, reset=None):
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def protocol_handler(set=None, baudrate=None, verify=False):
     """
     Configures protocol or lists all supported.
@@ -426,7 +541,7 @@ def protocol_handler(set=None, baudrate=None, verify=False):
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def setup_handler(**kwargs):
     """
     Setup advanced runtime settings.
@@ -460,7 +575,7 @@ def setup_handler(**kwargs):
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def monitor_handler(wait=False, limit=500, duration=None, mode=0, auto_format=False, filtering=False, protocol=None, baudrate=None, verify=False, type="raw", **kwargs):
     """
     Monitors messages on bus until limit or duration is reached.
@@ -511,7 +626,7 @@ def monitor_handler(wait=False, limit=500, duration=None, mode=0, auto_format=Fa
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def filter_handler(action, *args, **kwargs):
     """
     Manages filters.
@@ -543,7 +658,7 @@ def filter_handler(action, *args, **kwargs):
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def dump_handler(duration=2, monitor_mode=0, filtering=False, auto_format=False, raw_response=False, format_response=True, protocol=None, baudrate=None, verify=False, file=None, description=None):
     """
     Dumps all messages from bus to screen or file.
@@ -615,7 +730,7 @@ def dump_handler(duration=2, monitor_mode=0, filtering=False, auto_format=False,
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def export_handler(run=None, folder=None, wait_timeout=0, monitor_filtering=False, monitor_mode=0, can_auto_format=False, read_timeout=1, serial_baudrate=None, process_nice=-2, protocol=None, baudrate=None, verify=False):
     """
     Fast export of all messages on a bus to a log file.
@@ -763,11 +878,7 @@ def export_handler(run=None, folder=None, wait_timeout=0, monitor_filtering=Fals
     return ret
 
 
-# TODO HN:
-#import_lock = threading.Lock()
-# See: https://stackoverflow.com/questions/16740104/python-lock-with-statement-and-timeout/16782391
-#@edmp.register_hook(synchronize=import_lock, timeout=1)
-@edmp.register_hook(synchronize=False)
+@edmp.register_hook(synchronize="import", timeout=1)
 def import_handler(folder=None, limit=5000, idle_sleep=0, cleanup_grace=60, process_nice=0, type="raw"):
     """
     Fast import of exported log files containing messages from a bus.
@@ -969,7 +1080,7 @@ def recordings_handler(path=None):
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def play_handler(file, delay=None, slice=None, filter=None, group="id", protocol=None, baudrate=None, verify=False, auto_format=False, test=False, experimental=False):
     """
     Plays all messages from a file on the bus.
@@ -1167,7 +1278,7 @@ def play_handler(file, delay=None, slice=None, filter=None, group="id", protocol
     return ret
 
 
-@edmp.register_hook()
+@edmp.register_hook(synchronize="bus")
 def _relay_handler(cmd):
     """
     System handler to relay commands directly to the ELM327 compatible interface.
@@ -1191,7 +1302,7 @@ def can_converter(result):
     protocol = conn.supported_protocols().get(result.pop("protocol", None), conn.cached_protocol)  # NOTE: If 'protocol' key not popped the cloud returner is unable to split into separate results
 
     try:
-        can_db = _can_db_for(protocol)
+        decoder = _can_decoder_for(protocol)
     except:
         log.exception("Skipping CAN conversion because no CAN database could be loaded for protocol '{:}'".format(protocol))
 
@@ -1200,25 +1311,18 @@ def can_converter(result):
     # Check for multiple values in result
     if "values" in result:
 
-        # Try to decode CAN messages and add to list
-        res = []
-        fail_count = 0
-        for val in result["values"]:
-            val = val if isinstance(val, dict) else {"value": val}
-            try:
-                res.extend(decode_can_frame_for(can_db, protocol, val))
-            except Exception as ex:
-                log.info("Failed to decode raw CAN frame result '{:}' as a CAN message: {:}".format(val, ex))
-
-                # Count failed
-                fail_count += 1
+        # Try to decode all CAN messages in one go
+        res, fail_count = decoder.decode_many(result["values"])
 
         # Report if any failed
         if fail_count:
             log.error("{:} out of {:} raw CAN frame(s) in result failed to be decoded as CAN message(s)".format(fail_count, len(result["values"])))
 
         if not res:
-            log.warning("No raw CAN frame(s) out of {:} value(s) in result was decoded as CAN messages".format(len(result["values"])))
+            if decoder.subscriptions == None:
+                log.warning("No raw CAN frame(s) out of {:} value(s) in result was decoded as CAN messages".format(len(result["values"])))
+            elif log.isEnabledFor(logging.DEBUG):
+                log.debug("No subscribed CAN signals decoded from {:} value(s) in result".format(len(result["values"])))
 
             # Skip if none decoded
             return
@@ -1237,13 +1341,14 @@ def can_converter(result):
         # Try to decode CAN messages
         res = None
         try:
-            res = decode_can_frame_for(can_db, protocol, result)
+            res = decoder.decode(result)
         except Exception as ex:
             log.error("Failed to decode raw CAN frame result '{:}' as a CAN message(s): {:}".format(result, ex))
 
         # Skip if none decoded
         if not res:
-            log.warning("No raw CAN frame in result was decoded as CAN message(s)")
+            if decoder.subscriptions == None:
+                log.warning("No raw CAN frame in result was decoded as CAN message(s)")
 
             return
 
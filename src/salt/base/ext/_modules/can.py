@@ -61,6 +61,11 @@ def query(*args, **kwargs):
 def monitor(**kwargs):
     """
     Monitors messages on the CAN bus until a limit or duration is reached.
+
+    Optional arguments:
+      - duration (float): Number of seconds to monitor. Default is '1'.
+      - limit (int): Maximum number of messages to return.
+      - buffer_size (int): Number of frames the monitor buffer can hold before new frames are dropped. Default value '0' means 16384 frames (the buffer is never unbounded).
     """
 
     return client.send_sync(_msg_pack(_handler="monitor", **kwargs))
@@ -69,6 +74,14 @@ def monitor(**kwargs):
 def dump(*args, **kwargs):
     """
     Stores messages from the CAN bus to a file until a limit or duration is reached.
+
+    Arguments:
+      - file (str): Path of the file to store messages in. Format is given by the file extension (.asc, .blf, .csv, .db or .log).
+
+    Optional arguments:
+      - duration (float): Number of seconds to dump. Default is '2'.
+      - limit (int): Maximum number of messages to store.
+      - buffer_size (int): Number of frames the monitor buffer can hold before new frames are dropped. Default value '0' means 16384 frames (the buffer is never unbounded).
     """
 
     return client.send_sync(_msg_pack(*args, _handler="dump", **kwargs))
@@ -82,6 +95,21 @@ def play(*args, **kwargs):
     return client.send_sync(_msg_pack(*args, _handler="play", **kwargs))
 
 
+def benchmark(**kwargs):
+    """
+    Measures frames per second and CPU usage of the bulk receiver by replaying generated frames on a (virtual) CAN interface.
+
+    Optional arguments:
+      - channel (str): CAN interface to replay frames on. Default is 'vcan0'.
+      - count (int): Number of frames to replay. Default is '100000'.
+      - rate (int): Replay rate in frames per second. Default is as fast as possible.
+      - batch_size (int): Maximum number of frames read per system call. Default is '64'.
+      - use_recvmmsg (bool): Read using 'recvmmsg' instead of a loop of 'recvmsg' calls. Default is 'True'.
+    """
+
+    return client.send_sync(_msg_pack(_handler="benchmark", **kwargs))
+
+
 def obd_query(*args, **kwargs):
     """
     Queries an OBD-II PID on the CAN bus.
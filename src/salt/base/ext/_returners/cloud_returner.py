@@ -66,7 +66,7 @@ def _get_cloud_cache_for(ret):
         options = _get_options(ret)
         log.info("Creating cloud cache instance with Redis options: {:}".format(options))
 
-        _cloud_cache = CloudCache().setup(redis=options)
+        _cloud_cache = CloudCache().setup(redis=options, lanes=__salt__["config.get"]("cloud_cache:lanes", []))
         __context__["cloud_cache"] = _cloud_cache
     elif log.isEnabledFor(logging.DEBUG):
         log.debug("Re-using cloud cache instance found in context")
@@ -106,8 +106,7 @@ def returner_job(job):
     res = prepare_result_recursively(ret, kind, timestamp=None)
 
     cloud_cache = _get_cloud_cache_for(job)
-    for r in res:
-        cloud_cache.enqueue(r)
+    cloud_cache.enqueue_many(res)
 
 
 def returner_event(event):
@@ -147,5 +146,4 @@ def returner_data(data, kind, **kwargs):
     res = prepare_result_recursively(data, kind)
 
     cloud_cache = _get_cloud_cache_for(kwargs)
-    for r in res:
-        cloud_cache.enqueue(r)
+    cloud_cache.enqueue_many(res)
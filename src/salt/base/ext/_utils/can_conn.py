@@ -1,9 +1,21 @@
 import binascii
 import can
+import collections
+import ctypes
+import ctypes.util
+import errno
 import logging
+import os
 import Queue
+import socket
+import struct
 import subprocess
+import threading
+import time
 
+from can.interfaces.socketcan.constants import CAN_EFF_FLAG, CAN_RAW_ERR_FILTER, CAN_RAW_FD_FRAMES, CAN_RAW_FILTER, CANFD_BRS, CANFD_ESI, CANFD_MTU, SOL_CAN_RAW
+from can.interfaces.socketcan.socketcan import CAN_FRAME_HEADER_STRUCT, bind_socket, build_can_frame, create_socket
+from can.interfaces.socketcan.utils import pack_filters
 from six import string_types
 from timeit import default_timer as timer
 
@@ -31,6 +43,28 @@ FRAME_TYPES = {
     FRAME_TYPE_CF: "consecutive"
 }
 
+# Flags of frame records in ring buffer
+FRAME_FLAG_EXTENDED_ID = 0x01
+FRAME_FLAG_REMOTE      = 0x02
+FRAME_FLAG_ERROR       = 0x04
+FRAME_FLAG_FD          = 0x08
+FRAME_FLAG_BRS         = 0x10  # Bit rate switch
+FRAME_FLAG_ESI         = 0x20  # Error state indicator
+
+# Flags expanded to boolean attributes of frame records, indexed by flags
+FRAME_FLAG_ATTRS = [tuple(bool(flags & f) for f in [FRAME_FLAG_EXTENDED_ID, FRAME_FLAG_REMOTE, FRAME_FLAG_ERROR, FRAME_FLAG_FD, FRAME_FLAG_BRS, FRAME_FLAG_ESI]) for flags in range(0x40)]
+
+DEFAULT_RING_BUFFER_CAPACITY = 16384  # Frames
+
+CAN_MTU = 16
+CAN_SFF_MASK = 0x000007FF
+CAN_EFF_MASK = 0x1FFFFFFF
+
+SO_TIMESTAMP = 29  # Also used as control message type (SCM_TIMESTAMP)
+MSG_DONTWAIT = 0x40
+MSG_WAITFORONE = 0x10000
+CLOCK_THREAD_CPUTIME_ID = 3
+
 
 class CANConn(object):
 
@@ -68,17 +102,19 @@ class CANConn(object):
             self.outer = outer
 
             self._listener = None
+            self._source = None
 
         def __enter__(self):
             self._listener = BufferedReader()
-            self.outer._notifier.add_listener(self._listener)
+            self._source = self.outer._reply_source()
+            self._source.add_listener(self._listener)
 
             return self
 
         def __exit__(self, ex_type, ex_val, tb):
             try:
-                if self.outer._notifier:
-                    self.outer._notifier.remove_listener(self._listener)
+                if self._listener in self._source.listeners:
+                    self._source.remove_listener(self._listener)
             except:
                 log.exception("Failed to remove listener from bus notifier")
 
@@ -170,6 +206,8 @@ class CANConn(object):
             self.FLOW_CONTROL_OBD: obd_reply_id_for
         }
         self._monitor_listener = None
+        self._receiver = None
+        self._is_bus_muted = False
         self._is_autodetecting = False
 
     @property
@@ -219,6 +257,7 @@ class CANConn(object):
         channel = local_settings.pop("channel", "can0")
         receive_own_messages = local_settings.pop("receive_own_messages", False)
         notifier_timeout = local_settings.pop("notifier_timeout", 1.0)
+        bulk_receiver = local_settings.pop("bulk_receiver", False)
         autodetect = self._settings.pop("autodetect", False)
 
         if not self._is_autodetecting and autodetect:
@@ -256,6 +295,13 @@ class CANConn(object):
 
             self._notifier = can.Notifier(self._bus, [], timeout=notifier_timeout)  # No listeners for now
 
+            # Monitor listeners are fed by bulk receiver instead of notifier when enabled
+            if bulk_receiver:
+                self._receiver = BulkReceiver(channel,
+                    fd=local_settings.get("dbitrate", None) != None,
+                    filters=list(self._filters),
+                    **(bulk_receiver if isinstance(bulk_receiver, dict) else {}))
+
     def is_open(self):
         if self._bus != None:
             
@@ -295,10 +341,15 @@ class CANConn(object):
                 log.debug("Shutting down bus")
 
             try:
+                if self._receiver:
+                    self._receiver.stop()
+
                 self._bus.shutdown()
             finally:
                 self._bus = None
                 self._notifier = None
+                self._receiver = None
+                self._is_bus_muted = False
 
         # Bring down interface if not already or force
         if force or self.interface_state() != INTERFACE_STATE_DOWN:
@@ -469,11 +520,27 @@ class CANConn(object):
             log.debug("Applying {:} filter(s) to CAN bus instance".format(len(self._filters)))
 
         self._bus.set_filters(list(self._filters))
+        if self._receiver:
+            self._receiver.set_filters(list(self._filters))
+
+        # Setting filters on the bus also resumes receiving
+        if self._is_bus_muted:
+            self._bus.socket.setsockopt(SOL_CAN_RAW, CAN_RAW_FILTER, b"")  # No filters will reject all frames
+
         self._is_filters_dirty = False
 
     @Decorators.ensure_open
     def receive(self, timeout=1, expect=True):
-        msg = self._bus.recv(timeout=timeout)
+        if self._is_bus_muted:
+            listener = BufferedReader()
+            self._receiver.add_listener(listener)
+            try:
+                msg = listener.next(timeout=timeout)
+            finally:
+                if listener in self._receiver.listeners:
+                    self._receiver.remove_listener(listener)
+        else:
+            msg = self._bus.recv(timeout=timeout)
         if expect and not msg:
             raise Exception("No CAN message received within timeout of {:} second(s)".format(timeout))
 
@@ -578,7 +645,14 @@ class CANConn(object):
         raise NotImplementedError("Not yet available")
 
     @Decorators.ensure_open
-    def monitor_until(self, on_msg_func, duration=1, limit=None, receive_timeout=0.2, skip_error_frames=False, keep_listening=False, buffer_size=0):
+    def monitor_until(self, on_msg_func, duration=1, limit=None, receive_timeout=0.2, skip_error_frames=False, keep_listening=False, buffer_size=0, batch=False):
+        """
+        Monitors frames received on the bus until a limit or duration is reached. Frames are passed as 'CANFrame'
+        tuples to the given function one by one, or as lists of all frames drained in one go if batch is set.
+        Frames are buffered in a ring buffer of the given size, or of 'DEFAULT_RING_BUFFER_CAPACITY' frames when 0,
+        and frames received while the buffer is full are dropped.
+        Returns the number of frames received.
+        """
 
         if not duration and not limit:
             raise ValueError("Duration and/or limit must be specified")
@@ -586,25 +660,31 @@ class CANConn(object):
         if duration and receive_timeout > duration:
             raise ValueError("Receive timeout cannot exceed duration")
 
+        buffer_size = buffer_size or DEFAULT_RING_BUFFER_CAPACITY
+
+        source = self._receiver or self._notifier
+
         if self._monitor_listener == None:
             log.info("Creating monitor listener buffer of size {:}".format(buffer_size))
 
             # Create and add listener
-            self._monitor_listener = BufferedReader(capacity=buffer_size)
-            self._notifier.add_listener(self._monitor_listener)
+            self._monitor_listener = self._monitor_listener_for(buffer_size)
+            source.add_listener(self._monitor_listener)
+            self._mute_bus(source is self._receiver)
         else:
             # First make sure that the listener is actually added to the notifier
-            if self._monitor_listener not in self._notifier.listeners:
+            if self._monitor_listener not in source.listeners:
                 """
                 NOTE NV: Sometimes, it can happen that the connection class needs to get reconfigured. This causes
-                the notifier to also get recreated, which in turn causes the _monitor_listener entity to disappear
+                the notifier (or bulk receiver) to also get recreated, which in turn causes the _monitor_listener entity to disappear
                 from the notifier causing workers such as the can_logger (in this debugging case) to not receive any
                 of the messages that are actually being pushed to the bus. This is the reasoning behind this code.
                 This shouldn't occur that often, usually caused by the autodetect mechanism or any other reconfiguring
                 or switching of protocol/channel/can interface.
                 """
 
-                self._notifier.add_listener(self._monitor_listener)
+                source.add_listener(self._monitor_listener)
+                self._mute_bus(source is self._receiver)
 
             # Then proceed to make any other changes we might need to make to the listner
             if self._monitor_listener.capacity != buffer_size:
@@ -612,12 +692,12 @@ class CANConn(object):
                     log.info("Changing buffer size of monitor listener from {:} to {:}".format(self._monitor_listener.capacity, buffer_size))
 
                     # Remove listener if currently added
-                    if self._monitor_listener in self._notifier.listeners:
-                        self._notifier.remove_listener(self._monitor_listener)
+                    if self._monitor_listener in source.listeners:
+                        source.remove_listener(self._monitor_listener)
 
                     # Create and add listener with changed buffer size
-                    self._monitor_listener = BufferedReader(capacity=buffer_size)
-                    self._notifier.add_listener(self._monitor_listener)
+                    self._monitor_listener = self._monitor_listener_for(buffer_size)
+                    source.add_listener(self._monitor_listener)
                 else:
                     log.warning("Unable to change buffer size of monitor listener from {:} to {:} because queue is not empty".format(self._monitor_listener.capacity, buffer_size))
 
@@ -625,22 +705,35 @@ class CANConn(object):
             start = timer()
             count = 0
             while True:
-                msg = self._monitor_listener.next(block=duration > 0 or count == 0, timeout=receive_timeout)  # Always wait for the first frame
-                if msg == None:
+                frames = self._monitor_listener.drain(limit=limit - count if limit else None, block=duration > 0 or count == 0, timeout=receive_timeout)  # Always wait for the first frame
+                if not frames:
                     if not duration:
                         log.info("Monitor reached end of buffer - received {:} frame(s) in total".format(count))
 
                         break
                 else:
 
+                    # Count towards limit (including any skipped error frames)
+                    count += len(frames)
+
                     # Skip error frames?
-                    if msg.is_error_frame and skip_error_frames:
-                        log.warning("Monitor is skipping error frame: {:}".format(msg))
+                    if skip_error_frames:
+                        accepted = []
+                        for frame in frames:
+                            if frame.flags & FRAME_FLAG_ERROR:
+                                log.warning("Monitor is skipping error frame: {:}".format(frame))
+                            else:
+                                accepted.append(frame)
+
+                        frames = accepted
+
+                    if batch:
+                        if frames:
+                            on_msg_func(frames)
                     else:
-                        on_msg_func(msg)
+                        for frame in frames:
+                            on_msg_func(frame)
 
-                    # Check if limit has been reached (including any skipped error frames)
-                    count += 1
                     if limit and count >= limit:
                         log.info("Monitor limit of {:} frame(s) is reached".format(limit))
 
@@ -652,13 +745,70 @@ class CANConn(object):
 
                     break
         finally:
+            if DEBUG:
+                log.debug("Monitor listener stats: {:}".format(self._monitor_listener.stats()))
+
             if not keep_listening:
-                if self._monitor_listener in self._notifier.listeners:
-                    self._notifier.remove_listener(self._monitor_listener)
+                if self._monitor_listener in source.listeners:
+                    source.remove_listener(self._monitor_listener)
                     log.info("Monitor listener removed")
 
                 self._monitor_listener = None
+                self._mute_bus(False)
+
+        return count
 
+    def monitor_stats(self):
+        """
+        Gets buffer statistics of the current monitor listener, if any.
+        """
+
+        if self._monitor_listener == None:
+            return None
+
+        return self._monitor_listener.stats()
+
+    def receiver_stats(self):
+        """
+        Gets throughput and CPU usage statistics of the bulk receiver, if enabled.
+        """
+
+        if self._receiver == None:
+            return None
+
+        return self._receiver.stats()
+
+    def _monitor_listener_for(self, buffer_size):
+        return CANFrameRingBuffer(capacity=buffer_size, fd=self._settings.get("dbitrate", None) != None)
+
+    def _reply_source(self):
+        """
+        Helper method to get the notifier, or the bulk receiver while the socket of the bus is muted.
+        """
+
+        return self._receiver if self._is_bus_muted else self._notifier
+
+    def _mute_bus(self, mute):
+        """
+        Helper method to stop or resume receiving frames on the socket of the bus. The socket is muted while the
+        bulk receiver feeds the monitor listener, so the notifier does not receive every frame a second time.
+        """
+
+        if mute == self._is_bus_muted:
+            return
+
+        if mute:
+            log.info("Muting CAN bus socket while bulk receiver is monitoring")
+
+            self._bus.socket.setsockopt(SOL_CAN_RAW, CAN_RAW_FILTER, b"")  # No filters will reject all frames
+            self._bus.socket.setsockopt(SOL_CAN_RAW, CAN_RAW_ERR_FILTER, 0)
+        else:
+            log.info("Unmuting CAN bus socket")
+
+            self._bus.set_filters(self._bus.filters)
+            self._bus.socket.setsockopt(SOL_CAN_RAW, CAN_RAW_ERR_FILTER, 0x1FFFFFFF)  # Receive error frames as python-can does
+
+        self._is_bus_muted = mute
 
     @Decorators.ensure_open
     def dump_until(self, file, duration=2, limit=None, receive_timeout=0.5, skip_error_frames=False, keep_listening=False, buffer_size=0, **kwargs):
@@ -677,7 +827,7 @@ class CANConn(object):
             ValueError("Unsupported file extension")
 
         try:
-            return self.monitor_until.undecorated(self, writer,  # No need to call the 'ensure_open' decorator again
+            return self.monitor_until.undecorated(self, lambda frame: writer.on_message_received(frame.to_msg()),  # No need to call the 'ensure_open' decorator again
                 duration=duration,
                 limit=limit,
                 receive_timeout=receive_timeout,
@@ -764,6 +914,751 @@ class BufferedReader(can.listener.Listener):
             return None
 
 
+class CANFrame(collections.namedtuple("CANFrame", ["timestamp", "arbitration_id", "flags", "dlc", "data",
+    "is_extended_id", "is_remote_frame", "is_error_frame", "is_fd", "bitrate_switch", "error_state_indicator"])):
+    """
+    Lightweight CAN frame record as drained from a ring buffer. Provides the same read-only attributes
+    as a python-can 'Message' object so existing formatters can be used directly.
+    """
+
+    __slots__ = ()
+
+    def to_msg(self):
+        return can.Message(
+            timestamp=self.timestamp,
+            arbitration_id=self.arbitration_id,
+            is_extended_id=self.is_extended_id,
+            is_remote_frame=self.is_remote_frame,
+            is_error_frame=self.is_error_frame,
+            is_fd=self.is_fd,
+            bitrate_switch=self.bitrate_switch,
+            error_state_indicator=self.error_state_indicator,
+            dlc=self.dlc,
+            data=self.data)
+
+    def __str__(self):
+        return str(self.to_msg())
+
+
+class CANFrameRingBuffer(can.listener.Listener):
+    """
+    Preallocated ring buffer of fixed size CAN frame records. Each record holds timestamp, ID, flags,
+    DLC and 8 (or 64 for CAN FD) data bytes packed into a single 'bytearray', so nothing is allocated
+    or locked when a frame is received.
+
+    This class is safe without locking for one producer thread (the notifier) and one consumer thread.
+    """
+
+    HEADER = struct.Struct("<dIBB")  # Timestamp, ID, flags and DLC
+
+    def __init__(self, capacity=0, fd=False):
+        self.capacity = capacity or DEFAULT_RING_BUFFER_CAPACITY
+        self.data_size = 64 if fd else 8
+        self.record_size = self.HEADER.size + self.data_size
+
+        self._record = struct.Struct("{:}{:d}s".format(self.HEADER.format, self.data_size))
+        self._pack_header = self.HEADER.pack_into
+        self._buffer = bytearray(self.capacity * self.record_size)
+        self._view = memoryview(self._buffer)
+        self._head = 0  # Total number of records written
+        self._tail = 0  # Total number of records released
+        self._ready = threading.Event()
+        self._waiting = False
+
+        self._overflows = 0
+        self._overflows_total = 0
+        self._high_water = 0
+
+    def on_message_received(self, msg):
+        if DEBUG:
+            log.debug("CAN ring buffer got message {:}".format(msg))
+
+        # NOTE: Booleans are shifted into place according to the flag constants
+        flags = msg.is_extended_id | msg.is_remote_frame << 1 | msg.is_error_frame << 2
+        if msg.is_fd:
+            flags |= FRAME_FLAG_FD | msg.bitrate_switch << 4 | msg.error_state_indicator << 5
+
+        self.put(msg.timestamp, msg.arbitration_id, flags, msg.dlc, msg.data)
+
+    def put(self, timestamp, arbitration_id, flags, dlc, data):
+        """
+        Writes a single frame record. Returns False if the frame was dropped because the buffer is full.
+
+        NOTE: Must never raise because it is called from the notifier thread.
+        """
+
+        head = self._head
+        pending = head - self._tail
+        if pending >= self.capacity:
+
+            # Only log once when changing state
+            if self._overflows == 0:
+                log.warning("CAN ring buffer with capacity of {:} is full and frames are overflowing".format(self.capacity))
+
+            self._overflows += 1
+            self._overflows_total += 1
+
+            return False
+
+        size = len(data)
+        if size > self.data_size:
+            log.warning("CAN ring buffer with record data size of {:} is dropping frame with {:} data bytes".format(self.data_size, size))
+
+            return False
+
+        offset = (head % self.capacity) * self.record_size
+        self._pack_header(self._buffer, offset, timestamp, arbitration_id, flags, dlc)
+        if size:
+            offset += self.HEADER.size
+            self._buffer[offset:offset + size] = data
+
+        # Publish record to consumer
+        self._head = head + 1
+
+        if pending >= self._high_water:
+            self._high_water = pending + 1
+
+        # Reset overflow counter
+        if self._overflows > 0:
+            log.warning("CAN ring buffer with capacity of {:} recovered from overflow - {:} frame(s) was lost".format(self.capacity, self._overflows))
+
+            self._overflows = 0
+
+        # Wake up consumer only when it is waiting
+        if self._waiting:
+            self._waiting = False
+            self._ready.set()
+
+        return True
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def is_full(self):
+        return self._head - self._tail >= self.capacity
+
+    def is_empty(self):
+        return self._head == self._tail
+
+    def wait(self, timeout=0.5):
+        """
+        Blocks until at least one record is pending or timeout. Returns False on timeout.
+        """
+
+        if self._head != self._tail:
+            return True
+
+        self._waiting = True
+        self._ready.clear()
+        if self._head != self._tail:  # Written before clear
+            self._waiting = False
+
+            return True
+
+        self._ready.wait(timeout)
+        self._waiting = False
+
+        return self._head != self._tail
+
+    def slices(self, limit=None):
+        """
+        Gets memory views of pending records without copying or consuming them. Two slices are returned
+        when the pending records wrap around the end of the buffer. Call 'release' when done with them.
+        """
+
+        tail = self._tail
+        count = self._head - tail
+        if limit and count > limit:
+            count = limit
+
+        if not count:
+            return 0, []
+
+        start = tail % self.capacity
+        first = min(count, self.capacity - start)
+
+        ret = [self._view[start * self.record_size:(start + first) * self.record_size]]
+        if first < count:
+            ret.append(self._view[:(count - first) * self.record_size])
+
+        return count, ret
+
+    def release(self, count):
+        """
+        Releases records previously returned by 'slices' so they can be overwritten.
+        """
+
+        self._tail += count
+
+    def unpack(self, view):
+        """
+        Unpacks a slice of records into a list of 'CANFrame' tuples.
+        """
+
+        ret = []
+
+        new = tuple.__new__
+        unpack_from = self._record.unpack_from
+        data_size = self.data_size
+        for offset in xrange(0, len(view), self.record_size):
+            timestamp, arbitration_id, flags, dlc, data = unpack_from(view, offset)
+
+            if flags & FRAME_FLAG_REMOTE:
+                data = b""
+            elif dlc < data_size:
+                data = data[:dlc]
+
+            ret.append(new(CANFrame, (timestamp, arbitration_id, flags, dlc, data) + FRAME_FLAG_ATTRS[flags]))
+
+        return ret
+
+    def drain(self, limit=None, block=False, timeout=0.5):
+        """
+        Consumes pending records in a single batch and returns them as a list of 'CANFrame' tuples.
+        """
+
+        if block and not self.wait(timeout=timeout):
+            return []
+
+        count, views = self.slices(limit=limit)
+
+        ret = []
+        for view in views:
+            ret.extend(self.unpack(view))
+
+        self.release(count)
+
+        return ret
+
+    def next(self, block=True, timeout=0.5):
+        ret = self.drain(limit=1, block=block, timeout=timeout)
+
+        return ret[0] if ret else None
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "record_size": self.record_size,
+            "pending": self._head - self._tail,
+            "received": self._head,
+            "high_water": self._high_water,
+            "overflows": self._overflows_total,
+        }
+
+
+class IOVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.c_void_p),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", MsgHdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+class CMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("cmsg_len", ctypes.c_size_t),
+        ("cmsg_level", ctypes.c_int),
+        ("cmsg_type", ctypes.c_int),
+    ]
+
+
+class TimeSpec(ctypes.Structure):
+    _fields_ = [
+        ("tv_sec", ctypes.c_long),
+        ("tv_nsec", ctypes.c_long),
+    ]
+
+
+def _cmsg_align(length):
+    return (length + ctypes.sizeof(ctypes.c_size_t) - 1) & ~(ctypes.sizeof(ctypes.c_size_t) - 1)
+
+
+TIMEVAL_STRUCT = struct.Struct("@ll")  # Native 'struct timeval'
+MSG_LEN_STRUCT = struct.Struct("@I")
+MSG_CONTROLLEN_STRUCT = struct.Struct("@L")  # Native 'size_t' which is 'unsigned long' on Linux
+
+CMSG_TIMEVAL_OFFSET = _cmsg_align(ctypes.sizeof(CMsgHdr))  # Offset of timestamp in control message
+CMSG_TIMEVAL_SPACE = CMSG_TIMEVAL_OFFSET + _cmsg_align(TIMEVAL_STRUCT.size)
+CMSG_TIMEVAL_LEN = CMSG_TIMEVAL_OFFSET + TIMEVAL_STRUCT.size
+
+# Control message header followed by timestamp
+CMSG_TIMEVAL_STRUCT = struct.Struct("@Lii{:d}xll".format(CMSG_TIMEVAL_OFFSET - ctypes.sizeof(CMsgHdr)))
+
+libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+libc.recvmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MsgHdr), ctypes.c_int]
+libc.recvmsg.restype = ctypes.c_ssize_t
+if hasattr(libc, "recvmmsg"):
+    libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    libc.recvmmsg.restype = ctypes.c_int
+libc.clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(TimeSpec)]
+
+
+def thread_cpu_time():
+    """
+    Gets CPU time in seconds consumed by the calling thread.
+    """
+
+    ts = TimeSpec()
+    libc.clock_gettime(CLOCK_THREAD_CPUTIME_ID, ctypes.byref(ts))
+
+    return ts.tv_sec + ts.tv_nsec * 0.000000001
+
+
+class BatchReader(object):
+    """
+    Reads many frames per system call from a raw CAN socket into preallocated buffers using 'recvmmsg',
+    together with the kernel timestamps (SO_TIMESTAMP) delivered as ancillary data by the same call.
+    Falls back to a loop of non-blocking 'recvmsg' calls when 'recvmmsg' is not available.
+    """
+
+    def __init__(self, sock, batch_size=64, fd=False, timeout=1.0, use_recvmmsg=True):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.fd = fd
+        self.frame_size = CANFD_MTU if fd else CAN_MTU
+        self.use_recvmmsg = use_recvmmsg and hasattr(libc, "recvmmsg")
+
+        self.calls = 0
+        self.frames = 0
+        self.missing_timestamps = 0
+
+        # Enable kernel timestamps and timeout of blocking receive
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMP, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, TIMEVAL_STRUCT.pack(int(timeout), int(timeout % 1 * 1000000)))
+
+        self._fileno = sock.fileno()
+        self._frames = bytearray(batch_size * self.frame_size)
+        self._control = bytearray(batch_size * CMSG_TIMEVAL_SPACE)
+        self._msgs = bytearray(batch_size * ctypes.sizeof(MMsgHdr))
+
+        # Point message headers into the buffers
+        self._frames_ref = (ctypes.c_char * len(self._frames)).from_buffer(self._frames)
+        self._control_ref = (ctypes.c_char * len(self._control)).from_buffer(self._control)
+        self._iovecs = (IOVec * batch_size)()
+        self._msgvec = (MMsgHdr * batch_size).from_buffer(self._msgs)
+        for idx in range(batch_size):
+            self._iovecs[idx].iov_base = ctypes.addressof(self._frames_ref) + idx * self.frame_size
+            self._iovecs[idx].iov_len = self.frame_size
+
+            hdr = self._msgvec[idx].msg_hdr
+            hdr.msg_iov = ctypes.addressof(self._iovecs[idx])
+            hdr.msg_iovlen = 1
+            hdr.msg_control = ctypes.addressof(self._control_ref) + idx * CMSG_TIMEVAL_SPACE
+            hdr.msg_controllen = CMSG_TIMEVAL_SPACE
+
+        # The kernel updates lengths and flags of message headers in place so they are restored from a copy
+        self._template = bytes(self._msgs)
+        self._control_template = bytes(self._control)
+
+    def read(self, put):
+        """
+        Blocks until frames are available or timeout, and passes each frame received to the given function
+        as timestamp, ID, flags, DLC and data. Frames received without a kernel timestamp are timestamped
+        with the current time. Returns the number of frames read.
+        """
+
+        return self.dispatch(self.receive(), put)
+
+    def receive(self):
+        """
+        Blocks until frames are available or timeout, and receives them into the buffers without passing them on.
+        Returns the number of frames received, which must then be passed on using 'dispatch'.
+        """
+
+        if self.use_recvmmsg:
+            count = libc.recvmmsg(self._fileno, self._msgvec, self.batch_size, MSG_WAITFORONE, None)
+            self.calls += 1
+
+            if count < 0:
+                return self._check_errno()
+        else:
+            count = 0
+            flags = 0  # Only block for first frame
+            while count < self.batch_size:
+                size = libc.recvmsg(self._fileno, ctypes.byref(self._msgvec[count].msg_hdr), flags)
+                self.calls += 1
+
+                if size < 0:
+                    if count:  # Nothing more to read for now
+                        break
+
+                    return self._check_errno()
+
+                self._msgvec[count].msg_len = size
+                count += 1
+                flags = MSG_DONTWAIT
+
+        return count
+
+    def dispatch(self, count, put):
+        """
+        Passes the given number of frames last received to the given function like 'read' does.
+        """
+
+        frames = self._frames
+        control = self._control
+        msgs = self._msgs
+        fd = self.fd
+        frame_size = self.frame_size
+        msg_size = ctypes.sizeof(MMsgHdr)
+        msg_len_offset = MMsgHdr.msg_len.offset
+        msg_controllen_offset = MMsgHdr.msg_hdr.offset + MsgHdr.msg_controllen.offset
+        unpack_header = CAN_FRAME_HEADER_STRUCT.unpack_from
+        unpack_controllen = MSG_CONTROLLEN_STRUCT.unpack_from
+        unpack_cmsg = CMSG_TIMEVAL_STRUCT.unpack_from
+        for idx in xrange(count):
+            offset = idx * frame_size
+            can_id, dlc, fd_flags = unpack_header(frames, offset)
+
+            # Only use timestamp when the control message received is actually a timestamp
+            timestamp = None
+            if unpack_controllen(msgs, idx * msg_size + msg_controllen_offset)[0] >= CMSG_TIMEVAL_LEN:
+                cmsg_len, cmsg_level, cmsg_type, sec, usec = unpack_cmsg(control, idx * CMSG_TIMEVAL_SPACE)
+                if cmsg_len >= CMSG_TIMEVAL_LEN and cmsg_level == socket.SOL_SOCKET and cmsg_type == SO_TIMESTAMP:
+                    timestamp = sec + usec * 0.000001
+            if timestamp == None:
+                timestamp = self._missing_timestamp()
+
+            # NOTE: Bits of the ID are shifted into place according to the frame flag constants
+            flags = (can_id >> 31) & 0x01 | (can_id >> 29) & 0x02 | (can_id >> 27) & 0x04
+            if fd and MSG_LEN_STRUCT.unpack_from(msgs, idx * msg_size + msg_len_offset)[0] == CANFD_MTU:
+                flags |= FRAME_FLAG_FD | (fd_flags & CANFD_BRS) << 4 | (fd_flags & CANFD_ESI) << 4
+
+            put(timestamp,
+                can_id & (CAN_EFF_MASK if can_id & CAN_EFF_FLAG else CAN_SFF_MASK),
+                flags,
+                dlc,
+                frames[offset + 8:offset + 8 + dlc])
+
+        msgs[:count * msg_size] = self._template[:count * msg_size]
+        control[:count * CMSG_TIMEVAL_SPACE] = self._control_template[:count * CMSG_TIMEVAL_SPACE]
+        self.frames += count
+
+        return count
+
+    def _missing_timestamp(self):
+
+        # Only log first time
+        if self.missing_timestamps == 0:
+            log.warning("CAN frame received without kernel timestamp - using current time instead")
+
+        self.missing_timestamps += 1
+
+        return time.time()
+
+    def _check_errno(self):
+        err = ctypes.get_errno()
+        if err in (errno.EAGAIN, errno.EINTR):  # Timeout or interrupted
+            return 0
+
+        raise can.CanError("Error receiving: {:}".format(os.strerror(err)))
+
+
+class BulkReceiver(object):
+    """
+    Receives frames in a background thread from a dedicated raw CAN socket using a 'BatchReader' and writes
+    them directly into its 'CANFrameRingBuffer' listeners, while any other listeners are passed python-can
+    messages. Provides the same listener interface as 'can.Notifier' and only runs while listeners are added.
+    If the thread fails, all listeners are removed so that the receiver is restarted when one is added again.
+    """
+
+    STATS_INTERVAL = 1.0  # Seconds
+
+    def __init__(self, channel, fd=False, filters=None, batch_size=64, timeout=1.0, use_recvmmsg=True):
+        self.channel = channel
+        self.fd = fd
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.use_recvmmsg = use_recvmmsg
+        self.listeners = []
+
+        self._filters = filters or []
+        self._socket = None
+        self._thread = None
+        self._stopped_thread = None
+        self._stop_event = None
+        self._context = None  # Listeners of the current thread
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._failures = 0
+
+    def add_listener(self, listener):
+        with self._lock:
+            self.listeners.append(listener)
+
+            if self._thread == None:
+                self._start()
+            else:
+                self._context["puts"] = self._puts()
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self.listeners.remove(listener)
+
+            if not self.listeners:
+                self._stop()
+            elif self._context != None:
+                self._context["puts"] = self._puts()
+
+    def set_filters(self, filters):
+        self._filters = filters
+
+        sock = self._socket
+        if sock != None:
+            sock.setsockopt(SOL_CAN_RAW, CAN_RAW_FILTER, pack_filters(filters or None))  # No filters will pass all frames
+
+    def stop(self, timeout=None):
+        """
+        Removes all listeners and stops the receiver thread, optionally waiting for it to terminate.
+        """
+
+        with self._lock:
+            del self.listeners[:]
+            thread = self._stop()
+
+        if thread and timeout:
+            thread.join(timeout)
+
+    def stats(self):
+        return dict(self._stats, running=self._thread != None, listeners=len(self.listeners), failures=self._failures)
+
+    def _puts(self):
+        """
+        Helper method to get the functions writing received frames into each of the listeners.
+        """
+
+        return [l.put if isinstance(l, CANFrameRingBuffer) else self._put_msg_func_for(l) for l in self.listeners]
+
+    def _put_msg_func_for(self, listener):
+        """
+        Helper method to get a function passing received frames as python-can messages to the given listener.
+        """
+
+        def put(timestamp, arbitration_id, flags, dlc, data):
+            frame = tuple.__new__(CANFrame, (timestamp, arbitration_id, flags, dlc, b"" if flags & FRAME_FLAG_REMOTE else data) + FRAME_FLAG_ATTRS[flags])
+
+            listener.on_message_received(frame.to_msg())
+
+        return put
+
+    def _start(self):
+        sock = create_socket()
+        try:
+            sock.setsockopt(SOL_CAN_RAW, CAN_RAW_ERR_FILTER, 0x1FFFFFFF)  # Receive error frames as python-can does
+            if self.fd:
+                sock.setsockopt(SOL_CAN_RAW, CAN_RAW_FD_FRAMES, 1)
+            sock.setsockopt(SOL_CAN_RAW, CAN_RAW_FILTER, pack_filters(self._filters or None))  # No filters will pass all frames
+
+            bind_socket(sock, self.channel)
+        except:
+            sock.close()
+
+            raise
+
+        # Listeners only allow a single producer so wait for any previous thread to terminate
+        stopped_thread = self._stopped_thread
+        if stopped_thread and stopped_thread.is_alive():
+            stopped_thread.join(self.timeout * 2)
+
+            if stopped_thread.is_alive():
+                log.warning("Previous CAN bulk receiver thread on channel '{:}' has not yet terminated".format(self.channel))
+        self._stopped_thread = None
+
+        log.info("Starting CAN bulk receiver on channel '{:}' reading up to {:} frame(s) per system call".format(self.channel, self.batch_size))
+
+        self._socket = sock
+        self._stop_event = threading.Event()
+        self._context = {"puts": self._puts()}
+        self._thread = threading.Thread(target=self._run, name="can_bulk_receiver", args=(sock, self._stop_event, self._context))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _stop(self):
+        thread = self._thread
+        if thread:
+            log.info("Stopping CAN bulk receiver on channel '{:}'".format(self.channel))
+
+            # NOTE: The thread closes its socket within the receive timeout
+            self._context["puts"] = []
+            self._stop_event.set()
+            self._thread = None
+            self._stopped_thread = thread
+            self._socket = None
+            self._context = None
+
+        return thread
+
+    def _run(self, sock, stop_event, context):
+        try:
+            reader = BatchReader(sock, batch_size=self.batch_size, fd=self.fd, timeout=self.timeout, use_recvmmsg=self.use_recvmmsg)
+
+            cpu_start = thread_cpu_time()
+            window_start = timer()
+            window_cpu = cpu_start
+            window_frames = 0
+
+            stats = {
+                "method": "recvmmsg" if reader.use_recvmmsg else "recvmsg",
+                "frames_per_sec": 0.0,
+                "cpu_percent": 0.0,
+            }
+            self._stats = stats
+
+            while not stop_event.is_set():
+                count = reader.receive()
+
+                # NOTE: Listeners are looked up after receiving so that any listener added while waiting gets the frames
+                puts = context["puts"]  # Replaced when listeners are changed
+                if len(puts) == 1:
+                    reader.dispatch(count, puts[0])
+                elif puts:
+                    reader.dispatch(count, lambda *args: [p(*args) for p in puts])
+                else:  # About to stop
+                    reader.dispatch(count, lambda *args: None)
+
+                window_frames += count
+
+                now = timer()
+                if now - window_start >= self.STATS_INTERVAL:
+                    cpu = thread_cpu_time()
+
+                    stats["frames_per_sec"] = window_frames / (now - window_start)
+                    stats["cpu_percent"] = (cpu - window_cpu) / (now - window_start) * 100
+                    stats["cpu_time"] = cpu - cpu_start
+                    stats["frames"] = reader.frames
+                    stats["calls"] = reader.calls
+                    stats["frames_per_call"] = float(reader.frames) / reader.calls if reader.calls else 0.0
+                    stats["missing_timestamps"] = reader.missing_timestamps
+
+                    window_start = now
+                    window_cpu = cpu
+                    window_frames = 0
+
+            # Final totals
+            stats["cpu_time"] = thread_cpu_time() - cpu_start
+            stats["frames"] = reader.frames
+            stats["calls"] = reader.calls
+            stats["frames_per_call"] = float(reader.frames) / reader.calls if reader.calls else 0.0
+            stats["missing_timestamps"] = reader.missing_timestamps
+
+        except Exception as ex:
+            log.exception("CAN bulk receiver on channel '{:}' failed".format(self.channel))
+
+            # Allow restart by next listener added unless already stopped
+            with self._lock:
+                if self._context is context:
+                    log.warning("Removing {:} listener(s) from failed CAN bulk receiver on channel '{:}'".format(len(self.listeners), self.channel))
+
+                    del self.listeners[:]
+                    self._thread = None
+                    self._socket = None
+                    self._context = None
+
+                self._failures += 1
+                self._stats = dict(self._stats, error=str(ex))
+        finally:
+            sock.close()
+
+
+def replay_frames(sock, messages, rate=None, repeat=1):
+    """
+    Sends python-can messages as raw frames on a socket, e.g. to generate load on a 'vcan' interface.
+    Optionally paced to a rate in frames per second. Returns the number of frames sent.
+    """
+
+    frames = [build_can_frame(m) for m in messages]
+
+    count = 0
+    start = timer()
+    for _ in xrange(repeat):
+        for frame in frames:
+            while True:
+                try:
+                    sock.send(frame)
+
+                    break
+                except socket.error as err:
+                    if err.errno != errno.ENOBUFS:
+                        raise
+
+                    time.sleep(0.001)  # Transmit queue is full
+
+            count += 1
+
+            if rate:
+                delay = start + count / float(rate) - timer()
+                if delay > 0:
+                    time.sleep(delay)
+
+    return count
+
+
+def benchmark_receiver(channel="vcan0", count=100000, rate=None, settle_timeout=5, **kwargs):
+    """
+    Replays generated frames on a (virtual) CAN interface while receiving them using a 'BulkReceiver', and
+    returns receive rate in frames per second and CPU usage of the receiver thread, of the sending thread and
+    of the whole process, which includes any other threads receiving the same frames such as bus notifiers.
+    """
+
+    messages = [can.Message(arbitration_id=0x100 + idx, is_extended_id=False, data=bytearray([idx] * (idx % 9))) for idx in range(0x100)]
+
+    buffer = CANFrameRingBuffer(capacity=count)
+    receiver = BulkReceiver(channel, **kwargs)
+    receiver.add_listener(buffer)
+
+    sock = create_socket()
+    try:
+        bind_socket(sock, channel)
+
+        start = timer()
+        process_cpu_start = sum(os.times()[:2])
+        sender_cpu_start = thread_cpu_time()
+        sent = replay_frames(sock, messages, rate=rate, repeat=max(count // len(messages), 1))
+        sender_cpu = thread_cpu_time() - sender_cpu_start
+
+        # Wait for receiver to catch up
+        while len(buffer) < sent and timer() - start < settle_timeout:
+            time.sleep(0.01)
+
+        duration = timer() - start
+        process_cpu = sum(os.times()[:2]) - process_cpu_start  # User and system time
+    finally:
+        sock.close()
+        receiver.stop(timeout=receiver.timeout * 2)
+
+    ret = receiver.stats()
+    ret.update({
+        "sent": sent,
+        "received": len(buffer),
+        "overflows": buffer.stats()["overflows"],
+        "duration": duration,
+        "frames_per_sec": len(buffer) / duration,
+        "cpu_percent": ret.get("cpu_time", 0.0) / duration * 100,
+        "sender_cpu_percent": sender_cpu / duration * 100,
+        "process_cpu_percent": process_cpu / duration * 100,
+    })
+
+    return ret
+
+
 MSG_MAP = {
     "id": "arbitration_id",
     "ts": "timestamp",
@@ -829,7 +1724,7 @@ def decode_msg_from(val, **kwargs):
 
 def encode_msg_to(kind, msg, **kwargs):
     if kind == "obj":
-        return msg
+        return msg.to_msg() if isinstance(msg, CANFrame) else msg
     elif kind == "str":
         return msg_to_str(msg, **kwargs)
     elif kind == "dict":
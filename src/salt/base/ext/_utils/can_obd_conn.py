@@ -440,7 +440,7 @@ class SocketCANInterface(STN11XX):
             raise ValueError("Monitor mode {:} is currently not supported by SocketCan OBD connection".format(current_mode))
 
         # Monitor for specified duration
-        self._port.monitor_until(lambda msg: ret.append(formatter(msg)), skip_error_frames=skip_error_frames, **kwargs)
+        self._port.monitor_until(lambda frames: ret.extend([formatter(f) for f in frames]), skip_error_frames=skip_error_frames, batch=True, **kwargs)
         if not ret and not raw_response:
             raise SocketCANError(self.ERRORS["NO DATA"], code="NO DATA")  # Same behaviour as old
 
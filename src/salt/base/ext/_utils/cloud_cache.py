@@ -1,20 +1,39 @@
+import collections
 import datetime
-import gzip
+import fnmatch
 import json
 import logging
 import random
 import re
 import redis
 import requests
-import StringIO
+import threading
+import threading_more
 import time
-
-from requests.exceptions import RequestException
+import zlib
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, RequestException
 from timeit import default_timer as timer
 
 
 log = logging.getLogger(__name__)
 
+# Reuse encoder instance because 'json.dumps' creates a new one on every call when separators are given
+json_encoder = json.JSONEncoder(separators=(",", ":"))
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
 
 def prepare_result_recursively(result, kind, timestamp=None):
     ret = []
@@ -61,6 +80,442 @@ def prepare_result_recursively(result, kind, timestamp=None):
     return ret
 
 
+def compressor_for(algorithm, level=1):
+    """
+    Creates a streaming compressor for the given algorithm.
+
+    Returns tuple of compressor (None when no algorithm is given) and the flush mode to use for intermediate flushes.
+    """
+
+    if algorithm == "gzip":
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS), zlib.Z_SYNC_FLUSH
+    elif algorithm == "deflate":
+        return zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS), zlib.Z_SYNC_FLUSH
+    elif algorithm == "zstd":
+        if not HAS_ZSTD:
+            raise ValueError("Compression algorithm 'zstd' requires the zstandard package to be installed")
+
+        return zstandard.ZstdCompressor(level=level).compressobj(), zstandard.COMPRESSOBJ_FLUSH_BLOCK
+    elif algorithm == None:
+        return None, None
+
+    raise ValueError("Unsupported compression algorithm '{:}'".format(algorithm))
+
+
+class PayloadBuilder(object):
+    """
+    Builds a JSON array payload by compressing serialized entries as they are appended.
+
+    Supported compression algorithms are 'gzip', 'deflate' and 'zstd' (requires the zstandard package).
+    The payload is considered full when the compressed size reaches the target size. The compressor is flushed at
+    least twice before the target size can be reached and again when the estimated size reaches the target size,
+    so the decision is based on the actual compressed size.
+    """
+
+    def __init__(self, algorithm=None, level=1, target_size=0, flush_size=16384):
+        self.algorithm = algorithm
+        self.target_size = target_size
+        self.flush_size = min(flush_size, target_size // 2) if target_size > 0 else flush_size  # Amount of raw data between flushes used to keep track of compressed size
+        self.count = 0
+        self.raw_size = 0
+
+        self._chunks = []
+        self._size = 0
+        self._unflushed_size = 0
+        self._ratio = 1.0
+
+        self._compressor, self._flush_mode = compressor_for(algorithm, level)
+
+        self._write("[")
+
+    @property
+    def size(self):
+        """
+        Estimated size of the payload when closed.
+        """
+
+        return self._size + int(self._unflushed_size * self._ratio)
+
+    @property
+    def is_full(self):
+        return self.target_size > 0 and self.size >= self.target_size
+
+    def append(self, entry):
+        """
+        Appends a serialized entry. Returns False without appending if the payload is already full.
+        The first entry is always appended.
+        """
+
+        if self.count and self.is_full:
+            return False
+
+        self._write("," + entry if self.count else entry)
+        self.count += 1
+
+        return True
+
+    def close(self):
+        """
+        Finishes the payload and returns it.
+        """
+
+        self._write("]")
+
+        if self._compressor != None:
+            self._chunks.append(self._compressor.flush())
+            self._compressor = None
+
+        return "".join(self._chunks)
+
+    def _write(self, data):
+        self.raw_size += len(data)
+
+        if self._compressor == None:
+            self._chunks.append(data)
+            self._size += len(data)
+
+            return
+
+        self._unflushed_size += len(data)
+        chunk = self._compressor.compress(data)
+
+        # Flush regularly and when the estimate reaches the target in order to know the actual compressed size
+        if self.target_size > 0 and (self._unflushed_size >= self.flush_size \
+            or self._size + len(chunk) + int(self._unflushed_size * self._ratio) >= self.target_size):
+            chunk += self._compressor.flush(self._flush_mode)
+
+            self._ratio = float(self._size + len(chunk)) / (self.raw_size or 1)
+            self._unflushed_size = 0
+
+        if chunk:
+            self._chunks.append(chunk)
+            self._size += len(chunk)
+
+
+class ColumnarPayloadBuilder(object):
+    """
+    Builds a compact payload by grouping entries by type and keys. Within each group timestamps are stored as a base
+    timestamp followed by integer deltas in microseconds, and values are stored column-wise.
+
+    Supported serializers are 'json' and 'msgpack' (requires the msgpack package).
+    Entries are encoded when the payload is closed, so the target size is compared against the raw size of the
+    appended entries, which is an upper bound of the encoded size.
+    """
+
+    FORMAT = "columnar"
+    VERSION = 1
+
+    TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+    def __init__(self, serializer="json", algorithm=None, level=1, target_size=0):
+        if serializer == "msgpack":
+            if not HAS_MSGPACK:
+                raise ValueError("Serializer 'msgpack' requires the msgpack package to be installed")
+        elif serializer != "json":
+            raise ValueError("Unsupported serializer '{:}'".format(serializer))
+
+        self.serializer = serializer
+        self.algorithm = algorithm
+        self.target_size = target_size
+        self.count = 0
+        self.raw_size = 0
+
+        self._groups = collections.OrderedDict()
+        self._seconds_cache = {}
+
+        self._compressor, _ = compressor_for(algorithm, level)
+
+    @property
+    def size(self):
+        """
+        Upper bound of the size of the payload when closed.
+        """
+
+        return self.raw_size
+
+    @property
+    def is_full(self):
+        return self.target_size > 0 and self.size >= self.target_size
+
+    def append(self, entry):
+        """
+        Appends a serialized entry. Returns False without appending if the payload is already full.
+        The first entry is always appended.
+        """
+
+        if self.count and self.is_full:
+            return False
+
+        data = json.loads(entry)
+
+        has_kind = "@t" in data
+        kind = data.pop("@t", None)
+        keys = tuple(sorted(data))
+
+        group = self._groups.get((has_kind, kind, keys), None)
+        if group == None:
+            group = {"n": 0, "cols": [[] for _ in keys]}
+            self._groups[(has_kind, kind, keys)] = group
+
+        for col, key in zip(group["cols"], keys):
+            col.append(data[key])
+        group["n"] += 1
+
+        self.raw_size += len(entry)
+        self.count += 1
+
+        return True
+
+    def close(self):
+        """
+        Finishes the payload and returns it.
+        """
+
+        groups = []
+        for (has_kind, kind, keys), group in self._groups.iteritems():
+            cols = group["cols"]
+            group = {
+                "n": group["n"],
+                "keys": [k for k in keys if k != "@ts"],
+                "cols": [c for k, c in zip(keys, cols) if k != "@ts"],
+            }
+
+            if has_kind:
+                group["@t"] = kind
+
+            if "@ts" in keys:
+                timestamps = cols[keys.index("@ts")]
+
+                deltas = self._deltas_for(timestamps)
+                if deltas != None:
+                    group["@ts"] = timestamps[0]
+                    group["dt"] = deltas
+                else:
+                    group["ts"] = timestamps
+
+            groups.append(group)
+
+        data = {
+            "format": self.FORMAT,
+            "version": self.VERSION,
+            "groups": groups,
+        }
+
+        if self.serializer == "msgpack":
+            payload = msgpack.packb(data, use_bin_type=True)
+        else:
+            payload = json_encoder.encode(data)
+
+        if self._compressor != None:
+            payload = self._compressor.compress(payload) + self._compressor.flush()
+            self._compressor = None
+
+        return payload
+
+    def _deltas_for(self, timestamps):
+        """
+        Gets deltas in microseconds between consecutive timestamps or None if a timestamp cannot be restored exactly from a delta.
+        """
+
+        ret = []
+
+        last = None
+        for timestamp in timestamps:
+            micros = self._micros_for(timestamp)
+            if micros == None:
+                return None
+
+            if last != None:
+                ret.append(micros - last)
+            last = micros
+
+        return ret
+
+    def _micros_for(self, timestamp):
+        """
+        Gets microseconds since epoch of an ISO 8601 timestamp as produced by 'datetime.isoformat'.
+        """
+
+        if not isinstance(timestamp, basestring):
+            return None
+
+        if len(timestamp) == 26 and timestamp[19] == "." and timestamp[20:].isdigit():
+            micros = int(timestamp[20:])
+            if micros == 0:
+                return None  # Will not be restored with trailing zeros
+        elif len(timestamp) == 19:
+            micros = 0
+        else:
+            return None
+
+        # Parsing is expensive so seconds are cached as there are typically many entries within the same second
+        seconds = self._seconds_cache.get(timestamp[:19], None)
+        if seconds == None:
+            try:
+                parsed = datetime.datetime.strptime(timestamp[:19], self.TIMESTAMP_FORMAT)
+            except ValueError:
+                return None
+
+            if parsed.isoformat() != timestamp[:19]:
+                return None
+
+            delta = parsed - EPOCH
+            seconds = delta.days * 86400 + delta.seconds
+
+            self._seconds_cache[timestamp[:19]] = seconds
+
+        return seconds * 1000000 + micros
+
+
+def decode_columnar_payload(payload, serializer="json", compression=None):
+    """
+    Decodes a payload built by 'ColumnarPayloadBuilder' back into a list of entries.
+
+    Order of entries is preserved within each group of entries with same type and keys.
+    """
+
+    if compression == "gzip":
+        payload = zlib.decompress(payload, 16 + zlib.MAX_WBITS)
+    elif compression == "deflate":
+        payload = zlib.decompress(payload, zlib.MAX_WBITS)
+    elif compression == "zstd":
+        payload = zstandard.ZstdDecompressor().decompressobj().decompress(payload)
+    elif compression != None:
+        raise ValueError("Unsupported compression algorithm '{:}'".format(compression))
+
+    if serializer == "msgpack":
+        data = msgpack.unpackb(payload, raw=False)
+    else:
+        data = json.loads(payload)
+
+    if data.get("format") != ColumnarPayloadBuilder.FORMAT or data.get("version") != ColumnarPayloadBuilder.VERSION:
+        raise ValueError("Unsupported payload format '{:}' version {:}".format(data.get("format"), data.get("version")))
+
+    ret = []
+    for group in data["groups"]:
+        count = group["n"]
+        keys = group["keys"]
+
+        timestamps = group.get("ts", None)
+        if "dt" in group:
+            timestamps = [group["@ts"]]
+
+            current = datetime.datetime.strptime(group["@ts"][:19], ColumnarPayloadBuilder.TIMESTAMP_FORMAT) \
+                + datetime.timedelta(microseconds=int(group["@ts"][20:] or 0))
+            for delta in group["dt"]:
+                current += datetime.timedelta(microseconds=delta)
+                timestamps.append(current.isoformat())
+
+        rows = zip(*group["cols"]) if keys else [()] * count
+        for index, row in enumerate(rows):
+            entry = dict(zip(keys, row))
+
+            if "@t" in group:
+                entry["@t"] = group["@t"]
+            if timestamps != None:
+                entry["@ts"] = timestamps[index]
+
+            ret.append(entry)
+
+    return ret
+
+
+class UploadController(object):
+    """
+    AIMD-style controller that adapts batch size, concurrency and delay between uploads to measured link conditions.
+
+    Each upload is measured by round-trip time, throughput and outcome. Successful uploads within
+    the maximum round-trip time grow the batch size and concurrency additively and shorten the delay,
+    whereas errors or high latency back off multiplicatively.
+    """
+
+    def __init__(self, batch_size=100, min_batch_size=10, max_batch_size=1000, batch_size_step=10, max_window=1, max_delay=60, delay_step=1, max_rtt=5.0, decrease_factor=0.5, smoothing=0.2):
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.batch_size_step = batch_size_step
+        self.max_window = max_window
+        self.max_delay = max_delay
+        self.delay_step = delay_step
+        self.max_rtt = max_rtt
+        self.decrease_factor = decrease_factor
+        self.smoothing = smoothing
+
+        # Controlled values
+        self.batch_size = max(min(batch_size, max_batch_size), min_batch_size)
+        self.window = 1
+        self.delay = 0.0
+
+        # Measured values (exponentially weighted moving averages)
+        self.rtt = None
+        self.throughput = None
+        self.error_rate = 0.0
+
+        self.uploads = 0
+        self.errors = 0
+        self.increases = 0
+        self.decreases = 0
+
+        self._lock = threading.RLock()
+
+    def record(self, duration, size, success):
+        """
+        Records measurements of a completed upload and adjusts controlled values accordingly.
+        """
+
+        with self._lock:
+            self.uploads += 1
+            self.error_rate = self._smooth(self.error_rate, 0.0 if success else 1.0)
+
+            if success:
+                self.rtt = self._smooth(self.rtt, duration)
+                self.throughput = self._smooth(self.throughput, size / max(duration, 0.001))
+            else:
+                self.errors += 1
+
+            if not success or duration > self.max_rtt:
+                self._decrease()
+            else:
+                self._increase()
+
+    def status(self):
+        with self._lock:
+            return {
+                "batch_size": self.batch_size,
+                "window": self.window,
+                "delay": self.delay,
+                "rtt": self.rtt,
+                "throughput": self.throughput,
+                "error_rate": self.error_rate,
+                "uploads": self.uploads,
+                "errors": self.errors,
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
+
+    def _smooth(self, average, value):
+        if average == None:
+            return value
+
+        return (1 - self.smoothing) * average + self.smoothing * value
+
+    def _increase(self):
+        self.batch_size = min(self.batch_size + self.batch_size_step, self.max_batch_size)
+        self.window = min(self.window + 1, self.max_window)
+        self.delay = max(self.delay - self.delay_step, 0.0)
+
+        self.increases += 1
+
+    def _decrease(self):
+        self.batch_size = max(int(self.batch_size * self.decrease_factor), self.min_batch_size)
+        self.window = max(int(self.window * self.decrease_factor), 1)
+        self.delay = min(max(self.delay / self.decrease_factor, self.delay_step), self.max_delay)
+
+        self.decreases += 1
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Backing off uploads to batch size {:}, window {:} and delay {:}".format(self.batch_size, self.window, self.delay))
+
+
 class CloudCache(object):
 
     DEQUEUE_BATCH_SCRIPT = "dequeue_batch"
@@ -109,15 +564,38 @@ class CloudCache(object):
     """
 
     PENDING_QUEUE     = "pend"
+    LANE_QUEUE        = "pend_{:}"
     RETRY_QUEUE       = "retr_{:%Y%m%d%H%M%S%f}_#{:d}"
     FAIL_QUEUE        = "fail_{:%Y%m%d}"
+    RETRY_PAYLOADS    = "payloads"  # Hash of compressed payloads of retry queues
     WORK_QUEUE        = "{:}.work"
 
     RETRY_QUEUE_REGEX  = re.compile("^(?P<type>.+)_(?P<timestamp>\d+)_#(?P<attempt>\d+)$")
     WORK_QUEUE_REGEX   = re.compile("\.work$")
+    ENTRY_TYPE_REGEX   = re.compile('"@t":"(?P<type>[^"]*)"')
+
+    EVICTED_TOMBSTONE  = "__evicted__"
 
     def __init__(self):
         self.upload_timer = None
+        self.session = None
+        self.session_key = None
+        self.session_lock = threading.RLock()
+        self.session_stats = {
+            "created": 0,
+            "requests": 0,
+            "connections": 0,  # Connections opened by closed sessions
+        }
+        self.persist_lock = threading.RLock()
+        self.persist_stats = {
+            "saves": 0,
+            "skipped": 0,
+            "failed": 0,
+            "unsaved": 0,  # Changed entries not yet persisted
+            "dirty": False,
+            "last_save": None,
+        }
+        self.persist_timer = timer()
 
     def setup(self, **options):
         self.options = options
@@ -134,10 +612,157 @@ class CloudCache(object):
             self.DEQUEUE_BATCH_SCRIPT: self.client.register_script(self.DEQUEUE_BATCH_LUA)
         }
 
+        # Setup priority lanes where the pending queue is the default lane for types not matching any other
+        self.lane_types = [(self.LANE_QUEUE.format(l["name"]), l.get("types", [])) for l in options.get("lanes", [])]
+        self.lane_weights = collections.OrderedDict(sorted(
+            [(self.LANE_QUEUE.format(l["name"]), l.get("weight", 1)) for l in options.get("lanes", [])] + [(self.PENDING_QUEUE, options.get("default_lane_weight", 1))],
+            key=lambda l: l[1], reverse=True))  # Highest weight first
+        self.lane_cache = {}
+
+        # Setup adaptive upload controller if enabled
+        self.controller = None
+        if options.get("adaptive", {}).get("enabled", False):
+            self.controller = UploadController(batch_size=options.get("max_batch_size", 100),
+                **{k: v for k, v in options["adaptive"].iteritems() if k != "enabled"})
+
+        # Setup payload format where 'array' is a plain JSON array of entries
+        self.payload_format = options.get("payload", {}).get("format", "array")
+        self.payload_serializer = options.get("payload", {}).get("serializer", "json")
+        if self.payload_format not in ["array", "columnar"] or self.payload_serializer not in ["json", "msgpack"] \
+            or self.payload_format == "array" and self.payload_serializer != "json" \
+            or self.payload_serializer == "msgpack" and not HAS_MSGPACK:
+            log.warning("Unsupported payload format '{:}' with serializer '{:}' configured - using JSON array".format(self.payload_format, self.payload_serializer))
+
+            self.payload_format = "array"
+            self.payload_serializer = "json"
+
         return self
 
+    def _batch_size(self):
+        if self.controller != None:
+            return self.controller.batch_size
+
+        return self.options.get("max_batch_size", 100)
+
+    def _window_for(self, window):
+        """
+        Gets number of concurrent uploads bounded by the given window.
+        """
+
+        if self.controller != None:
+            return min(self.controller.window, window)
+
+        return window
+
+    def _queue_for(self, kind):
+        """
+        Gets lane queue for the given entry type.
+        """
+
+        ret = self.lane_cache.get(kind, None)
+        if ret == None:
+            ret = next((q for q, t in self.lane_types if any(fnmatch.fnmatch(kind or "", p) for p in t)), self.PENDING_QUEUE)
+
+            self.lane_cache[kind] = ret
+
+        return ret
+
     def enqueue(self, data):
-        self.client.lpush(self.PENDING_QUEUE, json.dumps(data, separators=(",", ":")))
+        self.client.lpush(self._queue_for(data.get("@t", None)), json_encoder.encode(data))
+
+    def enqueue_many(self, entries, serialized=False, chunk_size=1000):
+        """
+        Enqueues multiple entries using variadic LPUSH commands sent in a single pipeline.
+        Order is the same as if each entry was enqueued one by one.
+        """
+
+        if not entries:
+            return 0
+
+        # Group entries by lane queue
+        if self.lane_types:
+            queues = collections.OrderedDict()
+            for entry in entries:
+                if serialized:
+                    match = self.ENTRY_TYPE_REGEX.search(entry)
+                    queue = self._queue_for(match.group("type") if match else None)
+                else:
+                    queue = self._queue_for(entry.get("@t", None))
+                    entry = json_encoder.encode(entry)
+
+                queues.setdefault(queue, []).append(entry)
+        else:
+            queues = {
+                self.PENDING_QUEUE: entries if serialized else [json_encoder.encode(e) for e in entries]
+            }
+
+        if len(queues) == 1 and len(entries) <= chunk_size:
+            for queue, serialized_entries in queues.iteritems():
+                self.client.lpush(queue, *serialized_entries)
+        else:
+            pipe = self.client.pipeline(transaction=False)
+            for queue, serialized_entries in queues.iteritems():
+                for idx in range(0, len(serialized_entries), chunk_size):
+                    pipe.lpush(queue, *serialized_entries[idx:idx + chunk_size])
+            pipe.execute()
+
+        return len(entries)
+
+    def _persist_if_due(self, count=0):
+        """
+        Registers a change of the given number of entries and persists if due according to the persistence policy.
+
+        Saves are coalesced to at most one BGSAVE per interval or per threshold of changed entries,
+        because every BGSAVE forks Redis and rewrites the entire dump to the SD card.
+        """
+
+        options = self.options.get("persistence", {})
+
+        with self.persist_lock:
+            self.persist_stats["unsaved"] += count
+            self.persist_stats["dirty"] = True
+
+            if timer() - self.persist_timer >= options.get("interval", 60) \
+                or self.persist_stats["unsaved"] >= options.get("threshold", 1000):
+                return self.persist()
+
+            self.persist_stats["skipped"] += 1
+
+            return False
+
+    def persist(self):
+        """
+        Persists any unsaved changes immediately using a background save.
+        """
+
+        with self.persist_lock:
+            if not self.persist_stats["dirty"]:
+                return False
+
+            try:
+                self.client.bgsave()
+            except redis.exceptions.ResponseError as rex:
+                log.warning("Unable to start background save of cache: {:}".format(rex))
+
+                self.persist_stats["failed"] += 1
+
+                return False
+
+            self.persist_timer = timer()
+            self.persist_stats["saves"] += 1
+            self.persist_stats["unsaved"] = 0
+            self.persist_stats["dirty"] = False
+            self.persist_stats["last_save"] = datetime.datetime.utcnow().isoformat()
+
+            return True
+
+    def persistence_status(self):
+        """
+        Gets counters of performed and skipped background saves.
+        """
+
+        with self.persist_lock:
+            return self.persist_stats.copy()
 
     def _dequeue_batch(self, source, destination, count):
         start = timer()
@@ -162,6 +787,209 @@ class CloudCache(object):
     def clear_queue(self, name):
         return bool(self.client.delete(name))
 
+    def usage(self, sample_size=10):
+        """
+        Gets estimated usage of pending, retry and fail queues. Byte sizes are estimated from a sample of entries in each queue.
+        """
+
+        ret = {
+            "entries": 0,
+            "bytes": 0,
+            "queues": collections.OrderedDict(),
+        }
+
+        # Oldest queues first followed by lanes with lowest priority first
+        queues = self.list_queues(pattern="fail_*") + self.list_queues(pattern="retr_*") + list(reversed(self.lane_weights))
+
+        pipe = self.client.pipeline(transaction=False)
+        for queue in queues:
+            pipe.llen(queue)
+            pipe.lrange(queue, -sample_size, -1)
+        res = pipe.execute()
+
+        for idx, queue in enumerate(queues):
+            count, sample = res[idx * 2], res[idx * 2 + 1]
+            if not count:
+                continue
+
+            size = count * sum(len(e) for e in sample) / len(sample)
+
+            ret["queues"][queue] = {
+                "entries": count,
+                "bytes": size,
+            }
+            ret["entries"] += count
+            ret["bytes"] += size
+
+        return ret
+
+    def enforce_budget(self):
+        """
+        Evicts entries from pending, retry and fail queues if the configured cache budget is exceeded.
+
+        Supported eviction policies:
+          - 'oldest':     Drop oldest entries first.
+          - 'priority':   Drop entries with lowest type priority first, oldest first within same priority.
+          - 'downsample': Drop all but every n'th entry of high rate types, oldest first.
+
+        Oldest entries are always dropped as a last resort if the budget is still exceeded.
+        """
+
+        ret = {
+            "total": 0,
+        }
+
+        options = self.options.get("budget", {})
+        max_entries = options.get("max_entries", 0)
+        max_bytes = options.get("max_bytes", 0)
+        if not max_entries and not max_bytes:
+            return ret
+
+        usage = self.usage()
+
+        # Determine number of entries to evict
+        excess = 0
+        if max_entries and usage["entries"] > max_entries:
+            excess = usage["entries"] - max_entries
+        if max_bytes and usage["bytes"] > max_bytes:
+            avg_size = float(usage["bytes"]) / usage["entries"]
+            excess = max(excess, int((usage["bytes"] - max_bytes) / avg_size) + 1)
+
+        if excess <= 0:
+            return ret
+
+        policy = options.get("policy", "oldest")
+        log.warning("Cache budget exceeded with {:} entries and {:} bytes - evicting {:} entries using policy '{:}'".format(usage["entries"], usage["bytes"], excess, policy))
+
+        ret["policy"] = policy
+
+        queues = list(usage["queues"])
+        if policy == "priority":
+            self._evict_by_priority(queues, excess, ret)
+        elif policy == "downsample":
+            self._evict_by_downsampling(queues, excess, ret)
+        elif policy != "oldest":
+            log.warning("Unsupported eviction policy '{:}' configured - dropping oldest entries instead".format(policy))
+
+        if ret["total"] < excess:
+            self._evict_oldest(queues, excess - ret["total"], ret)
+
+        self._persist_if_due(ret["total"])
+
+        return ret
+
+    def _evict_oldest(self, queues, count, ret):
+        for queue in queues:
+            if count <= 0:
+                break
+
+            n = min(self.client.llen(queue), count)
+            if not n:
+                continue
+
+            # Entries pushed meanwhile are kept because trim is relative to the tail
+            self.client.ltrim(queue, 0, -(n + 1))
+            self._discard_cached_batch(queue)
+
+            ret.setdefault("queues", {})[queue] = ret.get("queues", {}).get(queue, 0) + n
+            ret["total"] += n
+
+            count -= n
+
+    def _evict_by_priority(self, queues, count, ret):
+        options = self.options.get("budget", {})
+        priorities = options.get("priorities", {})
+        default_priority = options.get("default_priority", 1)
+
+        cache = {}
+        def priority_for(kind):
+            if kind not in cache:
+                cache[kind] = next((v for k, v in priorities.iteritems() if fnmatch.fnmatch(kind or "", k)), default_priority)
+
+            return cache[kind]
+
+        for level in sorted(set(priorities.values() + [default_priority])):
+            for queue in queues:
+                if ret["total"] >= count:
+                    return
+
+                self._evict_matching(queue, lambda kind: priority_for(kind) == level, count - ret["total"], ret)
+
+    def _evict_by_downsampling(self, queues, count, ret):
+        options = self.options.get("budget", {})
+        types = options.get("downsample_types", ["*"])
+        factor = max(options.get("downsample_factor", 2), 2)
+
+        counters = {}
+        def should_evict(kind):
+            if not any(fnmatch.fnmatch(kind or "", t) for t in types):
+                return False
+
+            # Keep every n'th entry of type
+            counters[kind] = counters.get(kind, 0) + 1
+
+            return (counters[kind] - 1) % factor != 0
+
+        for queue in queues:
+            if ret["total"] >= count:
+                return
+
+            self._evict_matching(queue, should_evict, count - ret["total"], ret)
+
+    def _evict_matching(self, queue, match_func, count, ret, chunk_size=1000):
+        """
+        Scans queue starting from the oldest entry and evicts entries of types accepted by the match function until count is reached.
+        """
+
+        evicted = 0
+        offset = 0  # Relative to tail which is not affected by entries pushed meanwhile
+
+        while evicted < count:
+            chunk = self.client.lrange(queue, -(offset + chunk_size), -(offset + 1))
+            if not chunk:
+                break
+
+            pipe = self.client.pipeline()
+            marked = 0
+            for idx in range(len(chunk) - 1, -1, -1):  # Oldest first
+                match = self.ENTRY_TYPE_REGEX.search(chunk[idx])
+                kind = match.group("type") if match else None
+                if not match_func(kind):
+                    continue
+
+                # Replace entry with tombstone to be removed afterwards
+                pipe.lset(queue, idx - (offset + len(chunk)), self.EVICTED_TOMBSTONE)
+                marked += 1
+
+                ret.setdefault("types", {})[kind] = ret.get("types", {}).get(kind, 0) + 1
+
+                if evicted + marked >= count:
+                    break
+
+            if marked:
+                pipe.lrem(queue, 0, self.EVICTED_TOMBSTONE)
+                pipe.execute()
+                self._discard_cached_batch(queue)
+
+                ret.setdefault("queues", {})[queue] = ret.get("queues", {}).get(queue, 0) + marked
+                ret["total"] += marked
+                evicted += marked
+
+            if len(chunk) < chunk_size:
+                break
+
+            offset += len(chunk) - marked
+
+        return evicted
+
+    def _discard_cached_batch(self, queue):
+        """
+        Discards any batch read and cached for a later upload attempt from the given queue. Must be called whenever
+        entries are removed from the tail of the queue by other means than uploading the cached batch.
+        """
+
+        pass
+
     def clear_everything(self, confirm=False):
         if not confirm:
             raise Exception("You are about to flush all cache queues - add parameter 'confirm=True' to continue anyway")
@@ -169,28 +997,45 @@ class CloudCache(object):
         return self.client.flushdb()
 
     def _prepare_payload_for(self, batch):
-        payload = "[{:s}]".format(",".join(batch))
+        payload, compression, _ = self._build_payload_for(batch)
+
+        return payload, compression
+
+    def _build_payload_for(self, batch, target_size=0):
+        """
+        Builds payload from the given serialized entries, compressing them as they are appended.
+
+        Returns tuple of payload, compression and the count of entries included in the payload.
+        """
+
         compression = None
+        level = 1
 
         if "compression" in self.options:
             compression = self.options["compression"]["algorithm"]
-            log.info("Compressing data using {} with level {}".format(compression, self.options["compression"].get("level", 1)))
-            if compression == "gzip":
-                start = timer()
+            level = self.options["compression"].get("level", 1)
 
-                buffer = StringIO.StringIO()
-                with gzip.GzipFile(fileobj=buffer, mode="wt", compresslevel=self.options["compression"].get("level", 1)) as gf:
-                   gf.write(payload)
+            if compression not in ["gzip", "deflate", "zstd"] or compression == "zstd" and not HAS_ZSTD:
+                log.warning("Unsupported compression algorithm '{:}' configured - skipping compression".format(compression))
 
-                compressed_payload = buffer.getvalue()
-                
-                log.info("Compressed payload with size {:} to {:} in {:} second(s)".format(len(payload), len(compressed_payload), timer() - start))
+                compression = None
 
-                payload = compressed_payload
-            else:
-                log.warning("Unsupported compression algorithm configured - skipping compression")
+        start = timer()
 
-        return payload, compression
+        if self.payload_format == "columnar":
+            builder = ColumnarPayloadBuilder(serializer=self.payload_serializer, algorithm=compression, level=level, target_size=target_size)
+        else:
+            builder = PayloadBuilder(algorithm=compression, level=level, target_size=target_size)
+        for entry in batch:
+            if not builder.append(entry):
+                break
+
+        payload = builder.close()
+
+        if compression:
+            log.info("Compressed payload with {:} entries and size {:} to {:} using {:} with level {:} in {:} second(s)".format(builder.count, builder.raw_size, len(payload), compression, level, timer() - start))
+
+        return payload, compression, builder.count
 
     def _upload(self, payload, compression=None, endpoint=None, splay_factor=1):
         endpoint = endpoint or self.options.get("endpoint", {})
@@ -199,7 +1044,10 @@ class CloudCache(object):
 
             return False, "No cloud endpoint configured"
 
-        delay = random.randint(0, self.options.get("upload_splay", 10)) * splay_factor
+        if self.controller != None:
+            delay = self.controller.delay * splay_factor
+        else:
+            delay = random.randint(0, self.options.get("upload_splay", 10)) * splay_factor
         if self.upload_timer != None and timer() - self.upload_timer < delay:
             if splay_factor > 1:
                 log.warning("Enforcing increased (by factor {:}) repeated upload delay of {:} seconds...".format(splay_factor, delay))
@@ -211,31 +1059,132 @@ class CloudCache(object):
 
         headers = {
             "authorization": "token {:}".format(endpoint.get("auth_token")),
-            "content-type": "application/json"
+            "content-type": "application/msgpack" if self.payload_serializer == "msgpack" else "application/json"
         }
 
+        # Let the endpoint know how to decode payload when not a plain array of entries
+        if self.payload_format != "array":
+            headers["payload-format"] = "{:}/{:d}".format(self.payload_format, ColumnarPayloadBuilder.VERSION)
+
+        # Set correct content encoding when compressed
         if compression:
             headers.update({ "content-encoding": compression })
 
         if "unit_id" in self.options:
             headers["unit-id"] = self.options["unit_id"]
 
-        # Set correct content encoding when compression is enabled
-        if "compression" in self.options:
-            headers["content-encoding"] = self.options["compression"]["algorithm"]
+        session_options = self.options.get("session", {})
+        timeout = (
+            session_options.get("connect_timeout", endpoint.get("timeout", 10)),
+            session_options.get("read_timeout", endpoint.get("timeout", 10))
+        )
 
+        start = timer()
         try:
-            res = requests.post(endpoint.get("url"), data=payload, headers=headers, timeout=endpoint.get("timeout", 10))
+            res = self._session_for(endpoint).post(endpoint.get("url"), data=payload, headers=headers, timeout=timeout)
         except Exception as ex:
+            if self.controller != None:
+                self.controller.record(timer() - start, len(payload), False)
+
+            # Connection might be broken so start over with a fresh session on next upload
+            if isinstance(ex, ConnectionError):
+                self.close_session()
+
             return False, str(ex)
         finally:
             self.upload_timer = timer()
 
+        if self.controller != None:
+            self.controller.record(self.upload_timer - start, len(payload), res.ok)
+
         # All non 2xx status codes will fail
         res.raise_for_status()
 
         return True, None
 
+    def _session_for(self, endpoint):
+        """
+        Gets long-lived HTTP session with keep-alive and connection pooling for the given endpoint.
+        The session is recreated if the endpoint has changed.
+        """
+
+        key = (endpoint.get("url"), endpoint.get("auth_token"))
+
+        with self.session_lock:
+            if self.session != None and self.session_key != key:
+                log.info("Cloud endpoint has changed - recreating HTTP session")
+
+                self.close_session()
+
+            if self.session == None:
+                pool_size = self.options.get("session", {}).get("pool_size", 4)
+
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("Creating HTTP session with pool size {:}".format(pool_size))
+
+                session = requests.Session()
+                for prefix in ["https://", "http://"]:
+                    session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+                self.session = session
+                self.session_key = key
+                self.session_stats["created"] += 1
+
+            self.session_stats["requests"] += 1
+
+            return self.session
+
+    def _connection_count_for(self, session):
+        ret = 0
+
+        for adapter in session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool != None:
+                    ret += pool.num_connections
+
+        return ret
+
+    def close_session(self):
+        """
+        Closes current HTTP session if any.
+        """
+
+        with self.session_lock:
+            if self.session == None:
+                return False
+
+            self.session_stats["connections"] += self._connection_count_for(self.session)
+
+            try:
+                self.session.close()
+            except:
+                log.exception("Failed to close HTTP session")
+
+            self.session = None
+            self.session_key = None
+
+            return True
+
+    def session_status(self):
+        """
+        Gets reuse counters of the HTTP session.
+        """
+
+        with self.session_lock:
+            connections = self.session_stats["connections"]
+            if self.session != None:
+                connections += self._connection_count_for(self.session)
+
+            return {
+                "active": self.session != None,
+                "created": self.session_stats["created"],
+                "requests": self.session_stats["requests"],
+                "connections": connections,
+                "reused": max(self.session_stats["requests"] - connections, 0),
+            }
+
     def _upload_batch(self, queue):
         ret = {
             "count": 0
@@ -245,13 +1194,18 @@ class CloudCache(object):
         work_queue = self.WORK_QUEUE.format(source_queue)
 
         # Pop next batch into work queue
-        batch = self._dequeue_batch(source_queue, work_queue, self.options.get("max_batch_size", 100))
+        batch_size = self._batch_size()
+        batch = self._dequeue_batch(source_queue, work_queue, batch_size)
         if not batch:
             if log.isEnabledFor(logging.DEBUG):
                 log.debug("No batch found to upload from queue '{:}'".format(queue))
 
             return ret
 
+        # Signal that upload of next batch should continue on success
+        if len(batch) >= batch_size:
+            ret["continue"] = True
+
         # Upload batch
         payload, compression = self._prepare_payload_for(batch)
         ok, msg = self._upload(payload, compression)  # Remember this call will raise exception upon server error
@@ -261,10 +1215,8 @@ class CloudCache(object):
             ret["count"] = len(batch)
 
             # Batch uploaded equals work completed
-            self.client.pipeline() \
-                .delete(work_queue) \
-                .bgsave() \
-                .execute()
+            self.client.delete(work_queue)
+            self._persist_if_due(len(batch))
         else:
             log.warning("Temporarily unable to upload batch with {:} entries from queue '{:}': {:}".format(len(batch), queue, msg))
 
@@ -272,20 +1224,32 @@ class CloudCache(object):
 
         return ret
 
-    def _upload_batch_continuing(self, queue):
+    def _upload_batch_continuing(self, queue, window=1, max_batches=0):
         ret = {
             "count": 0
         }
 
+        if window > 1:
+            log.warning("Pipelined upload is not supported by this cache - uploading batches one at a time")
+
         res = self._upload_batch(queue)  # Remember this call will raise exception upon server error
+        batches = 1
 
         ret["count"] = res["count"]
         if "error" in res:
             ret["error"] = res["error"]
 
         # Continue to upload if more pending batches present
-        while not "error" in res and (res["count"] == self.options.get("max_batch_size", 100) or res.get("continue", False)):
+        while not "error" in res and res.get("continue", False):
+
+            # Signal that more batches might be present when max batch count is reached
+            if max_batches and batches >= max_batches:
+                ret["more"] = True
+
+                break
+
             res = self._upload_batch(queue)  # Remember this call will raise exception upon server error
+            batches += 1
 
             ret["count"] += res["count"]
             if "error" in res:
@@ -293,7 +1257,7 @@ class CloudCache(object):
 
         return ret
 
-    def upload_failing(self):
+    def upload_failing(self, window=1):
         ret = {
             "total": 0,
         }
@@ -304,7 +1268,7 @@ class CloudCache(object):
 
         try:
             for queue in queues:
-                res = self._upload_batch_continuing(queue)  # Remember this call will raise exception upon server error
+                res = self._upload_batch_continuing(queue, window=window)  # Remember this call will raise exception upon server error
                 ret["total"] += res["count"]
 
                 # Stop upon first error
@@ -320,13 +1284,13 @@ class CloudCache(object):
 
         return ret
 
-    def upload_pending(self):
+    def upload_pending(self, window=1):
         ret = {
             "total": 0,
         }
 
         try:
-            res = self._upload_batch_continuing(self.PENDING_QUEUE)  # Remember this call will raise exception upon server error
+            res = self._upload_batch_continuing(self.PENDING_QUEUE, window=window)  # Remember this call will raise exception upon server error
             ret["total"] += res["count"]
 
             if "error" in res:
@@ -343,64 +1307,181 @@ class CloudCache(object):
                 retry_queue = self.RETRY_QUEUE.format(datetime.datetime.utcnow(), 0)
                 log.warning("Failed to upload pending batch - transferring to new dedicated retry queue '{:}': {:}".format(retry_queue, rex))
 
-                self.client.pipeline() \
-                    .renamenx(work_queue, retry_queue) \
-                    .bgsave() \
-                    .execute()
+                self.client.renamenx(work_queue, retry_queue)
+                self._persist_if_due()
 
             else:
                 log.warning("Failed to upload pending batch - leaving batch in queue '{:}': {:}".format(work_queue, rex))
 
         return ret
 
-    def upload_retrying(self):
+    def _retry_payload_field_for(self, match):
+        return "{:s}_{:s}".format(match.group("type"), match.group("timestamp"))  # Without attempt count
+
+    def _retry_payload_for(self, queue, field, count):
+        """
+        Gets payload for retry queue from cache if present and still valid, otherwise it is prepared and cached.
+        """
+
+        encoding = "{:}+{:}".format(self.payload_format, self.payload_serializer)
+
+        cached = self.client.hget(self.RETRY_PAYLOADS, field)
+        if cached != None:
+            cached_encoding, compression, cached_count, payload = (cached.split("|", 3) + [None] * 3)[:4]
+
+            # Also invalidate payloads cached before a change of payload format
+            if cached_encoding == encoding and cached_count == str(count):
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("Using cached payload for retry queue '{:}'".format(queue))
+
+                return payload, compression or None
+
+            log.info("Cached payload for retry queue '{:}' is no longer valid".format(queue))
+
+        payload, compression = self._prepare_payload_for(self.client.lrange(queue, 0, -1))
+        self.client.hset(self.RETRY_PAYLOADS, field, "{:}|{:}|{:d}|{:}".format(encoding, compression or "", count, payload))
+
+        return payload, compression
+
+    def _split_retry_queues(self, queues, origins=None):
+        """
+        Splits oversized retry queues into multiple retry queues of bounded size. Optionally records the original retry queue of each chunk in the given dict.
+        """
+
+        ret = []
+
+        # By default only split queues larger than any batch that can be transferred into a retry queue
+        chunk_size = self.options.get("retry_chunk_size",
+            self.controller.max_batch_size if self.controller != None else self.options.get("max_batch_size", 100))
+
+        # Timestamps must be unique regardless of attempt count
+        existing = set(m.group("timestamp") for m in [self.RETRY_QUEUE_REGEX.match(q) for q in queues] if m)
+
+        for queue in queues:
+            match = self.RETRY_QUEUE_REGEX.match(queue)
+            count = self.client.llen(queue) if match else 0
+            if count <= chunk_size:
+                ret.append(queue)
+
+                continue
+
+            log.warning("Splitting retry queue '{:}' with {:} entries into chunks of {:} entries".format(queue, count, chunk_size))
+
+            # Chunks get consecutive timestamps to retain order
+            timestamp = datetime.datetime.strptime(match.group("timestamp"), "%Y%m%d%H%M%S%f")
+            attempt = int(match.group("attempt"))
+
+            # Original queue is deleted first within same transaction so its name can be reused by first chunk
+            existing.discard(match.group("timestamp"))
+            pipe = self.client.pipeline() \
+                .delete(queue) \
+                .hdel(self.RETRY_PAYLOADS, self._retry_payload_field_for(match))
+
+            for idx in range(0, count, chunk_size):
+                while "{:%Y%m%d%H%M%S%f}".format(timestamp) in existing:
+                    timestamp += datetime.timedelta(microseconds=1)
+                chunk_queue = self.RETRY_QUEUE.format(timestamp, attempt)
+
+                pipe.rpush(chunk_queue, *self.client.lrange(queue, idx, idx + chunk_size - 1))
+
+                existing.add("{:%Y%m%d%H%M%S%f}".format(timestamp))
+                ret.append(chunk_queue)
+
+                if origins != None:
+                    origins[chunk_queue] = queue
+
+            pipe.execute()
+
+        return sorted(ret)
+
+    def upload_retrying(self, window=1):
         ret = {
             "total": 0,
         }
 
         queue_limit = self.options.get("retry_queue_limit", 10)
 
+        origins = {}  # Original retry queue by chunk
         queues = self.list_queues(pattern="retr_*")
         if queues:
             log.warning("Found {:}/{:} retry queue(s)".format(len(queues), queue_limit))
 
+            queues = self._split_retry_queues(queues, origins=origins)
+
+        # Remove cached payloads of retry queues that no longer exist
+        fields = set(self.client.hkeys(self.RETRY_PAYLOADS))
+        if fields:
+            obsolete_fields = fields - set(self._retry_payload_field_for(m) for m in [self.RETRY_QUEUE_REGEX.match(q) for q in queues] if m)
+            if obsolete_fields:
+                self.client.hdel(self.RETRY_PAYLOADS, *obsolete_fields)
+
         remaining_count = len(queues)
-        for queue in queues:
+        remaining = set(queues)
+        in_flight = collections.deque()
+        stop = False
+        unexpected_exception = None
 
-            match = self.RETRY_QUEUE_REGEX.match(queue)
-            if not match:
-                log.error("Failed to match retry queue name '{:}'".format(queue))
+        queues = collections.deque(queues)
+        while in_flight or (queues and not stop):
 
-                continue
+            # Fill up window with retry queue uploads
+            while len(in_flight) < self._window_for(window) and queues and not stop:
+                queue = queues.popleft()
+
+                match = self.RETRY_QUEUE_REGEX.match(queue)
+                if not match:
+                    log.error("Failed to match retry queue name '{:}'".format(queue))
+
+                    continue
+
+                field = self._retry_payload_field_for(match)
+                count = self.client.llen(queue)
+                payload, compression = self._retry_payload_for(queue, field, count)
+
+                # Repeated upload delay is only enforced once per pipelined run
+                thread = threading_more.ReturnThread(target=self._upload, args=(payload, ),
+                    kwargs={"compression": compression, "splay_factor": remaining_count if window <= 1 or not (in_flight or ret["total"]) else 0})
+                thread.daemon = True
+                thread.start()
+
+                in_flight.append((queue, match, field, count, thread))
+
+            if not in_flight:
+                break
+
+            # Handle results in order
+            queue, match, field, count, thread = in_flight.popleft()
+            res = thread.join()
 
             attempt = int(match.group("attempt")) + 1
-            entries = self.client.lrange(queue, 0, -1)
-            payload, compression = self._prepare_payload_for(entries)
 
-            # Retry upload
-            try:
-                ok, msg = self._upload(payload, compression=compression, splay_factor=remaining_count)  # Remember this call will raise exception upon server error
+            if thread.exception == None:
+                ok, msg = res
                 if ok:
-                    log.info("Sucessfully uploaded retry queue '{:}' with {:} entries".format(queue, len(entries)))
+                    log.info("Sucessfully uploaded retry queue '{:}' with {:} entries".format(queue, count))
 
                     self.client.pipeline() \
                         .delete(queue) \
-                        .bgsave() \
+                        .hdel(self.RETRY_PAYLOADS, field) \
                         .execute()
+                    self._persist_if_due(count)
 
-                    ret["total"] += len(entries)
+                    ret["total"] += count
 
                     remaining_count -= 1
+                    remaining.discard(queue)
                 else:
                     log.warning("Temporarily unable to upload retry queue(s) - skipping remaining if present: {:}".format(msg))
 
                     ret.setdefault("errors", []).append(msg)
 
                     # No reason to continue trying
-                    break
+                    stop = True
 
             # Only retry upon server error
-            except RequestException as rex:
+            elif isinstance(thread.exception, RequestException):
+                rex = thread.exception
+
                 ret.setdefault("errors", []).append(str(rex))
 
                 max_retry = self.options.get("max_retry", 10)
@@ -411,23 +1492,33 @@ class CloudCache(object):
                     fail_queue = self.FAIL_QUEUE.format(datetime.datetime.utcnow())
                     log.warning("Max retry attempt reached for queue '{:}' - transferring to fail queue '{:}'".format(queue, fail_queue))
 
+                    entries = self.client.lrange(queue, 0, -1)
                     self.client.pipeline() \
                         .lpush(fail_queue, *entries) \
                         .expire(fail_queue, self.options.get("fail_ttl", 604800)) \
                         .delete(queue) \
-                        .bgsave() \
+                        .hdel(self.RETRY_PAYLOADS, field) \
                         .execute()
+                    self._persist_if_due(len(entries))
 
                 else:
 
-                    # Update attempt count in queue name
-                    self.client.pipeline() \
-                        .renamenx(queue, re.sub("_#\d+$", "_#{:}".format(attempt), queue)) \
-                        .bgsave() \
-                        .execute()
+                    # Update attempt count in queue name (cached payload is kept)
+                    self.client.renamenx(queue, re.sub("_#\d+$", "_#{:}".format(attempt), queue))
+                    self._persist_if_due()
+
+            else:
+                log.error("Failed to upload retry queue '{:}' due to an unexpected error: {:}".format(queue, thread.exception))
 
-        # Signal if we have reached queue limit
-        ret["is_overrun"] = remaining_count >= queue_limit
+                unexpected_exception = unexpected_exception or thread.exception
+                stop = True
+
+        # Unexpected errors are propagated once all uploads in flight are handled
+        if unexpected_exception:
+            raise unexpected_exception
+
+        # Signal if we have reached queue limit (chunks of split queues count as their original queue)
+        ret["is_overrun"] = len(set(origins.get(q, q) for q in remaining)) >= queue_limit
 
         return ret
 
@@ -444,31 +1535,71 @@ class NextCloudCache(CloudCache):
     def _dequeue_batch(self, *args, **kwargs):
         raise Exception("Not supported")
 
-    def _upload_batch(self, queue):
-        ret = {
-            "count": 0
-        }
+    def _discard_cached_batch(self, queue):
+        if self.upload_cache.pop(queue, None) != None:
+            log.info("Discarded cached batch for queue '{:}' because entries have been evicted from it".format(queue))
 
-        compression = None
+    def _read_batch(self, queue, offset=0):
+        """
+        Reads next batch from the tail of the queue, skipping the given number of entries already read.
 
-        # First check for cached batch
-        batch_reversed, payload = self.upload_cache.pop(queue, (None, None))
-        if batch_reversed:
-            log.info("Found cached batch with {:} entries for queue '{:}'".format(len(batch_reversed), queue))
+        Returns tuple of reversed batch, payload, compression and whether more entries may follow.
+        """
 
-            # Signal that upload of next batch should continue on success (needed because max batch size might not be met)
-            ret["continue"] = True
+        # First check for cached batch (only valid at the very tail of the queue)
+        if offset == 0:
+            batch_reversed, payload, compression = self.upload_cache.pop(queue, (None, None, None))
+            if batch_reversed:
+                log.info("Found cached batch with {:} entries for queue '{:}'".format(len(batch_reversed), queue))
+
+                return batch_reversed, payload, compression, True
 
         # Otherwise pull new batch from queue
-        else:
-            batch_reversed = self.client.lrange(queue, -self.options.get("max_batch_size", 100), -1)
-            if not batch_reversed:
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug("No batch found to upload from queue '{:}'".format(queue))
+        batch_size = self._batch_size()
+        batch_reversed = self.client.lrange(queue, -(offset + batch_size), -(offset + 1))
+        if not batch_reversed:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("No batch found to upload from queue '{:}'".format(queue))
+
+            return batch_reversed, None, None, False
+
+        payload, compression, count = self._build_payload_for(reversed(batch_reversed), target_size=self.options.get("target_payload_size", 0))
+
+        # Only keep the oldest entries that made it into the payload
+        if count < len(batch_reversed):
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Target payload size reached after {:}/{:} entries from queue '{:}'".format(count, len(batch_reversed), queue))
+
+            return batch_reversed[-count:], payload, compression, True
+
+        return batch_reversed, payload, compression, len(batch_reversed) >= batch_size
+
+    def _transfer_to_retry_queue(self, queue, batch_reversed, reason):
+        """
+        Moves a batch from the tail of the queue into a new dedicated retry queue.
+        """
 
-                return ret
+        retry_queue = self.RETRY_QUEUE.format(datetime.datetime.utcnow(), 0)
+        log.warning("Failed to upload pending batch - transferring to new dedicated retry queue '{:}': {:}".format(retry_queue, reason))
 
-            payload, compression = self._prepare_payload_for(reversed(batch_reversed))
+        self.client.pipeline() \
+            .lpush(retry_queue, *batch_reversed) \
+            .ltrim(queue, 0, -(len(batch_reversed) + 1)) \
+            .execute()
+        self._persist_if_due(len(batch_reversed))
+
+    def _upload_batch(self, queue):
+        ret = {
+            "count": 0
+        }
+
+        batch_reversed, payload, compression, more = self._read_batch(queue)
+        if not batch_reversed:
+            return ret
+
+        # Signal that upload of next batch should continue on success
+        if more:
+            ret["continue"] = True
 
         # Try upload batch payload
         try:
@@ -478,34 +1609,25 @@ class NextCloudCache(CloudCache):
 
                 ret["count"] = len(batch_reversed)
 
-                # Remove batch entries from queue and persist immediately
-                self.client.pipeline() \
-                    .ltrim(queue, 0, -(len(batch_reversed) + 1)) \
-                    .bgsave() \
-                    .execute()
+                # Remove batch entries from queue
+                self.client.ltrim(queue, 0, -(len(batch_reversed) + 1))
+                self._persist_if_due(len(batch_reversed))
 
             else:
                 log.warning("Temporarily unable to upload batch with {:} entries from queue '{:}': {:}".format(len(batch_reversed), queue, msg))
 
                 # Put batch into upload cache
-                self.upload_cache[queue] = (batch_reversed, payload)
+                self.upload_cache[queue] = (batch_reversed, payload, compression)
 
                 ret["error"] = msg
 
-        # Only pending queue support retry upon server error
+        # Only pending lane queues support retry upon server error
         except RequestException as rex:
 
-            if queue == self.PENDING_QUEUE and self.options.get("max_retry", 10) > 0:
+            if queue in self.lane_weights and self.options.get("max_retry", 10) > 0:
 
                 # Create retry queue for batch
-                retry_queue = self.RETRY_QUEUE.format(datetime.datetime.utcnow(), 0)
-                log.warning("Failed to upload pending batch - transferring to new dedicated retry queue '{:}': {:}".format(retry_queue, rex))
-
-                self.client.pipeline() \
-                    .lpush(retry_queue, *batch_reversed) \
-                    .ltrim(queue, 0, -(len(batch_reversed) + 1)) \
-                    .bgsave() \
-                    .execute()
+                self._transfer_to_retry_queue(queue, batch_reversed, rex)
 
             else:
                 log.warning("Failed to upload batch - leaving batch in queue '{:}': {:}".format(queue, rex))
@@ -514,21 +1636,172 @@ class NextCloudCache(CloudCache):
 
         return ret
 
-    def upload_pending(self):
+    def _upload_batch_continuing(self, queue, window=1, max_batches=0):
+        if window > 1:
+            return self._upload_batch_pipelined(queue, window, max_batches=max_batches)
+
+        return CloudCache._upload_batch_continuing(self, queue, max_batches=max_batches)
+
+    def _upload_batch_pipelined(self, queue, window, max_batches=0):
+        """
+        Uploads batches from the given queue with up to 'window' batches in flight at once.
+
+        The next batch is read and compressed while the preceding ones are being uploaded.
+        Uploaded batches are always removed from the queue in order, so a failed batch is
+        never skipped.
+        """
+
+        ret = {
+            "count": 0
+        }
+
+        in_flight = collections.deque()
+        offset = 0  # Number of entries read from the tail of the queue but not yet removed
+        batches = 0
+        exhausted = False
+        blocked = False  # Set when a failed batch is left in the queue which prevents removal of succeeding batches
+        request_exception = None
+
+        def can_read():
+            return not (exhausted or "error" in ret or request_exception or max_batches and batches >= max_batches)
+
+        while in_flight or can_read():
+
+            # Fill up window with new batches
+            while len(in_flight) < self._window_for(window) and can_read():
+                batch_reversed, payload, compression, more = self._read_batch(queue, offset=offset)
+                if not batch_reversed:
+                    exhausted = True
+
+                    break
+
+                if not more:
+                    exhausted = True
+
+                offset += len(batch_reversed)
+                batches += 1
+
+                # Repeated upload delay is only enforced once per pipelined run
+                thread = threading_more.ReturnThread(target=self._upload, args=(payload, ),
+                    kwargs={"compression": compression, "splay_factor": 0 if ret["count"] or in_flight else 1})
+                thread.daemon = True
+                thread.start()
+
+                in_flight.append((batch_reversed, payload, compression, thread))
+
+            if not in_flight:
+                break
+
+            # Wait for the oldest batch to complete to ensure in-order removal
+            batch_reversed, payload, compression, thread = in_flight.popleft()
+            res = thread.join()
+
+            if thread.exception == None and res[0]:
+                if blocked:
+                    log.warning("Uploaded batch with {:} entries from queue '{:}' but unable to remove it because a preceding batch failed - it will be uploaded again".format(len(batch_reversed), queue))
+
+                    continue
+
+                log.info("Uploaded batch with {:} entries from queue '{:}'".format(len(batch_reversed), queue))
+
+                # Remove batch entries from queue
+                self.client.ltrim(queue, 0, -(len(batch_reversed) + 1))
+                self._persist_if_due(len(batch_reversed))
+
+                offset -= len(batch_reversed)
+                ret["count"] += len(batch_reversed)
+
+            elif isinstance(thread.exception, RequestException):
+                log.warning("Failed to upload batch with {:} entries from queue '{:}': {:}".format(len(batch_reversed), queue, thread.exception))
+
+                request_exception = request_exception or thread.exception
+
+                # Only pending lane queues support retry upon server error
+                if not blocked and queue in self.lane_weights and self.options.get("max_retry", 10) > 0:
+                    self._transfer_to_retry_queue(queue, batch_reversed, thread.exception)
+
+                    offset -= len(batch_reversed)
+                else:
+                    blocked = True
+
+            elif thread.exception != None:
+                log.error("Failed to upload batch with {:} entries from queue '{:}' due to an unexpected error: {:}".format(len(batch_reversed), queue, thread.exception))
+
+                ret.setdefault("error", str(thread.exception))
+
+                blocked = True
+
+            else:
+                log.warning("Temporarily unable to upload batch with {:} entries from queue '{:}': {:}".format(len(batch_reversed), queue, res[1]))
+
+                # Put batch into upload cache if it is still at the tail of the queue
+                if not blocked:
+                    self.upload_cache[queue] = (batch_reversed, payload, compression)
+
+                ret.setdefault("error", res[1])
+
+                blocked = True
+
+        # Report server error without losing count of what was uploaded
+        if request_exception:
+            ret["error"] = str(request_exception)
+
+        # Signal that more batches might be present when max batch count is reached
+        elif not exhausted and not "error" in ret:
+            ret["more"] = True
+
+        return ret
+
+    def upload_pending(self, window=1):
+        """
+        Uploads pending entries of all lanes. Lanes are drained using weighted round-robin,
+        where each lane gets to upload a number of batches equal to its weight per round,
+        starting with the lane of highest weight.
+        """
+
         ret = {
             "total": 0,
         }
 
-        try:
-            res = self._upload_batch_continuing(self.PENDING_QUEUE)  # Remember this call will raise exception upon server error
-            ret["total"] += res["count"]
+        # No need for scheduling when only the default lane is present
+        if len(self.lane_weights) == 1:
+            try:
+                res = self._upload_batch_continuing(self.PENDING_QUEUE, window=window)  # Remember this call will raise exception upon server error
+                ret["total"] += res["count"]
 
-            if "error" in res:
-                ret.setdefault("errors", []).append(res["error"])
+                if "error" in res:
+                    ret.setdefault("errors", []).append(res["error"])
 
-        except RequestException as rex:
-            ret.setdefault("errors", []).append(str(rex))
+            except RequestException as rex:
+                ret.setdefault("errors", []).append(str(rex))
+
+                # Retry queue logic is moved to '_upload_batch' method
+
+            return ret
+
+        active = list(self.lane_weights)
+        while active:
+            for queue in list(active):
+                try:
+                    res = self._upload_batch_continuing(queue, window=window, max_batches=self.lane_weights[queue])  # Remember this call will raise exception upon server error
+
+                    ret["total"] += res["count"]
+                    ret.setdefault("lanes", {})[queue] = ret.get("lanes", {}).get(queue, 0) + res["count"]
 
-            # Retry queue logic is moved to '_upload_batch' method
+                    if "error" in res:
+                        ret.setdefault("errors", []).append(res["error"])
 
-        return ret
\ No newline at end of file
+                        # No reason to continue with other lanes
+                        return ret
+
+                    if not res.get("more", False):
+                        active.remove(queue)
+
+                except RequestException as rex:
+                    ret.setdefault("errors", []).append(str(rex))
+
+                    # Retry queue logic is moved to '_upload_batch' method
+
+                    return ret
+
+        return ret
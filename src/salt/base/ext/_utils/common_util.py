@@ -1,3 +1,4 @@
+import collections
 import datetime
 import errno
 import importlib
@@ -6,6 +7,7 @@ import logging
 import logging.handlers
 import os
 import re
+import threading
 import time
 
 from functools import wraps
@@ -280,6 +282,54 @@ def force_kwargs(**defaultKwargs):
     return decorator
 
 
+def lru_cache(size=128):
+    """
+    Decorator to memoize results of a function by its positional arguments, which must be hashable.
+    Only the given number of most recently used results are kept. Returned values are shared and must not be modified.
+    """
+
+    def decorator(f):
+        cache = collections.OrderedDict()
+        lock = threading.Lock()
+        stats = {"hits": 0, "misses": 0}
+
+        @wraps(f)
+        def g(*args):
+            with lock:
+                if args in cache:
+                    stats["hits"] += 1
+
+                    # Move to end as most recently used
+                    ret = cache.pop(args)
+                    cache[args] = ret
+
+                    return ret
+
+                stats["misses"] += 1
+
+            ret = f(*args)
+
+            with lock:
+                cache[args] = ret
+
+                # Discard least recently used
+                if len(cache) > size:
+                    cache.popitem(last=False)
+
+            return ret
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        g.cache_clear = cache_clear
+        g.cache_info = lambda: dict(stats, size=len(cache), max_size=size)
+
+        return g
+
+    return decorator
+
+
 def min_max(it):
     min_val = max_val = None
 
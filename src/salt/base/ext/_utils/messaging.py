@@ -1,6 +1,7 @@
-import copy
 import datetime
+import fnmatch
 import logging
+import metrics_util
 import re
 import salt.exceptions
 import salt.utils.event
@@ -11,8 +12,9 @@ import time
 import urlparse
 import uuid
 
-from common_util import ensure_primitive, last_iter, force_kwargs
+from common_util import ensure_primitive, last_iter, force_kwargs, lru_cache
 from salt_more import cached_loader, SuperiorCommandExecutionError
+from threading_more import monotonic
 from timeit import default_timer as timer
 
 
@@ -20,6 +22,9 @@ log = logging.getLogger(__name__)
 
 DEBUG = log.isEnabledFor(logging.DEBUG)
 
+INT_REGEX = re.compile("^[-+]?\d+$")
+FLOAT_REGEX = re.compile("^[-+]?(?:(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?|\d+[eE][-+]?\d+)$")
+
 
 class MessageProcessor(object):
     """
@@ -38,14 +43,30 @@ class MessageProcessor(object):
 
     NOTES:
         - All hook functions registered using the hook decorator are synchronized before invocation to ensure thread safety.
+        - Hook functions can declare a named lock domain, e.g. 'bus', to only be synchronized with hooks accessing the same resource.
+        - Hooks synchronized with 'True' and transactional workers share the default lock domain of the processor.
         - If you add your own hook methods by inheriting from this class you are responsible for thread synchronization.
     """
 
-    def __init__(self, default_hooks={}):
+    HOOK_CACHE_SIZE = 1000
+
+    DEFAULT_LOCK_DOMAIN = "default"
+
+    SCHEDULER_WORKERS = 2  # Size of thread pool executing scheduled workers
+
+    def __init__(self, default_hooks={}, name=None, default_lock_domain=None):
+        self._name = name or self.__class__.__name__.lower()  # Used to label metrics
+        self._default_lock_domain = default_lock_domain or self.DEFAULT_LOCK_DOMAIN
         self._default_hooks = default_hooks
         self._hook_funcs = {}  # Index of all registered hook functions
-        self._hook_lock = threading.RLock()  # Used to synchronize hook function calls
+        self._hook_cache = {}  # Resolved hook functions by kind and hook URL
+        self._hook_histograms = {}  # Latency histograms by kind and hook function
+        self._lock_domains = {}  # Locks used to synchronize hook function calls by resource domain
+        self._lock_domains_lock = threading.Lock()
+        self._hook_lock = self._lock_domain_for(self._default_lock_domain)
         self._measure_stats = False
+        self._scheduler = None
+        self._scheduler_lock = threading.Lock()
 
         self.worker_threads = threading_more.ThreadRegistry()  # Keeps track of all active workers
 
@@ -63,24 +84,44 @@ class MessageProcessor(object):
     def measure_stats(self, value):
         self._measure_stats = value
 
-    def register_hook(self, synchronize=True):
+    @property
+    def scheduler(self):
+        """
+        Shared scheduler executing scheduled workers. Created upon first use.
+        """
+
+        with self._scheduler_lock:
+            if self._scheduler == None:
+                self._scheduler = threading_more.TimerWheelScheduler("{:}_scheduler".format(self.__class__.__name__.lower()),
+                    workers=self.SCHEDULER_WORKERS)
+
+            return self._scheduler
+
+    def lock_domain(self, name=None):
+        """
+        Gets lock of the given domain or the default lock domain of this processor.
+        """
+
+        return self._lock_domain_for(name or self._default_lock_domain)
+
+    def register_hook(self, synchronize=True, timeout=None):
         """
         Decorator to register hook functions for this message processor.
 
         Args:
-            synchronize (bool): Enables thread synchronization for entire hook function.
+            synchronize (bool|str): Enables thread synchronization for entire hook function. Either 'True' for the default lock domain of this processor, name of the lock domain shared with hooks accessing the same resource or 'False'/'none' for no synchronization.
+            timeout (float): Maximum number of seconds to wait for the lock before failing. Default is to wait forever.
         """
 
         def decorator(func):
-            ret_func = func
 
             # Wrap in synchronizer if requested
-            if synchronize:
-                ret_func = self._synchronize_wrapper(self._hook_lock, func)
+            ret_func = self._synchronized(func, synchronize, timeout=timeout)
 
             # Add function to hook registry
             name = func.__name__
             self._hook_funcs[name] = ret_func
+            self._hook_cache.clear()
 
             if DEBUG:
                 log.debug("Registered hook function '%s'", name)
@@ -89,16 +130,16 @@ class MessageProcessor(object):
 
         return decorator
 
-    def add_hook(self, name, kind, func, synchronize=True):
+    def add_hook(self, name, kind, func, synchronize=True, timeout=None):
         """
         Add hook function manually to this message processor.
         """
 
         # Wrap in synchronizer if requested
-        if synchronize:
-            func = self._synchronize_wrapper(self._hook_lock, func)
+        func = self._synchronized(func, synchronize, timeout=timeout)
 
         self._hook_funcs["{:}_{:}".format(name, kind)] = func
+        self._hook_cache.clear()
 
     def process(self, message):
         """
@@ -107,9 +148,8 @@ class MessageProcessor(object):
 
         # Find worker and use it
         func, settings = self._get_hook_for(message, "worker", parse_settings=True)
-        result = func(message, **settings)
 
-        return result
+        return self._call_measured(message, "worker", func, message, **settings)
 
     #region Available workers
 
@@ -125,6 +165,9 @@ class MessageProcessor(object):
     def dedicated_worker(self, message, **settings):
         """
         Run workflow in a dedicated thread.
+
+        Periodic workers can instead be run by the shared scheduler using setting 'scheduled'. Scheduled workers
+        with the same 'resource' never run concurrently. Default resource is the lock domain of a transactional worker.
         """
 
         # Check if we need to dequeue message from an existing worker thread
@@ -151,9 +194,14 @@ class MessageProcessor(object):
         # Terminates worker thread after a successful run without warnings nor exceptions
         kill_upon_success = settings.pop("kill_upon_success", False)
 
-        # Perform entire job iteration transactionally
+        # Perform entire job iteration transactionally (optionally within a specific lock domain)
         transactional = settings.pop("transactional", False)
 
+        # Run on shared scheduler instead of in a dedicated thread
+        scheduled = settings.pop("scheduled", False)
+        if scheduled and isinstance(transactional, basestring):
+            settings.setdefault("resource", transactional)
+
         # Prepare function that performs actual work
         def do_work(thread, context):
             success = True
@@ -238,11 +286,18 @@ class MessageProcessor(object):
         start = settings.pop("start", True)
 
         # Add new worker thread
-        thread = threading_more.WorkerThread(
-            target=self._synchronize_wrapper(self._hook_lock, do_work) if transactional else do_work,
-            context={"messages": [message] if message else []},
-            registry=self.worker_threads,  # Registers thread in registry
-            **settings)  # Pass additional settings
+        if scheduled:
+            thread = threading_more.ScheduledWorker(self.scheduler,
+                target=self._synchronized(do_work, transactional),
+                context={"messages": [message] if message else []},
+                registry=self.worker_threads,  # Registers worker in registry
+                **settings)  # Pass additional settings
+        else:
+            thread = threading_more.WorkerThread(
+                target=self._synchronized(do_work, transactional),
+                context={"messages": [message] if message else []},
+                registry=self.worker_threads,  # Registers thread in registry
+                **settings)  # Pass additional settings
 
         if start:
             thread.start()
@@ -365,6 +420,9 @@ class MessageProcessor(object):
         Supported commands:
             - hook list|call <name> [argument]... [<key>=<value>]...
             - worker list|show|create|start|pause|resume|kill <name> [<key>=<value>]...
+            - worker scheduler
+            - lock list|show [name]
+            - stats show|write [path=<file>]
             - run <key>=<value>...
         """
 
@@ -398,7 +456,7 @@ class MessageProcessor(object):
             elif args[1] == "show":
                 threads = self.worker_threads.find_all_by(args[2] if len(args) > 2 else "*")
                 return {
-                    "value": {t.name: t.context for t in threads}
+                    "value": {t.name: dict(t.context, metrics=t.metrics()) for t in threads}
                 }
 
             elif args[1] == "create":
@@ -454,6 +512,35 @@ class MessageProcessor(object):
                     "values": [t.name for t in threads]
                 }
 
+            elif args[1] == "scheduler":
+                return {
+                    "value": self._scheduler.stats() if self._scheduler else {}
+                }
+
+        elif len(args) > 1 and args[0] == "lock":
+            if args[1] == "list":
+                return {
+                    "values": self._lock_domains.keys()
+                }
+
+            elif args[1] == "show":
+                locks = [l for n, l in self._lock_domains.items() if len(args) < 3 or args[2] == "*" or args[2] == n]
+                return {
+                    "value": {l.name: l.stats() for l in locks}
+                }
+
+        elif len(args) > 1 and args[0] == "stats":
+            if args[1] == "show":
+                return {
+                    "value": metrics_util.registry.snapshot(engine=self._name).get(self._name, {})
+                }
+
+            elif args[1] == "write":
+                path = metrics_util.registry.write_prometheus(kwargs.get("path", metrics_util.DEFAULT_PROMETHEUS_FILE.format(engine=self._name)), engine=self._name)
+                return {
+                    "value": path
+                }
+
         elif len(args) > 0 and args[0] == "run":
             msg = kwargs
             return self.process(msg)
@@ -471,7 +558,7 @@ class MessageProcessor(object):
     def _call_hook_for(self, message, kind, *args, **kwargs):
         func = self._get_hook_for(message, kind)
         if func:
-            return True, func(*args, **kwargs)
+            return True, self._call_measured(message, kind, func, *args, **kwargs)
 
         return False, None
 
@@ -481,7 +568,7 @@ class MessageProcessor(object):
         funcs = self._get_hooks_for(message, kind)
         for func in funcs:
             try:
-                func(*args, **kwargs)
+                self._call_measured(message, kind, func, *args, **kwargs)
             except Exception as ex:
                 log.exception("Error when calling {:} hook for message: {:}".format(kind, message))
 
@@ -495,7 +582,7 @@ class MessageProcessor(object):
         ret = (False, None)
 
         for func in self._get_hooks_for(message, kind):
-            res = func(*args, **kwargs)
+            res = self._call_measured(message, kind, func, *args, **kwargs)
             ret = (True, res)
 
             if res != None:
@@ -508,6 +595,12 @@ class MessageProcessor(object):
         if not url:
             return
 
+        # Hook functions are resolved once per hook URL and cached until hooks are added
+        key = (kind, url, parse_settings)
+        ret = self._hook_cache.get(key, None)
+        if ret != None:
+            return ret
+
         name = url
 
         # Parse settings from url if requsted
@@ -516,45 +609,75 @@ class MessageProcessor(object):
 
         # Get hook function by name
         func = self._get_func("{:s}_{:s}".format(name, kind))
-
-        # Wrap hook function in order to measure statistics
-        if self._measure_stats:
-            func = self._stats_wrapper_for(message, kind, func)
+        self._hook_histograms[(kind, func)] = metrics_util.registry.histogram_for(self._name, name, kind)
 
         if parse_settings:
-            return (func, settings)
+            ret = (func, settings)
         else:
-            return func
+            ret = func
 
-    def _get_hooks_for(self, message, kind):
-        ret = []
+        self._cache_hook(key, ret)
 
+        return ret
+
+    def _get_hooks_for(self, message, kind):
         url = self._get_hook_url_for(message, kind)
         if not url:
+            return ()
+
+        key = (kind, url, None)
+        ret = self._hook_cache.get(key, None)
+        if ret != None:
             return ret
 
-        for name in url.split(","):
+        # Get hook functions by name
+        ret = tuple(self._get_func("{:s}_{:s}".format(name, kind)) for name in url.split(","))
+        for name, func in zip(url.split(","), ret):
+            self._hook_histograms[(kind, func)] = metrics_util.registry.histogram_for(self._name, name, kind)
 
-            # Get hook function by name
-            func = self._get_func("{:s}_{:s}".format(name, kind))
+        self._cache_hook(key, ret)
 
-            # Wrap hook function in order to measure statistics
-            if self._measure_stats:
-                func = self._stats_wrapper_for(message, kind, func)
+        return ret
 
-            ret.append(func)
+    def _cache_hook(self, key, value):
 
-        return ret
+        # Start over when full because hook URLs may contain unique settings
+        if len(self._hook_cache) >= self.HOOK_CACHE_SIZE:
+            if DEBUG:
+                log.debug("Clearing full hook cache with %d entries", len(self._hook_cache))
 
-    def _stats_wrapper_for(self, message, kind, func):
-        def stats_wrapper(*args, **kwargs):
-            start = timer()
+            self._hook_cache.clear()
 
-            try:
-                return func(*args, **kwargs)
-            finally:
-                duration = timer() - start
+        self._hook_cache[key] = value
+
+    def _call_measured(self, message, kind, func, *args, **kwargs):
+        """
+        Calls hook function and records its duration in the latency histogram of the hook.
+        Duration statistics are also recorded in the message when 'measure_stats' is enabled.
+        """
 
+        start = monotonic()
+        error = False
+        warning = False
+
+        try:
+            return func(*args, **kwargs)
+        except Warning:
+            warning = True
+
+            raise
+        except Exception:
+            error = True
+
+            raise
+        finally:
+            duration = monotonic() - start
+
+            histogram = self._hook_histograms.get((kind, func), None)
+            if histogram != None:
+                histogram.record(duration, error=error, warning=warning)
+
+            if self._measure_stats:
                 stats = message.setdefault("_stats", {}).setdefault(kind, {
                     "duration": {
                         "acc": 0.0,
@@ -572,28 +695,8 @@ class MessageProcessor(object):
                 if duration > stats["duration"]["max"]:
                     stats["duration"]["max"] = duration
 
-        return stats_wrapper
-
     def _parse_hook_url(self, url):
-        u = urlparse.urlparse(url)
-
-        name = u.path
-        settings = {}
-
-        if u.query:
-            qs = urlparse.parse_qs(u.query, strict_parsing=True)
-
-            for k, v in qs.iteritems():
-
-                # Convert into appropriate types using eval (integers, decimals and booleans)
-                v = [eval(e) if re.match("^(?:[-+]?\d*\.?\d*|True|False)$", e) else e for e in v]
-
-                if len(v) == 1:
-                    settings[k] = v[0]
-                else:
-                    settings[k] = v
-
-        return (name, settings)
+        return parse_hook_url(url)
 
     def _get_hook_url_for(self, message, kind):
         return message.get(kind, self._default_hooks.get(kind, None))
@@ -606,27 +709,204 @@ class MessageProcessor(object):
         else:
             raise Exception("No function found for hook '{:}'".format(name))
 
-    def _synchronize_wrapper(self, lock, func):
+    def _synchronized(self, func, synchronize, timeout=None):
+        """
+        Wraps function in synchronizer of the given lock domain if any.
+        """
+
+        if not synchronize or synchronize == "none":
+            return func
+
+        lock = self._lock_domain_for(self._default_lock_domain if synchronize == True else synchronize)
+
+        return self._synchronize_wrapper(lock, func, timeout=timeout)
+
+    def _synchronize_wrapper(self, lock, func, timeout=None):
         def synchronizer(*args, **kwargs):
-            with lock:
+            if not lock.acquire(timeout=timeout):
+                raise Exception("Timed out after {:} second(s) waiting for lock '{:}'".format(timeout, lock.name))
+
+            try:
                 return func(*args, **kwargs)
+            finally:
+                lock.release()
 
         return synchronizer
 
+    def _lock_domain_for(self, name):
+        with self._lock_domains_lock:
+            ret = self._lock_domains.get(name, None)
+            if ret == None:
+                ret = threading_more.DomainLock(name)
+                self._lock_domains[name] = ret
+
+            return ret
+
     #endregion
 
 
+class EventMatcherIndex(object):
+    """
+    Index of event matchers to find the matchers of an event tag without testing each one of them.
+
+    Matchers of type 'exact' and 'fnmatch' without wildcards are found using a hash table, 'startswith' and 'endswith'
+    matchers using prefix and suffix tries, and 'regex' matchers are prefiltered by a single combined pattern.
+    Matchers of type 'find' are tested one by one.
+    Matches are returned in order of registration.
+    """
+
+    MATCH_TYPES = ["exact", "startswith", "endswith", "find", "fnmatch", "regex"]
+
+    BACKREFERENCE_REGEX = re.compile(r"\\\d|\(\?P=")
+    NAMED_GROUP_REGEX = re.compile(r"(?<!\\)\(\?P<\w+>")
+
+    def __init__(self):
+        self._count = 0
+        self._exact = {}
+        self._prefix_trie = {}
+        self._suffix_trie = {}
+        self._substrings = []
+        self._wildcards = []  # Compiled fnmatch patterns with wildcards
+        self._regexes = []
+        self._combined_regex = None  # Prefilter of all regexes that can be combined
+        self._uncombined_regexes = []
+
+    def add(self, matcher):
+        """
+        Adds an event matcher dictionary containing 'tag' and 'match_type'.
+        """
+
+        tag = matcher["tag"]
+        match_type = matcher["match_type"]
+
+        if match_type not in self.MATCH_TYPES:
+            raise ValueError("Unsupported match type '{:}' - allowed options are: {:}".format(match_type, ", ".join(self.MATCH_TYPES)))
+
+        entry = (self._count, matcher)
+        self._count += 1
+
+        if match_type == "exact" or match_type == "fnmatch" and not any(c in tag for c in "*?["):
+            self._exact.setdefault(tag, []).append(entry)
+
+        elif match_type == "startswith":
+            self._trie_node_for(self._prefix_trie, tag).setdefault(None, []).append(entry)
+
+        elif match_type == "endswith":
+            self._trie_node_for(self._suffix_trie, reversed(tag)).setdefault(None, []).append(entry)
+
+        elif match_type == "find":
+            self._substrings.append(entry)
+
+        elif match_type == "fnmatch":
+            self._wildcards.append(entry + (re.compile(fnmatch.translate(tag)),))
+
+        elif match_type == "regex":
+            regex = re.compile(tag)
+            self._regexes.append(entry + (regex,))
+
+            if self._is_combinable(regex):
+                self._combine_regexes()
+            else:
+                self._uncombined_regexes.append(entry + (regex,))
+
+    def match(self, tag):
+        """
+        Finds all matchers of the given tag.
+
+        Returns tuple of pairs of matcher and match result, where the match result is the match object for regex matchers.
+        """
+
+        ret = []
+
+        for entry in self._exact.get(tag, []):
+            ret.append(entry + (True,))
+
+        self._collect_from_trie(self._prefix_trie, tag, ret)
+        self._collect_from_trie(self._suffix_trie, reversed(tag), ret)
+
+        for seq, matcher in self._substrings:
+            if matcher["tag"] in tag:
+                ret.append((seq, matcher, True))
+
+        for seq, matcher, regex in self._wildcards:
+            if regex.match(tag):
+                ret.append((seq, matcher, True))
+
+        if self._combined_regex != None and self._combined_regex.search(tag):
+            regexes = self._regexes
+        else:
+            regexes = self._uncombined_regexes
+
+        for seq, matcher, regex in regexes:
+            match = regex.search(tag)
+            if match:
+                ret.append((seq, matcher, match))
+
+        if len(ret) > 1:
+            ret.sort(key=lambda e: e[0])
+
+        return tuple((matcher, match) for _, matcher, match in ret)
+
+    def _trie_node_for(self, trie, chars):
+        node = trie
+        for char in chars:
+            node = node.setdefault(char, {})
+
+        return node
+
+    def _collect_from_trie(self, trie, chars, ret):
+        node = trie
+        for entry in node.get(None, []):
+            ret.append(entry + (True,))
+
+        for char in chars:
+            node = node.get(char, None)
+            if node == None:
+                break
+
+            for entry in node.get(None, []):
+                ret.append(entry + (True,))
+
+    def _is_combinable(self, regex):
+        """
+        Patterns with backreferences cannot be combined because group numbers will change, and patterns with inline
+        flags cannot be combined because the flags will apply to all other patterns as well.
+        """
+
+        return not regex.flags and not self.BACKREFERENCE_REGEX.search(regex.pattern)
+
+    def _combine_regexes(self):
+
+        # Named groups are made non-capturing to allow same names in multiple patterns
+        patterns = [self.NAMED_GROUP_REGEX.sub("(?:", r.pattern) for _, _, r in self._regexes if self._is_combinable(r)]
+
+        try:
+            self._combined_regex = re.compile("|".join("(?:{:})".format(p) for p in patterns))
+        except (re.error, AssertionError):  # Too many groups raises assertion error
+            log.warning("Unable to combine regex event matchers into a single pattern - all will be tested one by one")
+
+            self._combined_regex = None
+            self._uncombined_regexes = list(self._regexes)
+
+
 class EventDrivenMessageProcessor(MessageProcessor):
 
-    def __init__(self, namespace, context={}, default_hooks={}):
-        MessageProcessor.__init__(self, default_hooks)
+    EVENT_MATCH_CACHE_SIZE = 1000
+
+    REACTOR_KEYWORDS = ["event", "match", "context", "salt", "options"]
+
+    def __init__(self, namespace, context={}, default_hooks={}, default_lock_domain=None):
+        MessageProcessor.__init__(self, default_hooks, name=namespace, default_lock_domain=default_lock_domain)
         self._namespace = namespace
         self._context = context
         self._tag_regex = re.compile("^{:s}/req/(?P<id>.+)$".format(namespace))
         self._event_matchers = []
+        self._event_index = EventMatcherIndex()
+        self._event_match_cache = {}  # Matchers of recently seen tags
         self._bus_lock = threading.RLock()  # Used to synchronize event bus function calls
         self._outgoing_event_filters = {}
         self._reactors = []
+        self._reactor_executors = {}  # Executors of reactors running actions asynchronously
 
     def init(self, __salt__, __opts__, hooks=[], workers=[], reactors=[]):
         """
@@ -671,7 +951,7 @@ class EventDrivenMessageProcessor(MessageProcessor):
 
                         hook_func = hook_wrapper
 
-                    self.add_hook(hook["name"], hook["kind"], hook_func, synchronize=hook.get("lock", False))
+                    self.add_hook(hook["name"], hook["kind"], hook_func, synchronize=hook.get("lock", False), timeout=hook.get("lock_timeout", None))
                 else:
 
                     # Special handling of returners
@@ -695,7 +975,7 @@ class EventDrivenMessageProcessor(MessageProcessor):
 
                             return returner_func(result, *args, **kwargs)
 
-                        self.add_hook(hook["name"], hook["kind"], returner_returner_wrapper, synchronize=hook.get("lock", False))
+                        self.add_hook(hook["name"], hook["kind"], returner_returner_wrapper, synchronize=hook.get("lock", False), timeout=hook.get("lock_timeout", None))
 
                     else:
                         modules = cached_loader(__salt__, __opts__, "modules", context=self._context)
@@ -715,7 +995,7 @@ class EventDrivenMessageProcessor(MessageProcessor):
 
                             hook_func = hook_wrapper
 
-                        self.add_hook(hook["name"], hook["kind"], hook_func, synchronize=hook.get("lock", False))
+                        self.add_hook(hook["name"], hook["kind"], hook_func, synchronize=hook.get("lock", False), timeout=hook.get("lock_timeout", None))
 
             except Exception:
                 log.exception("Failed to add hook: {:}".format(hook))
@@ -733,15 +1013,57 @@ class EventDrivenMessageProcessor(MessageProcessor):
         # Add given reactors
         for reactor in reactors or []:
 
+            # Compile conditions and keyword resolvable actions once up front
+            try:
+                conditions = list(reactor.get("conditions", []))
+                if "condition" in reactor:
+                    conditions.append(reactor["condition"])
+                conditions = [(c, keyword_compile(c, keywords=self.REACTOR_KEYWORDS)) for c in conditions]
+
+                actions = list(reactor.get("actions", []))
+                if "action" in reactor:
+                    actions.append(reactor["action"])
+                if reactor.get("keyword_resolve", False):
+                    actions = [(a, keyword_compile(a, keywords=self.REACTOR_KEYWORDS)) for a in actions]
+                else:
+                    actions = [(a, None) for a in actions]
+
+                # Setup executor if actions must run asynchronously
+                executor = None
+                executor_key = None
+                if "executor" in reactor:
+                    executor = threading_more.BoundedExecutor("reactor_{:}".format(reactor["name"]),
+                        workers=reactor["executor"].get("workers", 1),
+                        queue_size=reactor["executor"].get("queue_size", 10),
+                        policy=reactor["executor"].get("policy", "drop_oldest"))
+                    executor_key = keyword_compile(reactor["executor"].get("key", "$event['tag']"), keywords=self.REACTOR_KEYWORDS)
+
+                    self._reactor_executors[reactor["name"]] = executor
+
+            except Exception:
+                log.exception("Failed to setup reactor: {:}".format(reactor))
+
+                continue  # Skip reactor
+
+            # Define function to run actions
+            def run_actions(messages, reactor=reactor):
+                for index, message in enumerate(messages, 1):
+                    res = self.process(message)
+
+                    if index < len(messages) and reactor.get("chain_conditionally", False):
+                        if not res or isinstance(res, dict) and not res.get("result", True):
+                            if DEBUG:
+                                log.debug("Breaking action chain after message #{:} '{:}' because of result '{:}'".format(index, message, res))
+
+                            break
+
             # Define function to handle events when matched
-            def on_event(event, match=None, reactor=reactor):
+            def on_event(event, match=None, reactor=reactor, conditions=conditions, actions=actions, executor=executor, executor_key=executor_key, run_actions=run_actions):
+                keywords = {"event": event, "match": match, "context": self._context, "salt": __salt__, "options": __opts__}
 
                 # Check if conditions is defined
-                conditions = reactor.get("conditions", [])
-                if "condition" in reactor:
-                    conditions.append(reactor["condition"])
-                for index, condition in enumerate(conditions, 1):
-                    if keyword_resolve(condition, keywords={"event": event, "match": match, "context": self._context, "salt": __salt__, "options": __opts__}):
+                for index, (condition, resolve) in enumerate(conditions, 1):
+                    if resolve(keywords):
                         log.info("Event meets condition #{:} '{:}': {:}".format(index, condition, event))
                     else:
                         if DEBUG:
@@ -749,30 +1071,23 @@ class EventDrivenMessageProcessor(MessageProcessor):
 
                         return
 
-                # Process all action messages
-                actions = reactor.get("actions", [])
-                if "action" in reactor:
-                    actions.append(reactor["action"])
-                for index, message in enumerate(actions, 1):
+                # Resolve all action messages
+                messages = []
+                for message, resolve in actions:
 
                     # Check if keyword resolving is enabled
-                    if reactor.get("keyword_resolve", False):
-                        resolved_message = keyword_resolve(copy.deepcopy(message), keywords={"event": event, "match": match, "context": self._context, "salt": __salt__, "options": __opts__})
+                    if resolve != None:
+                        message = resolve(keywords)
                         if DEBUG:
-                            log.debug("Keyword resolved message: {:}".format(resolved_message))
-
-                        # TODO: Figure out if we can improve performance by processing each message in a dedicated worker thread or process?
+                            log.debug("Keyword resolved message: {:}".format(message))
 
-                        res = self.process(resolved_message)
-                    else:
-                        res = self.process(message)
+                    messages.append(message)
 
-                    if index < len(actions) and reactor.get("chain_conditionally", False):
-                        if not res or isinstance(res, dict) and not res.get("result", True):
-                            if DEBUG:
-                                log.debug("Breaking action chain after message #{:} '{:}' because of result '{:}'".format(index, message, result))
-
-                            break
+                # Process action messages in current thread or queue them for the executor of the reactor
+                if executor != None:
+                    executor.submit(run_actions, args=(messages,), key=executor_key(keywords))
+                else:
+                    run_actions(messages)
 
             match_type = None
             if "regex" in reactor:
@@ -798,15 +1113,21 @@ class EventDrivenMessageProcessor(MessageProcessor):
         except Exception:
             log.exception("Failed to match init event")
 
-    def _custom_match_tag_regex(self, event_tag, search_tag):
-        return self._incoming_bus.cache_regex.get(search_tag).search(event_tag)
+    def _match_tag(self, tag):
+        ret = self._event_match_cache.get(tag, None)
+        if ret == None:
+            ret = self._event_index.match(tag)
 
-    def _match_event(self, event):
-        for matcher in self._event_matchers:
-            match = matcher["match_func"](event["tag"], matcher["tag"]) 
-            if not match:
-                continue
+            # Start over when full as most events are recurring with the same tags
+            if len(self._event_match_cache) >= self.EVENT_MATCH_CACHE_SIZE:
+                self._event_match_cache.clear()
+
+            self._event_match_cache[tag] = ret
 
+        return ret
+
+    def _match_event(self, event):
+        for matcher, match in self._match_tag(event["tag"]):
             if DEBUG:
                 log.debug("Matched event: %s", repr(event))
 
@@ -828,11 +1149,14 @@ class EventDrivenMessageProcessor(MessageProcessor):
         em = {
             "tag": tag,
             "match_type": match_type,
-            "match_func": self._custom_match_tag_regex if match_type == "regex" else self._incoming_bus._get_match_func(match_type),
             "func": func,
         }
+        self._event_index.add(em)
         self._event_matchers.append(em)
 
+        # Cached matches are no longer valid
+        self._event_match_cache = {}
+
     def manage_workflow(self, message):
         """
         Administration workflow to query and manage this processor instance.
@@ -882,7 +1206,7 @@ class EventDrivenMessageProcessor(MessageProcessor):
                     reactors = [r for r in self._reactors]
 
                 return {
-                    "value": {r["name"]: r for r in reactors}
+                    "value": {r["name"]: dict(r, executor=self._reactor_executors[r["name"]].stats()) if r["name"] in self._reactor_executors else r for r in reactors}
                 }
         else:
             return super(EventDrivenMessageProcessor, self).manage_workflow(message)
@@ -918,6 +1242,14 @@ class EventDrivenMessageProcessor(MessageProcessor):
             if threads:
                 log.info("Killing all worker thread(s): {:s}".format(", ".join([t.name for t in threads])))
 
+            # Also stop all reactor executors
+            for executor in self._reactor_executors.values():
+                executor.stop()
+
+            # And the scheduler of any scheduled workers
+            if self._scheduler:
+                self._scheduler.stop()
+
     def process_event(self, event, **kwargs):
         """
         Process a received event.
@@ -980,12 +1312,7 @@ class EventDrivenMessageProcessor(MessageProcessor):
         """
 
         def decorator(func):
-            self._event_matchers.append({
-                "tag": tag,
-                "match_type": match_type,
-                "match_func": None,
-                "func": func,
-            })
+            self.register_event_matcher(tag, func, match_type=match_type)
 
             return func
 
@@ -1104,6 +1431,51 @@ def msg_pack(*args, **kwargs):
     return msg
 
 
+@lru_cache(size=256)
+def parse_hook_url(url):
+    """
+    Helper method to parse name and settings from a hook URL, e.g. 'dedicated?name=my_worker&interval=.5&loop=-1'.
+
+    Setting values are converted into integers, decimals and booleans where applicable.
+    Results are cached and must not be modified.
+    """
+
+    u = urlparse.urlparse(url)
+
+    name = u.path
+    settings = {}
+
+    if u.query:
+        qs = urlparse.parse_qs(u.query, strict_parsing=True)
+
+        for k, v in qs.iteritems():
+            v = [parse_literal(e) for e in v]
+
+            if len(v) == 1:
+                settings[k] = v[0]
+            else:
+                settings[k] = v
+
+    return (name, settings)
+
+
+def parse_literal(value):
+    """
+    Helper method to convert a string into an integer, decimal or boolean if applicable.
+    """
+
+    if INT_REGEX.match(value):
+        return int(value)
+    elif FLOAT_REGEX.match(value):
+        return float(value)
+    elif value == "True":
+        return True
+    elif value == "False":
+        return False
+
+    return value
+
+
 def keyword_resolve(data, keywords={}, symbol="$"):
     """
     Helper method to resolve keywords in a data structure.
@@ -1130,6 +1502,48 @@ def keyword_resolve(data, keywords={}, symbol="$"):
     return data
 
 
+def keyword_compile(data, keywords=[], symbol="$"):
+    """
+    Helper method to compile keywords in a data structure once for repeated resolving.
+
+    Returns a function that given a dictionary of keyword values resolves a new data structure equivalent to 'keyword_resolve'.
+    Only the keyword values referenced by an expression are bound when evaluated.
+    """
+
+    if isinstance(data, (list, tuple, set)):
+        funcs = [keyword_compile(val, keywords, symbol) for val in data]
+        kind = type(data)
+
+        return lambda values: kind([f(values) for f in funcs])
+
+    elif isinstance(data, dict):
+        funcs = [(keyword_compile(key, keywords, symbol), keyword_compile(val, keywords, symbol)) for key, val in data.iteritems()]
+
+        return lambda values: {k(values): v(values) for k, v in funcs}
+
+    elif isinstance(data, basestring) and symbol in data:
+
+        # Replace keywords in data
+        expr = data
+        for key in keywords:
+            expr = expr.replace("{:s}{:s}".format(symbol, key), "__{:s}__".format(key))
+
+        code = compile(expr, "<keyword>", "eval")
+
+        # Find referenced keywords, also within nested code such as lambdas and generators
+        names = set()
+        codes = [code]
+        while codes:
+            c = codes.pop()
+            names.update(c.co_names)
+            codes.extend(o for o in c.co_consts if isinstance(o, type(code)))
+        bindings = [("__{:s}__".format(key), key) for key in keywords if "__{:s}__".format(key) in names]
+
+        return lambda values: eval(code, {name: values[key] for name, key in bindings})
+
+    return lambda values: data
+
+
 def extract_error_from(result):
     """
     Helper function to extract error from a result.
@@ -0,0 +1,178 @@
+import bisect
+import logging
+import os
+import threading
+
+from common_util import makedirs
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Upper bounds in seconds
+
+DEFAULT_PROMETHEUS_FILE = "/opt/autopi/metrics/{engine:}.prom"
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of latencies in seconds with fixed buckets. Also counts calls, errors and warnings.
+
+    This class is thread safe.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+
+        self._counts = [0] * (len(self.buckets) + 1)  # Last bucket is +Inf
+        self._errors = 0
+        self._warnings = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, duration, error=False, warning=False):
+        idx = bisect.bisect_left(self.buckets, duration)
+
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += duration
+            if duration > self._max:
+                self._max = duration
+            if error:
+                self._errors += 1
+            elif warning:
+                self._warnings += 1
+
+    def snapshot(self):
+        """
+        Gets a consistent copy of the histogram including percentiles estimated from bucket upper bounds.
+        """
+
+        with self._lock:
+            counts = list(self._counts)
+            ret = {
+                "count": sum(counts),
+                "errors": self._errors,
+                "warnings": self._warnings,
+                "sum": self._sum,
+                "max": self._max,
+            }
+
+        ret["avg"] = ret["sum"] / ret["count"] if ret["count"] else 0.0
+
+        # Cumulative counts as in Prometheus
+        ret["buckets"] = []
+        acc = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            acc += count
+            ret["buckets"].append([bound, acc])
+
+        for percentile in [50, 90, 99]:
+            ret["p{:d}".format(percentile)] = self._percentile(ret["buckets"], ret["count"], percentile, ret["max"])
+
+        return ret
+
+    def _percentile(self, buckets, count, percentile, max_value):
+        if not count:
+            return 0.0
+
+        rank = count * percentile / 100.0
+        for bound, acc in buckets:
+            if acc >= rank:
+                return min(bound, max_value)
+
+        return max_value
+
+
+class MetricsRegistry(object):
+    """
+    Process wide registry of hook latency histograms by engine, hook and kind.
+
+    This class is thread safe.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram_for(self, engine, hook, kind):
+        key = (engine, hook, kind)
+
+        ret = self._histograms.get(key, None)
+        if ret == None:
+            with self._lock:
+                ret = self._histograms.setdefault(key, LatencyHistogram(buckets=self.buckets))
+
+        return ret
+
+    def snapshot(self, engine=None):
+        """
+        Gets snapshots of all histograms grouped by engine, kind and hook. Optionally only for a specific engine.
+        """
+
+        ret = {}
+
+        with self._lock:
+            histograms = self._histograms.items()
+
+        for (e, hook, kind), histogram in histograms:
+            if engine != None and e != engine:
+                continue
+
+            ret.setdefault(e, {}).setdefault(kind, {})[hook] = histogram.snapshot()
+
+        return ret
+
+    def prometheus_text(self, engine=None):
+        """
+        Renders histograms in the Prometheus text exposition format.
+        """
+
+        lines = [
+            "# HELP hook_duration_seconds Duration of message processor hook calls.",
+            "# TYPE hook_duration_seconds histogram",
+        ]
+        errors = [
+            "# HELP hook_errors_total Number of message processor hook calls that raised an exception.",
+            "# TYPE hook_errors_total counter",
+        ]
+        warnings = [
+            "# HELP hook_warnings_total Number of message processor hook calls that raised a warning.",
+            "# TYPE hook_warnings_total counter",
+        ]
+
+        for e, kinds in sorted(self.snapshot(engine=engine).iteritems()):
+            for kind, hooks in sorted(kinds.iteritems()):
+                for hook, snapshot in sorted(hooks.iteritems()):
+                    labels = "engine=\"{:}\",hook=\"{:}\",kind=\"{:}\"".format(e, hook, kind)
+
+                    for bound, acc in snapshot["buckets"]:
+                        lines.append("hook_duration_seconds_bucket{{{:},le=\"{:}\"}} {:d}".format(labels, "+Inf" if bound == float("inf") else repr(bound), acc))
+                    lines.append("hook_duration_seconds_sum{{{:}}} {:}".format(labels, repr(snapshot["sum"])))
+                    lines.append("hook_duration_seconds_count{{{:}}} {:d}".format(labels, snapshot["count"]))
+
+                    errors.append("hook_errors_total{{{:}}} {:d}".format(labels, snapshot["errors"]))
+                    warnings.append("hook_warnings_total{{{:}}} {:d}".format(labels, snapshot["warnings"]))
+
+        return "\n".join(lines + errors + warnings) + "\n"
+
+    def write_prometheus(self, path, engine=None):
+        """
+        Writes histograms to a Prometheus text file. The file is replaced atomically so it is never read half written.
+        """
+
+        makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = "{:}.tmp".format(path)
+        with open(tmp_path, "w") as file:
+            file.write(self.prometheus_text(engine=engine))
+
+        os.rename(tmp_path, path)
+
+        return path
+
+
+# Shared by all message processors of the current process
+registry = MetricsRegistry()
@@ -5,11 +5,12 @@ import obd
 import obd.utils
 import time
 
-from binascii import unhexlify
+from binascii import hexlify, unhexlify
 from obd.interfaces import STN11XX
 from obd.utils import format_frame, parse_frame
 
 from retrying import retry
+from timeit import default_timer as timer
 
 
 FILTER_TYPE_CAN_PASS = STN11XX.FILTER_TYPE_CAN_PASS
@@ -208,6 +209,43 @@ class OBDConn(object):
             },
         }
 
+    def cached_status(self):
+        """
+        Gets status and protocol from cached state only, without opening the connection or communicating with the interface.
+        Returns None if the connection is not open.
+        """
+
+        instance = self._obd  # Keep reference because connection can be closed by another thread
+        if instance == None:
+            return None
+
+        status = instance.status()
+        if status == obd.OBDStatus.NOT_CONNECTED:
+            return None
+
+        ret = {
+            "connection": {
+                "status": status,
+                "serial": {
+                    "port": self._device,
+                    "baudrate": self._baudrate,
+                },
+            },
+            "protocol": None,
+        }
+
+        protocol = self.cached_protocol
+        if protocol != None:
+            ret["protocol"] = {
+                "id": protocol.ID,
+                "name": protocol.NAME,
+                "autodetected": protocol.autodetected,
+                "ecus": protocol.ecu_map.values(),
+                "baudrate": getattr(protocol, "baudrate", None),  # Only available for 'STN11XX' interface
+            }
+
+        return ret
+
     @Decorators.ensure_open
     def advanced_settings(self):
         return self._obd.interface.runtime_settings()
@@ -565,3 +603,282 @@ def decode_can_frame_for(can_db, protocol, result):
 
     return ret
 
+
+
+class CANFrameDecoder(object):
+    """
+    Decodes raw CAN frame results in batches using an index of messages compiled once from a CAN database.
+
+    Signals of messages that are neither multiplexed nor contain float signals are decoded using precomputed
+    bit shifts, masks, scales and offsets. Other messages are decoded by the CAN database message itself.
+
+    Optionally only subscribed signals are decoded. Subscriptions are given by signal name (or '*' for all others) with
+    the following optional settings:
+        - 'interval':  Minimum number of seconds between decoded values of the signal.
+        - 'deadband':  Minimum change of a numeric value compared to the last decoded value of the signal.
+        - 'on_change': Only decode the signal when its value has changed since last decoded.
+
+    Frames of messages without any subscribed signals are skipped before being decoded.
+    """
+
+    HEADER_CACHE_SIZE = 4096
+
+    SUBSCRIPTION_SETTINGS = ["interval", "deadband", "on_change"]
+
+    def __init__(self, can_db, protocol, subscriptions=None):
+        self.can_db = can_db
+        self.header_bits = getattr(protocol, "HEADER_BITS", None)
+        self.subscriptions = None
+
+        # Validate subscriptions
+        if subscriptions != None:
+            self.subscriptions = {}
+            for name, settings in subscriptions.iteritems():
+                settings = settings or {}
+
+                unsupported = [k for k in settings if k not in self.SUBSCRIPTION_SETTINGS]
+                if unsupported:
+                    raise ValueError("Unsupported setting(s) {:} of subscription to CAN signal '{:}' - allowed settings are: {:}".format(", ".join(unsupported), name, ", ".join(self.SUBSCRIPTION_SETTINGS)))
+
+                self.subscriptions[str(name).lower()] = settings
+
+        self._headers = {}  # Compiled messages by header string or None if unknown
+        self._filters = {}  # Filter states of subscribed signals by name or None if unfiltered
+
+        # Compile all messages up front
+        self._compiled = {msg.frame_id: self._compile(msg) for msg in can_db.messages}
+
+    def decode(self, result):
+        """
+        Decodes a single raw CAN frame result. Same as 'decode_can_frame_for'.
+        """
+
+        value = result["value"]
+
+        # Fail fast validation
+        if value[:2] in ["?", "NO", "BU"]:
+            self._log_skipped(value)
+
+            return []
+
+        return self._decode_line(value, result, timer())
+
+    def decode_many(self, values):
+        """
+        Decodes a list of raw CAN frame results given as dictionaries or strings.
+
+        Returns a tuple of the decoded results and the number of raw CAN frames that failed to be decoded.
+        """
+
+        ret = []
+        fail_count = 0
+        now = timer()
+
+        for val in values:
+            if isinstance(val, dict):
+                result = val
+                value = val["value"]
+            else:
+                result = None
+                value = val
+
+            # Fail fast validation
+            if value[:2] in ["?", "NO", "BU"]:
+                self._log_skipped(value)
+
+                continue
+
+            try:
+                ret.extend(self._decode_line(value, result, now))
+            except Exception as ex:
+                log.info("Failed to decode raw CAN frame result '{:}' as a CAN message: {:}".format(val, ex))
+
+                fail_count += 1
+
+        return ret, fail_count
+
+    def _decode_line(self, value, result, now):
+        header, data = parse_frame(value, self.header_bits, validate=False)  # No need to validate hex here
+
+        # Strip any leading hash sign
+        if data[0] == "#":
+            data = data[1:]
+
+        # Find compiled message by header
+        key = header or data
+        compiled = self._headers.get(key, False)
+        if compiled is False:
+            compiled = self._compiled_for(int(key, 16))
+
+            # Keep cache bounded
+            if len(self._headers) >= self.HEADER_CACHE_SIZE:
+                self._headers.clear()
+            self._headers[key] = compiled
+
+        if compiled == None:  # Unknown or unsubscribed message
+            return []
+
+        msg, length, signals, little, big = compiled
+
+        # Fall back to decode by message itself when not compiled or data is incomplete
+        if signals == None or len(data) < 2 * length or len(data) % 2:
+            ret = []
+            for k, v in msg.decode(unhexlify(data), True, True).iteritems():
+                name = k.lower()
+                if self.subscriptions != None:
+                    if not name in self._filters:
+                        continue
+
+                    state = self._filters[name]
+                    if state != None and not self._accept(state, v, now):
+                        continue
+
+                ret.append(self._result(result, name, v))
+
+            return ret
+
+        data = data[:2 * length]
+        if little:
+            little = int(hexlify(unhexlify(data)[::-1]), 16)
+        if big:
+            big = int(data, 16)
+
+        ret = []
+        for name, is_little, shift, mask, sign_bit, scale, offset, choices, state in signals:
+            raw = int(((little if is_little else big) >> shift) & mask)  # Avoid long
+            if sign_bit and raw & sign_bit:
+                raw -= sign_bit << 1
+
+            if choices and raw in choices:
+                val = choices[raw]
+            else:
+                val = scale * raw + offset
+
+            if state != None and not self._accept(state, val, now):
+                continue
+
+            if result == None:
+                ret.append({"_type": name, "value": val})
+            else:
+                ret.append(dict(result, _type=name, value=val))
+
+        return ret
+
+    def _result(self, result, name, value):
+        if result == None:
+            return {"_type": name, "value": value}
+
+        return dict(result, _type=name, value=value)
+
+    def _accept(self, state, value, now):
+        """
+        Checks if value of a subscribed signal passes its filter and if so remembers it.
+        """
+
+        interval, deadband, on_change, last_time, last_value = state
+
+        if last_time != None:
+            if interval and now - last_time < interval:
+                return False
+
+            if deadband:
+                try:
+                    if abs(value - last_value) < deadband:
+                        return False
+                except TypeError:  # Not numeric
+                    if value == last_value:
+                        return False
+
+            elif on_change and value == last_value:
+                return False
+
+        state[3] = now
+        state[4] = value
+
+        return True
+
+    def _compiled_for(self, frame_id):
+
+        # Use lookup of CAN database in order to respect any frame ID mask
+        try:
+            msg = self.can_db.get_message_by_frame_id(frame_id)
+        except KeyError:  # Unknown message
+            if DEBUG:
+                log.debug("No CAN message found by ID {:}".format(frame_id))
+
+            return None
+
+        if not msg.frame_id in self._compiled:
+            self._compiled[msg.frame_id] = self._compile(msg)
+
+        return self._compiled[msg.frame_id]
+
+    def _subscribe(self, name):
+        """
+        Returns True if the signal is subscribed and prepares its filter state.
+        """
+
+        if self.subscriptions == None:
+            return True
+
+        settings = self.subscriptions.get(name, self.subscriptions.get("*", None))
+        if settings == None:
+            return False
+
+        if not name in self._filters:
+            if any(settings.get(k, None) for k in self.SUBSCRIPTION_SETTINGS):
+                self._filters[name] = [settings.get("interval", 0), settings.get("deadband", 0), settings.get("on_change", False), None, None]
+            else:
+                self._filters[name] = None
+
+        return True
+
+    def _compile(self, msg):
+
+        # Skip messages without any subscribed signals
+        subscribed = [s for s in msg.signals if self._subscribe(s.name.lower())]
+        if not subscribed:
+            if DEBUG:
+                log.debug("Skipping CAN message '{:}' because none of its signals are subscribed".format(msg.name))
+
+            return None
+
+        signals = None
+        little = False
+        big = False
+
+        if not msg.is_multiplexed() and not any(s.is_float for s in msg.signals):
+            signals = []
+            for signal in subscribed:
+                if signal.byte_order == "little_endian":
+                    shift = signal.start
+                    little = True
+                else:
+
+                    # Start bit of big endian signals is the most significant bit in sawtooth numbering
+                    shift = 8 * msg.length - (8 * (signal.start // 8) + (7 - signal.start % 8)) - signal.length
+                    big = True
+
+                signals.append((
+                    signal.name.lower(),
+                    signal.byte_order == "little_endian",
+                    shift,
+                    (1 << signal.length) - 1,
+                    1 << (signal.length - 1) if signal.is_signed else 0,
+                    signal.scale,
+                    signal.offset,
+                    signal.choices or None,
+                    self._filters.get(signal.name.lower(), None),
+                ))
+
+            signals = tuple(signals)
+
+        return (msg, msg.length, signals, little, big)
+
+    def _log_skipped(self, value):
+        if value.startswith("NO DATA"):
+            log.info("CAN decoder is skipping line 'NO DATA'")
+        elif value.startswith("BUFFER FULL"):
+            log.error("CAN decoder is skipping line 'BUFFER FULL' - try increase baud rate of serial connection to prevent buffer overflow")
+        else:
+            log.info("CAN decoder is skipping invalid line '{:}'".format(value))
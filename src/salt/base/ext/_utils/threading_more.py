@@ -1,9 +1,15 @@
+import collections
+import ctypes
+import ctypes.util
 import datetime
 import logging
+import math
+import random
 import re
 import signal
 import sys
 import threading
+import time
 
 from timeit import default_timer as timer
 
@@ -19,6 +25,42 @@ DEBUG = log.isEnabledFor(logging.DEBUG)
 
 on_exit = []
 
+CLOCK_MONOTONIC = 1
+
+
+class TimeSpec(ctypes.Structure):
+    _fields_ = [
+        ("tv_sec", ctypes.c_long),
+        ("tv_nsec", ctypes.c_long),
+    ]
+
+
+def _monotonic_clock():
+    """
+    Gets function returning seconds of the monotonic clock, which unlike the default timer is not affected when
+    the system clock is stepped. Falls back to the default timer if 'clock_gettime' is not available.
+    """
+
+    try:
+        clock_gettime = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True).clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(TimeSpec)]
+    except (OSError, AttributeError):
+        log.warning("Monotonic clock is not available - falling back to default timer")
+
+        return timer
+
+    def monotonic():
+        ts = TimeSpec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            raise OSError(ctypes.get_errno(), "Failed to get time of monotonic clock")
+
+        return ts.tv_sec + ts.tv_nsec * 0.000000001
+
+    return monotonic
+
+
+monotonic = _monotonic_clock()
+
 
 def append_signal_handler_for(sig, func):
     """
@@ -71,12 +113,151 @@ def intercept_exit_signal(func):
     return func
 
 
+class RunSchedule(object):
+    """
+    Keeps track of the deadlines of a periodically run target and records scheduling metrics.
+
+    Supported schedules when an interval is given:
+        - 'fixed_delay': Waits the interval after each run, so the period is the interval plus the run duration.
+        - 'fixed_rate':  Runs at fixed deadlines one interval apart regardless of the run duration.
+
+    Supported overrun policies of the 'fixed_rate' schedule when a run ends after the next deadline:
+        - 'skip':     Missed deadlines are skipped and the next run is scheduled at the following deadline.
+        - 'catch_up': Missed runs are performed immediately one after another until back on schedule. When more than
+                      'CATCH_UP_LIMIT' runs are missed they are skipped instead.
+
+    Deadlines are kept using the monotonic clock so they are not affected when the system clock is stepped.
+    """
+
+    SCHEDULES = ["fixed_delay", "fixed_rate"]
+    OVERRUN_POLICIES = ["skip", "catch_up"]
+
+    DURATION_SAMPLES = 100  # Number of recent run durations used to calculate percentiles
+    CATCH_UP_LIMIT = 10  # Maximum number of missed runs performed one after another
+
+    def __init__(self, name, interval=0, schedule="fixed_delay", overrun="skip", jitter=0):
+
+        if schedule not in self.SCHEDULES:
+            raise ValueError("Unsupported schedule '{:}' - allowed options are: {:}".format(schedule, ", ".join(self.SCHEDULES)))
+
+        if overrun not in self.OVERRUN_POLICIES:
+            raise ValueError("Unsupported overrun policy '{:}' - allowed options are: {:}".format(overrun, ", ".join(self.OVERRUN_POLICIES)))
+
+        self.name = name
+        self.interval = interval
+        self.schedule = schedule
+        self.overrun = overrun
+        self.jitter = jitter  # Random delay in seconds added to each wait without affecting deadlines
+
+        self._deadline = None  # Next scheduled run when using fixed rate
+        self._durations = collections.deque(maxlen=self.DURATION_SAMPLES)
+        self._metrics = {
+            "runs": 0,
+            "overruns": 0,
+            "skipped": 0,
+            "lateness": {
+                "acc": 0.0,
+                "max": 0.0,
+            },
+        }
+
+    def reset(self):
+        """
+        Starts over with a fresh deadline, e.g. after being paused.
+        """
+
+        self._deadline = None
+
+    def run(self, func, *args):
+        """
+        Runs the given function while measuring lateness and duration.
+        """
+
+        start = monotonic()
+
+        # Measure how late the run is compared to its deadline
+        if self._deadline != None:
+            lateness = max(start - self._deadline, 0.0)
+
+            self._metrics["lateness"]["acc"] += lateness
+            if lateness > self._metrics["lateness"]["max"]:
+                self._metrics["lateness"]["max"] = lateness
+        else:
+            self._deadline = start
+
+        try:
+            return func(*args)
+        finally:
+            self._metrics["runs"] += 1
+            self._durations.append(monotonic() - start)
+
+    def next_wait(self):
+        """
+        Calculates next deadline and returns the number of seconds to wait for it.
+        """
+
+        if self.schedule != "fixed_rate":
+            self._deadline = None
+
+            return self.interval + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+        # Next deadline is relative to the previous deadline and not to the end of the run in order to avoid drift
+        self._deadline += self.interval
+
+        now = monotonic()
+        if self._deadline - now > self.interval:
+
+            # Only possible if the clock has jumped backwards, e.g. when falling back to the default timer
+            log.warning("Worker '{:}' starts over with a fresh deadline because the clock has jumped backwards".format(self.name))
+
+            self._deadline = now + self.interval
+
+        elif now > self._deadline:
+            self._metrics["overruns"] += 1
+
+            missed = int((now - self._deadline) // self.interval) + 1 if self.interval > 0 else 0
+            if self.overrun == "skip" or missed > self.CATCH_UP_LIMIT:
+                self._deadline += missed * self.interval
+                self._metrics["skipped"] += missed
+
+                if DEBUG:
+                    log.debug("Worker '%s' skipped %d run(s) after overrun", self.name, missed)
+
+        return self._deadline - now + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def metrics(self):
+        """
+        Gets scheduling metrics.
+        """
+
+        ret = {
+            "schedule": self.schedule,
+            "runs": self._metrics["runs"],
+            "overruns": self._metrics["overruns"],
+            "skipped": self._metrics["skipped"],
+            "lateness": dict(self._metrics["lateness"]),
+            "duration": {},
+        }
+
+        ret["lateness"]["avg"] = ret["lateness"]["acc"] / ret["runs"] if ret["runs"] else 0.0
+
+        durations = sorted(self._durations)
+        if durations:
+            for percentile in [50, 90, 99]:
+                ret["duration"]["p{:d}".format(percentile)] = durations[min(len(durations) * percentile // 100, len(durations) - 1)]
+            ret["duration"]["max"] = durations[-1]
+
+        return ret
+
+
 class WorkerThread(threading.Thread):
     """
     Class to easily schedule and run worker threads.
+
+    See 'RunSchedule' for supported schedules and overrun policies.
     """
 
-    def __init__(self, name=None, target=None, context={}, loop=-1, delay=0, interval=0, auto_start=False, registry=None):
+    def __init__(self, name=None, target=None, context={}, loop=-1, delay=0, interval=0, schedule="fixed_delay", overrun="skip", jitter=0, auto_start=False, registry=None):
 
         if target == None:
             raise ValueError("Target function must be defined")
@@ -105,6 +286,8 @@ class WorkerThread(threading.Thread):
         self.terminate = False
         self.run_on_terminate = False
 
+        self._schedule = RunSchedule(self.name, interval=interval, schedule=schedule, overrun=overrun, jitter=jitter)
+
         if registry and not registry.add(self):
             raise ValueError("Worker thread '{:s}' already added to registry".format(name))
 
@@ -145,13 +328,15 @@ class WorkerThread(threading.Thread):
                 if self.loop > 0:
                     self.loop -= 1
 
-                self.target(self, self.context)
+                self._schedule.run(self.target, self, self.context)
 
                 if self.interval > 0:
                     self.context["last_run"] = datetime.datetime.utcnow().isoformat()
 
                     # Sleep until awakened or timeout reached
-                    self.wake_event.wait(self.interval)
+                    timeout = self._schedule.next_wait()
+                    if timeout > 0:
+                        self.wake_event.wait(timeout)
 
             self.context["state"] = "completed"
 
@@ -180,6 +365,13 @@ class WorkerThread(threading.Thread):
             else:
                 log.warn("Was unable to remove worker thread '%s' from registry", self.name)
 
+    def metrics(self):
+        """
+        Gets scheduling metrics of this worker thread.
+        """
+
+        return self._schedule.metrics()
+
     def pause(self):
         if not self.proceed_event.is_set():
             return
@@ -268,6 +460,9 @@ class WorkerThread(threading.Thread):
 
             log.info("Resumed worker thread '%s'", self.name)
 
+            # Start over with a fresh deadline
+            self._schedule.reset()
+
             # Perform initial delay if any
             self.__delay()
 
@@ -284,39 +479,63 @@ class ThreadRegistry(object):
     """
     Class to safely manage a collection of threads.
 
+    Threads are indexed by name so a name without wildcard is looked up directly. Names with wildcards '*' are
+    matched as regular expressions which are compiled once and cached.
+
     This class is thread safe.
     """
 
+    PATTERN_CACHE_SIZE = 100
+
     def __init__(self):
-        self._threads = set()
+        self._threads = {}  # Threads by name
+        self._patterns = {}  # Compiled wildcard patterns by name
         self._lock = threading.RLock()
 
     def add(self, thread):
         with self._lock:
-            if not self.find_all_by(thread.name):
-                self._threads.add(thread)
-                return True
+            if thread.name in self._threads:
+                return False
 
-            return False
+            self._threads[thread.name] = thread
+
+            return True
 
     def remove(self, thread):
         with self._lock:
-            if thread in self._threads:
-                self._threads.remove(thread)
+            if self._threads.get(thread.name) is thread:
+                del self._threads[thread.name]
                 return True
-                
+
             return False
 
     def has(self, thread):
         with self._lock:
-            return thread in self._threads
+            return self._threads.get(thread.name) is thread
 
     def find_all_by(self, name):
         with self._lock:
-            return [
-                t for t in self._threads \
-                    if re.match(name.replace("*", ".*"), t.name)
-            ]
+
+            # Direct lookup when no wildcard
+            if not "*" in name:
+                thread = self._threads.get(name)
+
+                return [thread] if thread else []
+
+            if name == "*":
+                return self._threads.values()
+
+            pattern = self._patterns.get(name)
+            if pattern == None:
+
+                # Keep cache bounded
+                if len(self._patterns) >= self.PATTERN_CACHE_SIZE:
+                    self._patterns.clear()
+
+                pattern = re.compile(name.replace("*", ".*"))
+                self._patterns[name] = pattern
+
+            return [t for n, t in self._threads.iteritems() if pattern.match(n)]
 
     def do_for_all_by(self, name, func, force_wildcard=False):
         with self._lock:
@@ -339,7 +558,7 @@ class ThreadRegistry(object):
         with self._lock:
             ret = []
 
-            for t in filter(filter_func, self._threads):
+            for t in filter(filter_func, self._threads.values()):
                 do_func(t)
 
                 ret.append(t)
@@ -347,6 +566,764 @@ class ThreadRegistry(object):
             return ret
 
 
+class DomainLock(object):
+    """
+    Reentrant lock guarding a named resource domain. Supports acquire with timeout and records contention statistics.
+
+    This class is thread safe.
+    """
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout  # Default acquire timeout in seconds
+
+        self._lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "acquired": 0,
+            "contended": 0,
+            "timeouts": 0,
+            "wait": {
+                "acc": 0.0,
+                "max": 0.0,
+            },
+        }
+
+    def __enter__(self):
+        if not self.acquire():
+            raise Exception("Timed out after {:} second(s) waiting for lock '{:}'".format(self.timeout, self.name))
+
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def acquire(self, timeout=-1):
+        """
+        Acquires lock within the given timeout. Default timeout of the lock is used if none is given and None means wait forever.
+
+        Returns True if acquired, otherwise False.
+        """
+
+        if timeout == -1:
+            timeout = self.timeout
+
+        # Fast path when uncontended
+        if self._lock.acquire(False):
+            with self._stats_lock:
+                self._stats["acquired"] += 1
+
+            return True
+
+        start = timer()
+
+        if timeout == None:
+            acquired = self._lock.acquire()
+        else:
+
+            # Poll with increasing delay because lock acquire does not support a timeout
+            acquired = False
+            delay = 0.0005
+            while True:
+                remaining = start + timeout - timer()
+                if remaining <= 0:
+                    break
+
+                time.sleep(min(delay, remaining))
+
+                acquired = self._lock.acquire(False)
+                if acquired:
+                    break
+
+                delay = min(delay * 2, 0.05)
+
+        wait = timer() - start
+        with self._stats_lock:
+            self._stats["contended"] += 1
+            self._stats["wait"]["acc"] += wait
+            if wait > self._stats["wait"]["max"]:
+                self._stats["wait"]["max"] = wait
+
+            if acquired:
+                self._stats["acquired"] += 1
+            else:
+                self._stats["timeouts"] += 1
+
+        if not acquired:
+            log.warning("Timed out after %f second(s) waiting for lock '%s'", wait, self.name)
+
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def stats(self):
+        with self._stats_lock:
+            ret = {
+                "acquired": self._stats["acquired"],
+                "contended": self._stats["contended"],
+                "timeouts": self._stats["timeouts"],
+                "wait": dict(self._stats["wait"]),
+            }
+
+        ret["wait"]["avg"] = ret["wait"]["acc"] / ret["contended"] if ret["contended"] else 0.0
+
+        return ret
+
+
+class BoundedExecutor(object):
+    """
+    Executes submitted functions asynchronously using a limited number of worker threads and a bounded queue.
+
+    Supported policies when the queue is full:
+        - 'drop_oldest': The oldest pending function is dropped.
+        - 'coalesce':    A pending function submitted with the same key is replaced, otherwise the oldest pending function is dropped.
+
+    This class is thread safe.
+    """
+
+    POLICIES = ["drop_oldest", "coalesce"]
+
+    def __init__(self, name, workers=1, queue_size=100, policy="drop_oldest"):
+
+        # Validate arguments
+        if workers < 1:
+            raise ValueError("Number of workers must be greater than zero")
+
+        if queue_size < 1:
+            raise ValueError("Queue size must be greater than zero")
+
+        if policy not in self.POLICIES:
+            raise ValueError("Unsupported policy '{:}' - allowed options are: {:}".format(policy, ", ".join(self.POLICIES)))
+
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.policy = policy
+
+        self._queue = collections.deque()
+        self._pending = {}  # Queued entries by key
+        self._threads = []
+        self._stopped = False
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {
+            "submitted": 0,
+            "executed": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "max_depth": 0,
+            "active": 0,
+            "latency": {  # Time spent in queue
+                "acc": 0.0,
+                "max": 0.0,
+            },
+            "duration": {
+                "acc": 0.0,
+                "max": 0.0,
+            },
+        }
+
+    def submit(self, func, args=(), kwargs={}, key=None):
+        """
+        Queues function for execution by a worker thread.
+        """
+
+        with self._cond:
+            if self._stopped:
+                raise Exception("Executor '{:}' is stopped".format(self.name))
+
+            self._stats["submitted"] += 1
+
+            # Replace pending entry with same key
+            if self.policy == "coalesce" and key != None and key in self._pending:
+                self._pending[key][1:4] = [func, args, kwargs]
+                self._stats["coalesced"] += 1
+
+                return
+
+            # Make room by dropping oldest when full
+            if len(self._queue) >= self.queue_size:
+                dropped = self._queue.popleft()
+                self._pending.pop(dropped[0], None)
+                self._stats["dropped"] += 1
+
+                log.warning("Queue of executor '%s' is full - dropped oldest pending function", self.name)
+
+            entry = [key, func, args, kwargs, timer()]
+            self._queue.append(entry)
+            if key != None and self.policy == "coalesce":
+                self._pending[key] = entry
+
+            if len(self._queue) > self._stats["max_depth"]:
+                self._stats["max_depth"] = len(self._queue)
+
+            # Start worker threads lazily
+            if len(self._threads) < self.workers and self._stats["active"] + len(self._queue) > len(self._threads):
+                thread = threading.Thread(target=self._work, name="{:}_{:d}".format(self.name, len(self._threads)))
+                thread.daemon = True
+                thread.start()
+
+                self._threads.append(thread)
+
+            self._cond.notify()
+
+    def stop(self):
+        """
+        Stops all worker threads after their current execution. Pending functions are discarded.
+        """
+
+        with self._cond:
+            self._stopped = True
+            self._queue.clear()
+            self._pending.clear()
+
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            ret = {
+                "workers": len(self._threads),
+                "depth": len(self._queue),
+                "latency": dict(self._stats["latency"]),
+                "duration": dict(self._stats["duration"]),
+            }
+            ret.update({k: v for k, v in self._stats.iteritems() if k not in ret})
+
+        ret["latency"]["avg"] = ret["latency"]["acc"] / ret["executed"] if ret["executed"] else 0.0
+        ret["duration"]["avg"] = ret["duration"]["acc"] / ret["executed"] if ret["executed"] else 0.0
+
+        return ret
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+
+                if self._stopped:
+                    return
+
+                key, func, args, kwargs, submitted = self._queue.popleft()
+                self._pending.pop(key, None)
+                self._stats["active"] += 1
+
+            start = timer()
+            failed = False
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                failed = True
+
+                log.exception("Error in executor '%s' while executing function", self.name)
+            finally:
+                duration = timer() - start
+
+                with self._cond:
+                    self._stats["active"] -= 1
+                    self._stats["executed"] += 1
+                    if failed:
+                        self._stats["errors"] += 1
+
+                    self._stats["latency"]["acc"] += start - submitted
+                    self._stats["latency"]["max"] = max(self._stats["latency"]["max"], start - submitted)
+                    self._stats["duration"]["acc"] += duration
+                    self._stats["duration"]["max"] = max(self._stats["duration"]["max"], duration)
+
+
+class TimerWheelScheduler(object):
+    """
+    Runs scheduled workers on a shared hashed timer wheel instead of a dedicated thread per worker.
+
+    A single timer thread advances the wheel one slot per tick and hands due workers over to a small pool of threads.
+    Workers sharing the same resource are never executed concurrently. Ticks are kept using the monotonic clock, and
+    when the timer thread falls more than one rotation behind all missed ticks are skipped at once.
+
+    This class is thread safe.
+    """
+
+    def __init__(self, name, workers=2, tick=0.05, slots=512):
+
+        # Validate arguments
+        if workers < 1:
+            raise ValueError("Number of workers must be greater than zero")
+
+        if tick <= 0:
+            raise ValueError("Tick must be greater than zero")
+
+        if slots < 1:
+            raise ValueError("Number of slots must be greater than zero")
+
+        self.name = name
+        self.workers = workers
+        self.tick = tick  # Resolution of the wheel in seconds
+
+        self._slots = [[] for _ in range(slots)]
+        self._cursor = 0  # Slot to be expired at next tick
+        self._next_tick = None
+        self._ready = collections.deque()
+        self._waiting = {}  # Ready entries by busy resource
+        self._busy = set()  # Resources currently being executed
+        self._threads = []
+        self._stopped = False
+        self._lock = threading.Lock()  # Guards the wheel
+        self._cond = threading.Condition(threading.Lock())  # Guards the ready queue and resources
+        self._stats = {
+            "scheduled": 0,
+            "executed": 0,
+            "cancelled": 0,
+            "deferred": 0,
+        }
+
+    def schedule(self, worker, delay=0):
+        """
+        Schedules worker to be executed after the given delay in seconds. Returns an entry that can be cancelled.
+        """
+
+        entry = TimerEntry(worker)
+
+        with self._lock:
+            if self._stopped:
+                raise Exception("Scheduler '{:}' is stopped".format(self.name))
+
+            self._stats["scheduled"] += 1
+
+            # Start threads lazily
+            if not self._threads:
+                self._start()
+
+            if delay > 0:
+
+                # Find slot and number of wheel rotations to wait before due
+                ticks = max(int(math.ceil((monotonic() + delay - self._next_tick) / self.tick)), 0)
+                entry.rounds, offset = divmod(ticks, len(self._slots))
+                self._slots[(self._cursor + offset) % len(self._slots)].append(entry)
+
+                return entry
+
+        self._dispatch(entry)
+
+        return entry
+
+    def cancel(self, entry):
+        """
+        Cancels a scheduled entry. Cancelled entries are discarded lazily when expired.
+        """
+
+        if entry and not entry.cancelled:
+            entry.cancelled = True
+
+            with self._lock:
+                self._stats["cancelled"] += 1
+
+    def stop(self):
+        """
+        Stops timer and pool threads after their current execution. Pending entries are discarded.
+        """
+
+        with self._lock:
+            self._stopped = True
+            for slot in self._slots:
+                del slot[:]
+
+        with self._cond:
+            self._ready.clear()
+            self._waiting.clear()
+
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._lock:
+            ret = dict(self._stats,
+                threads=len(self._threads),
+                pending=sum(len(s) for s in self._slots))
+
+        with self._cond:
+            ret["ready"] = len(self._ready) + sum(len(q) for q in self._waiting.itervalues())
+            ret["busy"] = sorted(self._busy)
+
+        return ret
+
+    def _start(self):
+        self._next_tick = monotonic() + self.tick
+
+        thread = threading.Thread(target=self._advance, name="{:}_timer".format(self.name))
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+        for idx in range(self.workers):
+            thread = threading.Thread(target=self._work, name="{:}_{:d}".format(self.name, idx))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _advance(self):
+        while True:
+            now = monotonic()
+            wait = self._next_tick - now
+            if wait > 0:
+                time.sleep(wait)
+
+            due = []
+            with self._lock:
+                if self._stopped:
+                    return
+
+                # Skip missed ticks at once instead of one by one when more than one rotation behind
+                behind = int(-wait // self.tick)
+                if behind > len(self._slots):
+                    log.warning("Scheduler '{:}' is skipping {:} tick(s) because it has fallen behind".format(self.name, behind))
+
+                    self._skip(behind, due)
+
+                # Expire current slot and keep entries due in later rotations
+                pending = []
+                for entry in self._slots[self._cursor]:
+                    if entry.cancelled:
+                        continue
+
+                    if entry.rounds > 0:
+                        entry.rounds -= 1
+                        pending.append(entry)
+                    else:
+                        due.append(entry)
+
+                self._slots[self._cursor] = pending
+                self._cursor = (self._cursor + 1) % len(self._slots)
+                self._next_tick += self.tick
+
+            for entry in due:
+                self._dispatch(entry)
+
+    def _skip(self, ticks, due):
+        """
+        Advances the wheel the given number of ticks and collects all entries due within them.
+        Entries stay in their slots and only the number of remaining rotations changes.
+        """
+
+        size = len(self._slots)
+        for idx, slot in enumerate(self._slots):
+            pending = []
+            for entry in slot:
+                if entry.cancelled:
+                    continue
+
+                remaining = entry.rounds * size + (idx - self._cursor) % size - ticks
+                if remaining < 0:
+                    due.append(entry)
+                else:
+                    entry.rounds = remaining // size
+                    pending.append(entry)
+
+            self._slots[idx] = pending
+
+        self._cursor = (self._cursor + ticks) % size
+        self._next_tick += ticks * self.tick
+
+    def _dispatch(self, entry):
+        with self._cond:
+            resource = entry.worker.resource
+
+            # Defer until resource is released
+            if resource in self._busy:
+                self._waiting.setdefault(resource, collections.deque()).append(entry)
+                self._stats["deferred"] += 1
+
+                return
+
+            self._busy.add(resource)
+            self._ready.append(entry)
+
+            self._cond.notify()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopped:
+                    self._cond.wait()
+
+                if self._stopped:
+                    return
+
+                entry = self._ready.popleft()
+
+            try:
+                if not entry.cancelled:
+                    entry.worker._execute()
+            except Exception:
+                log.exception("Error in scheduler '%s' while executing worker '%s'", self.name, entry.worker.name)
+            finally:
+                with self._cond:
+                    self._stats["executed"] += 1
+
+                    # Hand resource over to next waiting entry if any
+                    resource = entry.worker.resource
+                    waiting = self._waiting.get(resource)
+                    if waiting:
+                        self._ready.append(waiting.popleft())
+                        if not waiting:
+                            del self._waiting[resource]
+
+                        self._cond.notify()
+                    else:
+                        self._busy.discard(resource)
+
+
+class TimerEntry(object):
+    """
+    Scheduled execution of a worker on a timer wheel.
+    """
+
+    __slots__ = ("worker", "rounds", "cancelled")
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.rounds = 0
+        self.cancelled = False
+
+
+class ScheduledWorker(object):
+    """
+    Periodic worker executed by a shared 'TimerWheelScheduler' instead of its own thread.
+
+    Has the same interface and pause, resume and kill semantics as 'WorkerThread' so it can be managed by a 'ThreadRegistry'.
+    The interval is required because a worker running back-to-back would occupy a pool thread permanently.
+
+    Workers sharing the same resource are never executed concurrently. Default resource is the name of the worker.
+    """
+
+    def __init__(self, scheduler, name=None, target=None, context={}, loop=-1, delay=0, interval=0, schedule="fixed_delay", overrun="skip", jitter=0, resource=None, auto_start=False, registry=None):
+
+        if target == None:
+            raise ValueError("Target function must be defined")
+
+        if not interval > 0:
+            raise ValueError("Interval must be greater than zero for a scheduled worker")
+
+        # Generate name if none specified
+        if name == None:
+            name = "{:s}_{{id}}".format(target.__name__)
+
+        self.name = name.format(id=id(self))
+        self.scheduler = scheduler
+        self.target = target
+        self.context = context
+        self.loop = loop
+        self.delay = delay
+        self.interval = interval
+        self.resource = resource or self.name
+        self.auto_start = auto_start
+        self.registry = registry
+        self.terminate = False
+        self.run_on_terminate = False
+
+        self._schedule = RunSchedule(self.name, interval=interval, schedule=schedule, overrun=overrun, jitter=jitter)
+        self._lock = threading.RLock()
+        self._entry = None
+        self._started = False
+        self._alive = False
+        self._paused = False
+        self._running = False
+
+        if registry and not registry.add(self):
+            raise ValueError("Worker '{:s}' already added to registry".format(name))
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                raise RuntimeError("Worker '{:s}' can only be started once".format(self.name))
+
+            self._started = True
+            self._alive = True
+
+            if DEBUG:
+                log.debug("Starting scheduled worker '%s'...", self.name)
+
+            self.__schedule_delayed()
+
+    def is_alive(self):
+        return self._alive
+
+    def metrics(self):
+        """
+        Gets scheduling metrics of this worker.
+        """
+
+        return self._schedule.metrics()
+
+    def pause(self):
+        with self._lock:
+            if self._paused or self.terminate:
+                return
+
+            if DEBUG:
+                log.debug("Pausing scheduled worker '%s'...", self.name)
+
+            self._paused = True
+            self.scheduler.cancel(self._entry)
+
+            self.context["state"] = "paused"
+
+            log.info("Paused worker '%s'", self.name)
+
+    def start_or_resume(self):
+        """
+        Starts or resumes the ScheduledWorker instance
+        """
+
+        # Noop when we've raised the white flag
+        if self.terminate:
+            return
+
+        if not self._started:
+            self.start()
+        else:
+            self.resume()
+
+    def resume(self):
+        with self._lock:
+            if not self._paused or self.terminate:
+                return
+
+            self._paused = False
+
+            log.info("Resumed worker '%s'", self.name)
+
+            # Rescheduled when done if currently running
+            if not self._running:
+
+                # Start over with a fresh deadline
+                self._schedule.reset()
+
+                self.__schedule_delayed()
+
+    def kill(self, run=False):
+        with self._lock:
+            if self.terminate:
+                return
+
+            if DEBUG:
+                log.debug("Killing scheduled worker '%s'...", self.name)
+
+            # Set flag that decide whether to run one last time
+            self.run_on_terminate = run
+
+            # Raise the white flag
+            self.terminate = True
+
+            self.scheduler.cancel(self._entry)
+
+            # Terminated when done if currently running
+            if not self._running:
+                if run and self._started:
+                    self._entry = self.scheduler.schedule(self)
+                else:
+                    self.__terminated()
+
+    def _execute(self):
+        """
+        Called by the scheduler when due.
+        """
+
+        with self._lock:
+            if self.terminate:
+                self.__terminated()
+
+                return
+
+            if self._paused:
+                return
+
+            if self.loop == 0:
+                self.context["state"] = "completed"
+                self.terminate = True
+
+                self.__terminated()
+
+                return
+
+            if self.loop > 0:
+                self.loop -= 1
+
+            self._running = True
+
+            if not "first_run" in self.context:
+                self.context["first_run"] = datetime.datetime.utcnow().isoformat()
+            self.context["state"] = "running"
+
+        try:
+            self._schedule.run(self.target, self, self.context)
+        except Exception:
+            log.exception("Fatal exception in worker '%s'", self.name)
+
+            with self._lock:
+                self._running = False
+                self.context["state"] = "failed"
+                self.terminate = True
+
+                self.__terminated()
+
+            return
+
+        with self._lock:
+            self._running = False
+
+            if self.terminate:
+                self.__terminated()
+
+                return
+
+            self.context["last_run"] = datetime.datetime.utcnow().isoformat()
+
+            if self.loop == 0:
+                self.context["state"] = "completed"
+                self.terminate = True
+
+                self.__terminated()
+
+                return
+
+            if self._paused:
+                self.context["state"] = "paused"
+
+                return
+
+            self._entry = self.scheduler.schedule(self, self._schedule.next_wait())
+
+    def __schedule_delayed(self):
+        if self.delay and self.delay > 0.0:
+            log.info("Delayed startup/resume of %f second(s) of worker '%s'...", self.delay, self.name)
+
+            self.context["state"] = "pending"
+
+        self._entry = self.scheduler.schedule(self, self.delay or 0)
+
+    def __terminated(self):
+        if not self._alive:
+            return
+
+        if self.run_on_terminate:
+            self.run_on_terminate = False
+
+            log.info("Running worker '%s' one last time before being terminated", self.name)
+
+            try:
+                self.target(self, self.context)
+            except:
+                log.exception("Failed to run worker '%s' one last time before being terminated", self.name)
+
+        self._alive = False
+
+        log.info("Worker '%s' terminated", self.name)
+
+        if self.registry and self.registry.remove(self):
+            if DEBUG:
+                log.debug("Worker '%s' removed from registry", self.name)
+        else:
+            log.warn("Was unable to remove worker '%s' from registry", self.name)
+
+
 class TimedEvent(threading._Event):
     """
     Records exact timestamp of when a event was set.
@@ -0,0 +1,158 @@
+import can
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "salt", "base", "ext", "_utils"))
+
+import can_conn
+
+
+class TestCANFrameRingBuffer(unittest.TestCase):
+
+    def put(self, buffer, count, start=0):
+        for idx in range(start, start + count):
+            self.assertTrue(buffer.put(float(idx), idx, 0, 1, bytearray([idx & 0xFF])))
+
+    def test_fifo(self):
+        buffer = can_conn.CANFrameRingBuffer(capacity=4)
+
+        self.assertTrue(buffer.is_empty())
+        self.put(buffer, 3)
+        self.assertEqual(len(buffer), 3)
+
+        self.assertEqual([f.arbitration_id for f in buffer.drain(limit=2)], [0, 1])
+        self.assertEqual([f.arbitration_id for f in buffer.drain()], [2])
+        self.assertTrue(buffer.is_empty())
+        self.assertEqual(buffer.drain(), [])
+
+    def test_wrap_around(self):
+        buffer = can_conn.CANFrameRingBuffer(capacity=4)
+
+        self.put(buffer, 3)
+        buffer.drain(limit=3)
+        self.put(buffer, 3, start=3)
+
+        # Record 3 is at the end of the buffer and 4-5 are at the beginning
+        count, views = buffer.slices()
+        self.assertEqual(count, 3)
+        self.assertEqual(len(views), 2)
+        self.assertEqual(len(views[0]), buffer.record_size)
+        self.assertEqual(len(views[1]), 2 * buffer.record_size)
+
+        frames = [f for v in views for f in buffer.unpack(v)]
+        self.assertEqual([f.arbitration_id for f in frames], [3, 4, 5])
+        self.assertEqual([f.timestamp for f in frames], [3.0, 4.0, 5.0])
+
+        # Nothing is consumed until released
+        self.assertEqual(len(buffer), 3)
+        buffer.release(count)
+        self.assertTrue(buffer.is_empty())
+
+    def test_overflow(self):
+        buffer = can_conn.CANFrameRingBuffer(capacity=4)
+
+        self.put(buffer, 4)
+        self.assertTrue(buffer.is_full())
+        self.assertFalse(buffer.put(4.0, 4, 0, 0, b""))
+        self.assertFalse(buffer.put(5.0, 5, 0, 0, b""))
+
+        stats = buffer.stats()
+        self.assertEqual(stats["overflows"], 2)
+        self.assertEqual(stats["high_water"], 4)
+        self.assertEqual(stats["received"], 4)
+        self.assertEqual(stats["pending"], 4)
+
+        # Dropped frames are not in the buffer
+        self.assertEqual([f.arbitration_id for f in buffer.drain()], [0, 1, 2, 3])
+
+        # Recovers after being drained while high-water mark is kept
+        self.assertTrue(buffer.put(6.0, 6, 0, 0, b""))
+        self.assertEqual(buffer.stats()["overflows"], 2)
+        self.assertEqual(buffer.stats()["high_water"], 4)
+
+    def test_data_truncated_to_dlc(self):
+        buffer = can_conn.CANFrameRingBuffer(capacity=4)
+
+        buffer.put(0.0, 0x7E8, 0, 8, bytearray(range(1, 9)))
+        buffer.put(0.0, 0x7E8, 0, 3, bytearray([1, 2, 3]))
+        buffer.put(0.0, 0x7E8, 0, 0, b"")
+
+        self.assertEqual([f.data for f in buffer.drain()], [b"\x01\x02\x03\x04\x05\x06\x07\x08", b"\x01\x02\x03", b""])
+
+    def test_too_much_data_dropped(self):
+        buffer = can_conn.CANFrameRingBuffer(capacity=4)
+
+        self.assertFalse(buffer.put(0.0, 0x7E8, 0, 9, bytearray(range(9))))
+        self.assertTrue(buffer.is_empty())
+
+    def test_flags_round_trip(self):
+        messages = [
+            can.Message(timestamp=1.5, arbitration_id=0x7E8, is_extended_id=False, data=[1, 2, 3]),
+            can.Message(timestamp=2.5, arbitration_id=0x18DAF110, is_extended_id=True, data=[4]),
+            can.Message(timestamp=3.5, arbitration_id=0x7DF, is_extended_id=False, is_remote_frame=True, dlc=8),
+            can.Message(timestamp=4.5, arbitration_id=0x0, is_error_frame=True, data=[0] * 8),
+            can.Message(timestamp=5.5, arbitration_id=0x123, is_extended_id=False, is_fd=True, bitrate_switch=True, data=range(12)),
+            can.Message(timestamp=6.5, arbitration_id=0x1234567, is_extended_id=True, is_fd=True, error_state_indicator=True, data=range(64)),
+        ]
+
+        buffer = can_conn.CANFrameRingBuffer(capacity=8, fd=True)
+        for msg in messages:
+            buffer.on_message_received(msg)
+
+        frames = buffer.drain()
+        self.assertEqual(len(frames), len(messages))
+
+        for frame, msg in zip(frames, messages):
+            copy = frame.to_msg()
+
+            for attr in ["timestamp", "arbitration_id", "is_extended_id", "is_remote_frame", "is_error_frame", "is_fd", "bitrate_switch", "error_state_indicator", "dlc"]:
+                self.assertEqual(getattr(copy, attr), getattr(msg, attr), "{:} of {:}".format(attr, msg))
+
+            self.assertEqual(bytes(copy.data), b"" if msg.is_remote_frame else bytes(msg.data))
+
+    def test_wait_timeout(self):
+        buffer = can_conn.CANFrameRingBuffer(capacity=4)
+
+        start = time.time()
+        self.assertFalse(buffer.wait(timeout=0.05))
+        self.assertGreaterEqual(time.time() - start, 0.04)
+
+        self.put(buffer, 1)
+        self.assertTrue(buffer.wait(timeout=0))
+
+    def test_wait_wake_up(self):
+        buffer = can_conn.CANFrameRingBuffer(capacity=1024)
+        received = []
+
+        def consume():
+            while len(received) < 1000:
+                received.extend(buffer.drain(block=True, timeout=5))
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+
+        # Let the consumer wait before each batch of frames
+        for idx in range(0, 1000, 100):
+            time.sleep(0.005)
+            self.put(buffer, 100, start=idx)
+
+        consumer.join(5)
+
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual([f.arbitration_id for f in received], range(1000))
+
+    def test_next(self):
+        buffer = can_conn.CANFrameRingBuffer(capacity=4)
+
+        threading.Timer(0.05, lambda: self.put(buffer, 1)).start()
+
+        frame = buffer.next(timeout=5)
+        self.assertEqual(frame.arbitration_id, 0)
+        self.assertEqual(buffer.next(block=False), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
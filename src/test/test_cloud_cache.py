@@ -0,0 +1,349 @@
+import BaseHTTPServer
+import fnmatch
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "salt", "base", "ext", "_utils"))
+
+import cloud_cache
+
+
+class FakeRedis(object):
+    """
+    Minimal in-memory stand-in for the Redis list commands used by the cloud cache.
+    """
+
+    def __init__(self):
+        self.lists = {}
+
+    def _range(self, name, start, stop):
+        items = self.lists.get(name, [])
+        length = len(items)
+
+        start = max(start + length if start < 0 else start, 0)
+        stop = stop + length if stop < 0 else min(stop, length - 1)
+
+        return start, stop
+
+    def lpush(self, name, *values):
+        for value in values:
+            self.lists.setdefault(name, []).insert(0, value)
+
+        return len(self.lists[name])
+
+    def llen(self, name):
+        return len(self.lists.get(name, []))
+
+    def lrange(self, name, start, stop):
+        start, stop = self._range(name, start, stop)
+
+        return self.lists.get(name, [])[start:stop + 1]
+
+    def ltrim(self, name, start, stop):
+        start, stop = self._range(name, start, stop)
+        self.lists[name] = self.lists.get(name, [])[start:stop + 1]
+
+    def lset(self, name, index, value):
+        self.lists[name][index] = value
+
+    def lrem(self, name, count, value):
+        self.lists[name] = [v for v in self.lists.get(name, []) if v != value]
+
+    def keys(self, pattern="*"):
+        return [k for k, v in self.lists.items() if v and fnmatch.fnmatch(k, pattern)]
+
+    def pipeline(self, **kwargs):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls.append((name, args))
+
+            return self
+
+        return call
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.calls]
+
+
+class FakeEndpointHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Simulates a cloud endpoint behind a link with limited bandwidth.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["content-length"]))
+        self.server.bodies.append(body)
+
+        # Simulate transfer time of link
+        time.sleep(self.server.latency + float(len(body)) / self.server.bandwidth)
+
+        self.send_response(self.server.status)
+        self.send_header("content-length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAdaptiveUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), FakeEndpointHandler)
+        self.server.latency = 0.0
+        self.server.bandwidth = 10000000
+        self.server.status = 200
+        self.server.bodies = []
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.cache = cloud_cache.NextCloudCache().setup(
+            max_batch_size=100,
+            endpoint={
+                "url": "http://127.0.0.1:{:d}/".format(self.server.server_port),
+            },
+            adaptive={
+                "enabled": True,
+                "max_batch_size": 500,
+                "batch_size_step": 50,
+                "max_window": 4,
+                "max_delay": 0.1,
+                "delay_step": 0.05,
+                "max_rtt": 0.2,
+            })
+
+    def tearDown(self):
+        self.cache.close_session()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def upload(self, count, size=1000):
+        for _ in range(count):
+            self.cache._upload("x" * size)
+
+    def test_grows_on_good_link(self):
+        self.upload(5)
+
+        status = self.cache.controller.status()
+        self.assertEqual(status["batch_size"], 350)
+        self.assertEqual(status["window"], 4)
+        self.assertEqual(status["delay"], 0.0)
+        self.assertEqual(status["errors"], 0)
+        self.assertGreater(status["throughput"], 0)
+
+    def test_backs_off_on_high_latency(self):
+        self.upload(5)
+
+        # Link degrades so uploads exceed max round-trip time
+        self.server.bandwidth = 2000
+        self.upload(2)
+
+        status = self.cache.controller.status()
+        self.assertEqual(status["batch_size"], 87)
+        self.assertEqual(status["window"], 1)
+        self.assertGreater(status["delay"], 0.0)
+        self.assertEqual(status["decreases"], 2)
+
+    def test_backs_off_on_errors(self):
+        self.upload(2)
+
+        self.server.status = 500
+        self.assertRaises(cloud_cache.RequestException, self.upload, 1)
+
+        status = self.cache.controller.status()
+        self.assertEqual(status["batch_size"], 100)
+        self.assertEqual(status["window"], 1)
+        self.assertEqual(status["errors"], 1)
+        self.assertGreater(status["error_rate"], 0.0)
+
+    def test_recovers_after_back_off(self):
+        self.server.status = 500
+        self.assertRaises(cloud_cache.RequestException, self.upload, 1)
+        self.assertEqual(self.cache.controller.batch_size, 50)
+
+        self.server.status = 200
+        self.upload(3)
+
+        status = self.cache.controller.status()
+        self.assertEqual(status["batch_size"], 200)
+        self.assertEqual(status["window"], 4)
+        self.assertEqual(status["delay"], 0.0)
+
+
+class TestPayload(unittest.TestCase):
+
+    def entries(self, count):
+        return [cloud_cache.json_encoder.encode({"@ts": "2020-01-01T00:{:02d}:{:02d}.{:06d}".format(i // 3600 % 60, i // 60 % 60, i * 20000 % 1000000), "@t": ["obd.rpm", "obd.speed", "obd.coolant_temp"][i % 3], "value": i * 7919 % 8000}) for i in range(count)]
+
+    def assertNearTarget(self, algorithm, target_size):
+        builder = cloud_cache.PayloadBuilder(algorithm=algorithm, target_size=target_size)
+        for entry in self.entries(20000):
+            if not builder.append(entry):
+                break
+
+        payload = builder.close()
+
+        self.assertGreaterEqual(len(payload), target_size * 0.95)
+        self.assertLessEqual(len(payload), target_size * 1.05)
+
+    def test_target_size_gzip(self):
+        for target_size in [1000, 8000, 16000, 64000]:
+            self.assertNearTarget("gzip", target_size)
+
+    def test_target_size_deflate(self):
+        for target_size in [1000, 8000, 16000]:
+            self.assertNearTarget("deflate", target_size)
+
+    def test_uncompressed(self):
+        builder = cloud_cache.PayloadBuilder(target_size=1000)
+        for entry in self.entries(100):
+            if not builder.append(entry):
+                break
+
+        payload = builder.close()
+
+        self.assertEqual(len(json.loads(payload)), builder.count)
+        self.assertLess(builder.count, 100)
+
+
+class TestColumnarPayload(unittest.TestCase):
+
+    ENTRIES = [
+        {"@ts": "2020-01-01T00:00:00.980000", "@t": "acc.xyz", "x": 0.01, "y": -0.02, "z": 1.0},
+        {"@ts": "2020-01-01T00:00:00.015000", "@t": "obd.rpm", "value": 850},
+        {"@ts": "2020-01-01T00:00:01", "@t": "acc.xyz", "x": 0.02, "y": -0.01, "z": 0.99},
+        {"@ts": "2020-01-01T00:00:01.020000", "@t": "acc.xyz", "x": 0.03, "y": 0.0, "z": 1.01},
+        {"@ts": "2020-01-01T00:00:01.040000", "@t": "obd.rpm", "value": 870},
+        {"@ts": "2020-01-01T00:00:01.040000Z", "@t": "event.x", "tag": "a", "data": {"b": [1, 2]}},
+        {"@ts": "2020-01-01T00:00:01.050000", "@t": "acc.xyz", "x": 0.01},
+        {"value": None},
+    ]
+
+    def build(self, entries, **kwargs):
+        builder = cloud_cache.ColumnarPayloadBuilder(**kwargs)
+        for entry in entries:
+            builder.append(cloud_cache.json_encoder.encode(entry))
+
+        return builder.close()
+
+    def assertRoundTrip(self, **kwargs):
+        payload = self.build(self.ENTRIES, **kwargs)
+        entries = cloud_cache.decode_columnar_payload(payload, serializer=kwargs.get("serializer", "json"), compression=kwargs.get("algorithm", None))
+
+        key = lambda e: json.dumps(e, sort_keys=True)
+        self.assertEqual(sorted(entries, key=key), sorted(self.ENTRIES, key=key))
+
+    def test_round_trip(self):
+        self.assertRoundTrip()
+        self.assertRoundTrip(algorithm="gzip")
+
+    @unittest.skipUnless(cloud_cache.HAS_MSGPACK, "requires msgpack")
+    def test_round_trip_msgpack(self):
+        self.assertRoundTrip(serializer="msgpack")
+
+    def test_groups_and_deltas(self):
+        groups = json.loads(self.build(self.ENTRIES))["groups"]
+
+        self.assertEqual(len(groups), 5)
+        self.assertEqual(groups[0]["@t"], "acc.xyz")
+        self.assertEqual(groups[0]["@ts"], "2020-01-01T00:00:00.980000")
+        self.assertEqual(groups[0]["dt"], [20000, 20000])
+        self.assertEqual(groups[0]["keys"], ["x", "y", "z"])
+        self.assertEqual(groups[0]["cols"][2], [1.0, 0.99, 1.01])
+
+        # Timestamps not restorable from deltas are kept as is
+        self.assertEqual(groups[2]["ts"], ["2020-01-01T00:00:01.040000Z"])
+
+    def test_target_size(self):
+        entries = [dict(self.ENTRIES[0], x=i) for i in range(100)]
+
+        builder = cloud_cache.ColumnarPayloadBuilder(target_size=1000)
+        for entry in entries:
+            if not builder.append(cloud_cache.json_encoder.encode(entry)):
+                break
+
+        self.assertLess(builder.count, len(entries))
+        self.assertLessEqual(len(builder.close()), 1000)
+
+
+class TestBudgetEviction(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), FakeEndpointHandler)
+        self.server.latency = 0.0
+        self.server.bandwidth = 10000000
+        self.server.status = 200
+        self.server.bodies = []
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.cache = cloud_cache.NextCloudCache().setup(
+            max_batch_size=5,
+            upload_splay=0,
+            endpoint={
+                "url": "http://127.0.0.1:1/",  # Offline
+            },
+            budget={
+                "max_entries": 7,
+                "policy": "oldest",
+            },
+            persistence={
+                "threshold": 1000000,
+                "interval": 1000000,
+            })
+        self.cache.client = FakeRedis()
+
+        self.entries = [cloud_cache.json_encoder.encode({"@t": "obd.rpm", "value": i}) for i in range(10)]
+        for entry in self.entries:
+            self.cache.client.lpush(self.cache.PENDING_QUEUE, entry)
+
+    def tearDown(self):
+        self.cache.close_session()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_failed_upload_then_eviction(self):
+        queue = self.cache.PENDING_QUEUE
+
+        # Upload fails while offline and the batch is cached for next attempt
+        res = self.cache._upload_batch(queue)
+        self.assertIn("error", res)
+        self.assertIn(queue, self.cache.upload_cache)
+
+        # Budget evicts oldest entries meanwhile
+        res = self.cache.enforce_budget()
+        self.assertEqual(res["total"], 3)
+        self.assertNotIn(queue, self.cache.upload_cache)
+
+        # Back online
+        self.cache.options["endpoint"]["url"] = "http://127.0.0.1:{:d}/".format(self.server.server_port)
+        res = self.cache._upload_batch(queue)
+        self.assertEqual(res["count"], 5)
+
+        uploaded = json.loads(self.server.bodies[0])
+        self.assertEqual([e["value"] for e in uploaded], [3, 4, 5, 6, 7])
+
+        # Nothing that was not uploaded is removed
+        self.assertEqual(self.cache.client.lrange(queue, 0, -1), list(reversed(self.entries[8:])))
+
+
+if __name__ == '__main__':
+    unittest.main()
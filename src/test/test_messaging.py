@@ -0,0 +1,75 @@
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "salt", "base", "ext", "_utils"))
+
+import messaging
+
+
+class TestEventMatcherIndex(unittest.TestCase):
+
+    def index_of(self, *matchers):
+        index = messaging.EventMatcherIndex()
+        for tag, match_type in matchers:
+            index.add({"tag": tag, "match_type": match_type})
+
+        return index
+
+    def tags_of(self, index, tag):
+        return [m["tag"] for m, _ in index.match(tag)]
+
+    def test_match_types(self):
+        index = self.index_of(
+            ("vehicle/engine/running", "exact"),
+            ("vehicle/", "startswith"),
+            ("/running", "endswith"),
+            ("engine", "find"),
+            ("vehicle/*/running", "fnmatch"),
+            ("^vehicle/(engine|battery)/", "regex"))
+
+        self.assertEqual(self.tags_of(index, "vehicle/engine/running"), [
+            "vehicle/engine/running",
+            "vehicle/",
+            "/running",
+            "engine",
+            "vehicle/*/running",
+            "^vehicle/(engine|battery)/",
+        ])
+        self.assertEqual(self.tags_of(index, "vehicle/battery/low"), ["vehicle/", "^vehicle/(engine|battery)/"])
+        self.assertEqual(self.tags_of(index, "system/engine"), ["engine"])
+        self.assertEqual(self.tags_of(index, "system/power"), [])
+
+    def test_unsupported_match_type(self):
+        with self.assertRaises(ValueError):
+            self.index_of(("vehicle/", "glob"))
+
+    def test_regex_match_objects(self):
+        index = self.index_of(("^obd/(?P<name>\w+)$", "regex"), ("^(?P<name>\w+)/rpm$", "regex"))
+
+        matches = index.match("obd/rpm")
+
+        self.assertEqual([m.group("name") for _, m in matches], ["rpm", "obd"])
+
+    def test_regex_backreference(self):
+        index = self.index_of(("^(\w+)/\\1$", "regex"), ("^x/", "regex"))
+
+        self.assertEqual(self.tags_of(index, "a/a"), ["^(\w+)/\\1$"])
+        self.assertEqual(self.tags_of(index, "a/b"), [])
+
+    def test_regex_inline_flags(self):
+        index = self.index_of(("(?x) foo \d+", "regex"), ("a b", "regex"), ("(?i)^BAR", "regex"), ("^baz", "regex"))
+
+        self.assertEqual(self.tags_of(index, "a b"), ["a b"])
+        self.assertEqual(self.tags_of(index, "foo12"), ["(?x) foo \d+"])
+        self.assertEqual(self.tags_of(index, "bar"), ["(?i)^BAR"])
+        self.assertEqual(self.tags_of(index, "BAZ"), [])
+
+        # Results must be the same as testing each pattern one by one
+        for tag in ["a b", "ab", "foo 1", "foo1", "bar", "BAR", "baz", "BAZ"]:
+            self.assertEqual(self.tags_of(index, tag), [p for p in ["(?x) foo \d+", "a b", "(?i)^BAR", "^baz"] if re.search(p, tag)])
+
+
+if __name__ == "__main__":
+    unittest.main()
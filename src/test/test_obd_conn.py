@@ -0,0 +1,218 @@
+import os
+import sys
+import unittest
+
+import cantools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "salt", "base", "ext", "_utils"))
+
+import obd_conn
+
+
+DBC = """
+VERSION ""
+
+NS_ :
+
+BS_:
+
+BU_: ECU
+
+
+BO_ 2024 EngineData: 8 ECU
+ SG_ Rpm : 7|16@0+ (0.25,0) [0|16383.75] "rpm" ECU
+ SG_ Speed : 23|8@0+ (1,0) [0|255] "km/h" ECU
+ SG_ Coolant : 31|8@0+ (1,-40) [-40|215] "C" ECU
+ SG_ Gear : 39|4@0+ (1,0) [0|15] "" ECU
+ SG_ Torque : 47|12@0- (0.5,0) [-1024|1023] "Nm" ECU
+
+BO_ 1056 Body: 8 ECU
+ SG_ DoorFL : 0|1@1+ (1,0) [0|1] "" ECU
+ SG_ DoorFR : 1|1@1+ (1,0) [0|1] "" ECU
+ SG_ Lights : 2|2@1+ (1,0) [0|3] "" ECU
+ SG_ Odometer : 8|32@1+ (0.1,0) [0|429496729.5] "km" ECU
+ SG_ Accel : 40|16@1- (0.001,0) [-32.768|32.767] "g" ECU
+ SG_ Temp : 56|8@1- (1,0) [-128|127] "C" ECU
+
+BO_ 1280 Muxed: 8 ECU
+ SG_ Mux M : 0|8@1+ (1,0) [0|255] "" ECU
+ SG_ A m0 : 8|16@1+ (1,0) [0|65535] "" ECU
+ SG_ B m1 : 8|16@1- (2,1) [0|65535] "" ECU
+
+VAL_ 1056 Lights 0 "Off" 1 "Low" 2 "High" 3 "Auto" ;
+VAL_ 2024 Gear 0 "P" 1 "R" 2 "N" 3 "D" ;
+"""
+
+
+class Protocol(object):
+    """
+    Stand-in for an 11 bit CAN protocol.
+    """
+
+    HEADER_BITS = 11
+
+
+class Clock(object):
+    """
+    Controllable replacement of the timer used by the decoder.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def decode_each(can_db, values):
+    """
+    Decodes values one by one using 'decode_can_frame_for' and counts failures like 'CANFrameDecoder.decode_many'.
+    """
+
+    ret = []
+    fail_count = 0
+    for val in values:
+        try:
+            ret.extend(obd_conn.decode_can_frame_for(can_db, Protocol, val if isinstance(val, dict) else {"value": val}))
+        except Exception:
+            fail_count += 1
+
+    return ret, fail_count
+
+
+def sort_key(res):
+    return sorted(res.items())
+
+
+class TestCANFrameDecoder(unittest.TestCase):
+
+    def setUp(self):
+        self.can_db = cantools.database.load_string(DBC, database_format="dbc")
+
+    def assertDecodedSame(self, values):
+        expected, expected_fail_count = decode_each(self.can_db, values)
+        actual, fail_count = obd_conn.CANFrameDecoder(self.can_db, Protocol).decode_many(values)
+
+        self.assertEqual(sorted(actual, key=sort_key), sorted(expected, key=sort_key))
+        self.assertEqual(fail_count, expected_fail_count)
+
+        return actual
+
+    def test_big_endian(self):
+        res = self.assertDecodedSame(["7E8 12 34 56 78 9A BC DE F0", "7E8 00 00 00 00 00 00 00 00"])
+
+        self.assertEqual(len(res), 10)
+
+    def test_little_endian_signed(self):
+        res = self.assertDecodedSame(["420 FF FF FF FF FF FF FF FF", "420 05 10 27 00 00 18 FC 80"])
+
+        self.assertIn({"_type": "temp", "value": -1}, res)
+        self.assertIn({"_type": "temp", "value": -128}, res)
+
+    def test_choices(self):
+        res = self.assertDecodedSame(["420 0C 00 00 00 00 00 00 00", "7E8 00 00 00 00 30 00 00 00", "7E8 00 00 00 00 F0 00 00 00"])
+
+        self.assertIn({"_type": "lights", "value": "Auto"}, res)
+        self.assertIn({"_type": "gear", "value": "D"}, res)
+        self.assertIn({"_type": "gear", "value": 15}, res)
+
+    def test_multiplexed(self):
+        res = self.assertDecodedSame(["500 00 34 12 00 00 00 00 00", "500 01 FE FF 00 00 00 00 00"])
+
+        self.assertIn({"_type": "a", "value": 0x1234}, res)
+        self.assertIn({"_type": "b", "value": -3}, res)
+
+    def test_short_data(self):
+        self.assertDecodedSame(["420 01 02", "7E8 12 34 56", "500 01"])
+
+    def test_unknown_and_invalid(self):
+        res = self.assertDecodedSame(["123 00 11 22 33 44 55 66 77", "NO DATA", "?", "BUFFER FULL"])
+
+        self.assertEqual(res, [])
+
+    def test_result_dicts(self):
+        res = self.assertDecodedSame([{"_stamp": "2020-01-01T00:00:00", "value": "7E8 12 34 56 78 9A BC DE F0"}])
+
+        self.assertTrue(all(r["_stamp"] == "2020-01-01T00:00:00" for r in res))
+
+    def test_decode(self):
+        decoder = obd_conn.CANFrameDecoder(self.can_db, Protocol)
+
+        for value in ["7E8 12 34 56 78 9A BC DE F0", "420 05 10 27 00 00 18 FC 80", "500 01 FE FF 00 00 00 00 00", "NO DATA"]:
+            result = {"value": value}
+
+            self.assertEqual(sorted(decoder.decode(result), key=sort_key), sorted(obd_conn.decode_can_frame_for(self.can_db, Protocol, result), key=sort_key))
+
+
+class TestCANFrameDecoderSubscriptions(unittest.TestCase):
+
+    def setUp(self):
+        self.can_db = cantools.database.load_string(DBC, database_format="dbc")
+
+        self.timer = obd_conn.timer
+        obd_conn.timer = self.clock = Clock()
+
+    def tearDown(self):
+        obd_conn.timer = self.timer
+
+    def values_of(self, decoder, type, values):
+        res, fail_count = decoder.decode_many(values)
+
+        self.assertEqual(fail_count, 0)
+
+        return [r["value"] for r in res if r["_type"] == type]
+
+    def test_only_subscribed(self):
+        decoder = obd_conn.CANFrameDecoder(self.can_db, Protocol, subscriptions={"Speed": None, "a": {}})
+
+        res, _ = decoder.decode_many(["7E8 12 34 56 78 9A BC DE F0", "420 05 10 27 00 00 18 FC 80", "500 00 34 12 00 00 00 00 00"])
+
+        self.assertEqual(sorted(r["_type"] for r in res), ["a", "speed"])
+
+    def test_wildcard(self):
+        decoder = obd_conn.CANFrameDecoder(self.can_db, Protocol, subscriptions={"rpm": {"on_change": True}, "*": None})
+
+        res, _ = decoder.decode_many(["7E8 12 34 56 78 9A BC DE F0"])
+
+        self.assertEqual(len(res), 5)
+
+    def test_interval(self):
+        decoder = obd_conn.CANFrameDecoder(self.can_db, Protocol, subscriptions={"speed": {"interval": 1}})
+
+        self.assertEqual(self.values_of(decoder, "speed", ["7E8 00 00 01 00 00 00 00 00", "7E8 00 00 02 00 00 00 00 00"]), [1])
+
+        self.clock.now += 0.5
+        self.assertEqual(self.values_of(decoder, "speed", ["7E8 00 00 03 00 00 00 00 00"]), [])
+
+        self.clock.now += 0.5
+        self.assertEqual(self.values_of(decoder, "speed", ["7E8 00 00 04 00 00 00 00 00"]), [4])
+
+    def test_deadband(self):
+        decoder = obd_conn.CANFrameDecoder(self.can_db, Protocol, subscriptions={"rpm": {"deadband": 100}})
+
+        # Raw values scaled by 0.25
+        values = ["7E8 {:02X} {:02X} 00 00 00 00 00 00".format(raw >> 8, raw & 0xFF) for raw in [4000, 4200, 4400, 3600, 3700]]
+
+        self.assertEqual(self.values_of(decoder, "rpm", values), [1000.0, 1100.0, 900.0])
+
+    def test_deadband_multiplexed(self):
+        decoder = obd_conn.CANFrameDecoder(self.can_db, Protocol, subscriptions={"a": {"deadband": 10}})
+
+        values = ["500 00 {:02X} 00 00 00 00 00 00".format(raw) for raw in [0, 5, 10, 30]]
+
+        self.assertEqual(self.values_of(decoder, "a", values), [0, 10, 30])
+
+    def test_on_change(self):
+        decoder = obd_conn.CANFrameDecoder(self.can_db, Protocol, subscriptions={"lights": {"on_change": True}})
+
+        values = ["420 {:02X} 00 00 00 00 00 00 00".format(raw << 2) for raw in [1, 1, 2, 2, 1]]
+
+        self.assertEqual(self.values_of(decoder, "lights", values), ["Low", "High", "Low"])
+
+    def test_unsupported_setting(self):
+        with self.assertRaises(ValueError):
+            obd_conn.CANFrameDecoder(self.can_db, Protocol, subscriptions={"rpm": {"every": 1}})
+
+
+if __name__ == "__main__":
+    unittest.main()
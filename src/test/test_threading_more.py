@@ -0,0 +1,163 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "salt", "base", "ext", "_utils"))
+
+import threading_more
+
+
+class Clock(object):
+    """
+    Controllable replacement of the monotonic clock.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class OffsetClock(object):
+    """
+    Monotonic clock which can be moved forward to simulate a jump.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.offset = 0
+
+    def __call__(self):
+        return self.clock() + self.offset
+
+
+class Worker(object):
+    """
+    Minimal worker to be executed by a scheduler.
+    """
+
+    def __init__(self, name, event):
+        self.name = name
+        self.resource = name
+        self.event = event
+
+    def _execute(self):
+        self.event.set()
+
+
+class TestMonotonic(unittest.TestCase):
+
+    def test_increasing(self):
+        first = threading_more.monotonic()
+        second = threading_more.monotonic()
+
+        self.assertGreater(first, 0)
+        self.assertGreaterEqual(second, first)
+
+
+class TestRunSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.monotonic = threading_more.monotonic
+        threading_more.monotonic = self.clock = Clock()
+
+    def tearDown(self):
+        threading_more.monotonic = self.monotonic
+
+    def run_for(self, schedule, duration=0):
+        def func():
+            self.clock.now += duration
+
+        schedule.run(func)
+
+        return schedule.next_wait()
+
+    def test_fixed_rate(self):
+        schedule = threading_more.RunSchedule("test", interval=1, schedule="fixed_rate")
+
+        self.assertAlmostEqual(self.run_for(schedule, duration=0.25), 0.75)
+        self.clock.now += 0.75
+        self.assertAlmostEqual(self.run_for(schedule, duration=0.5), 0.5)
+
+    def test_skip(self):
+        schedule = threading_more.RunSchedule("test", interval=1, schedule="fixed_rate", overrun="skip")
+
+        self.assertAlmostEqual(self.run_for(schedule, duration=2.5), 0.5)
+        self.assertEqual(schedule.metrics()["skipped"], 2)
+
+    def test_catch_up(self):
+        schedule = threading_more.RunSchedule("test", interval=1, schedule="fixed_rate", overrun="catch_up")
+
+        self.assertAlmostEqual(self.run_for(schedule, duration=2.5), -1.5)
+        self.assertAlmostEqual(self.run_for(schedule), -0.5)
+        self.assertAlmostEqual(self.run_for(schedule), 0.5)
+        self.assertEqual(schedule.metrics()["skipped"], 0)
+
+    def test_catch_up_forward_jump(self):
+        schedule = threading_more.RunSchedule("test", interval=1, schedule="fixed_rate", overrun="catch_up")
+
+        self.run_for(schedule)
+        self.clock.now += 86400  # One day
+
+        # Missed runs are skipped instead of being performed one after another
+        wait = self.run_for(schedule)
+        self.assertGreaterEqual(wait, 0)
+        self.assertLessEqual(wait, 1)
+        self.assertEqual(schedule.metrics()["skipped"], 86399)
+
+    def test_backward_jump(self):
+        for overrun in ["skip", "catch_up"]:
+            schedule = threading_more.RunSchedule("test", interval=1, schedule="fixed_rate", overrun=overrun)
+
+            self.run_for(schedule)
+            self.clock.now -= 3600
+
+            # Does not wait for the length of the jump
+            self.assertAlmostEqual(self.run_for(schedule), 1)
+            self.clock.now += 1
+            self.assertAlmostEqual(self.run_for(schedule, duration=0.25), 0.75)
+
+    def test_fixed_delay(self):
+        schedule = threading_more.RunSchedule("test", interval=1, jitter=0)
+
+        self.assertEqual(self.run_for(schedule, duration=5), 1)
+
+
+class TestTimerWheelScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.monotonic = threading_more.monotonic
+        threading_more.monotonic = self.clock = OffsetClock(self.monotonic)
+
+        self.scheduler = threading_more.TimerWheelScheduler("test", tick=0.01, slots=16)
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+        threading_more.monotonic = self.monotonic
+
+    def test_schedule(self):
+        executed = threading.Event()
+        self.scheduler.schedule(Worker("worker", executed), delay=0.1)
+
+        self.assertFalse(executed.wait(0.05))
+        self.assertTrue(executed.wait(1))
+
+    def test_forward_jump(self):
+        early = threading.Event()
+        late = threading.Event()
+        self.scheduler.schedule(Worker("early", early), delay=10)
+        self.scheduler.schedule(Worker("late", late), delay=2 * 86400)
+
+        self.clock.offset += 86400  # One day
+
+        # Missed ticks are skipped at once instead of being replayed one by one
+        self.assertTrue(early.wait(1))
+        self.assertFalse(late.wait(0.1))
+        self.assertLess(abs(self.scheduler._next_tick - self.clock()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()